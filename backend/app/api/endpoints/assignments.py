@@ -4,6 +4,7 @@ from typing import List, Optional
 from app.db.session import get_db
 from app.models.models import Assignment
 from app.schemas.schemas import AssignmentCreate, AssignmentResponse
+from app.services.llm_telemetry import llm_usage_by_assignment_and_model
 
 router = APIRouter()
 
@@ -33,6 +34,16 @@ def list_assignments(
         query = query.filter(Assignment.section_id == section_id)
     return query.offset(skip).limit(limit).all()
 
+@router.get("/llm-usage")
+def get_llm_usage(db: Session = Depends(get_db)):
+    """Uso del LLM (tokens y tiempos) por tarea y modelo"""
+    return llm_usage_by_assignment_and_model(db)
+
+@router.get("/{assignment_id}/llm-usage")
+def get_assignment_llm_usage(assignment_id: int, db: Session = Depends(get_db)):
+    """Uso del LLM (tokens y tiempos) de una tarea, por modelo"""
+    return llm_usage_by_assignment_and_model(db, assignment_id)
+
 @router.get("/{assignment_id}", response_model=AssignmentResponse)
 def get_assignment(assignment_id: int, db: Session = Depends(get_db)):
     """Obtener una tarea por ID"""
@@ -1,16 +1,22 @@
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.db.session import get_db
-from app.models.models import Submission, Assignment
+from app.models.models import Submission, Assignment, TranscriptionJob
 from app.schemas.schemas import SubmissionResponse, SubmissionCreate
-from app.services.minio_service import minio_service
+from app.services.minio_service import minio_service, UploadTooLarge
 from app.services.evaluation_pipeline import EvaluationPipeline
+from app.services import transcription_queue
+from app.services.audio_derivative import create_derivative
 from datetime import datetime
 import os
 
 router = APIRouter()
 
+# Tamaño máximo del video (100MB)
+MAX_VIDEO_SIZE = 100 * 1024 * 1024
+
 from fastapi.responses import StreamingResponse
 import io
 
@@ -66,6 +72,7 @@ def get_video(
 
 @router.post("", response_model=SubmissionResponse)
 async def create_submission(
+    background_tasks: BackgroundTasks,
     assignment_id: int = Form(...),
     section_id: str = Form(...),
     group_number: int = Form(...),
@@ -95,15 +102,16 @@ async def create_submission(
     db.add(submission)
     db.flush()  # Obtener submission_id
     
-    # 2. Subir archivos a MinIO
+    # 2. Subir archivos a MinIO: en streaming desde el archivo temporal de
+    # UploadFile (partes de 10MB), en un threadpool para no bloquear el event loop
     try:
         # Subir proyecto (código ZIP)
         project_filename = f"{submission.submission_id}_{project_file.filename}"
-        project_content = await project_file.read()
         
-        project_path = minio_service.upload_submission(
+        project_path = await run_in_threadpool(
+            minio_service.upload_submission,
             submission.submission_id,
-            project_content,
+            project_file.file,
             project_filename,
             project_file.content_type or "application/zip"
         )
@@ -123,31 +131,36 @@ async def create_submission(
                     detail=f"Video debe ser MP4, WebM, AVI o MOV. Recibido: {file_ext}"
                 )
             
-            # Leer contenido del video
-            video_content = await video_file.read()
-            
-            # Validar tamaño (máximo 100MB)
-            max_size = 100 * 1024 * 1024  # 100MB
-            if len(video_content) > max_size:
+            # Validar tamaño (máximo 100MB): de entrada si el tamaño ya se
+            # conoce; si no, mientras se sube
+            if video_file.size is not None and video_file.size > MAX_VIDEO_SIZE:
                 raise HTTPException(
                     status_code=400,
-                    detail=f"El video debe ser menor a 100MB. Tamaño actual: {len(video_content) / 1024 / 1024:.2f}MB"
+                    detail=f"El video debe ser menor a 100MB. Tamaño actual: {video_file.size / 1024 / 1024:.2f}MB"
                 )
             
-            print(f"✅ Video válido: {len(video_content) / 1024 / 1024:.2f}MB")
-            
             # Crear nombre de archivo y path
             video_filename = f"{submission.submission_id}_video{file_ext.lower()}"
             video_object_path = f"submissions/{submission.submission_id}/{video_filename}"
             
             # Subir a MinIO
             print(f"📤 Uploading to MinIO: videos/{video_object_path}")
-            minio_service.upload_file(
-                file_data=video_content,
-                object_name=video_object_path,
-                bucket_name="videos",
-                content_type=video_file.content_type or "video/mp4"
-            )
+            try:
+                _, video_size = await run_in_threadpool(
+                    minio_service.upload_stream,
+                    video_file.file,
+                    video_object_path,
+                    "videos",
+                    video_file.content_type or "video/mp4",
+                    MAX_VIDEO_SIZE
+                )
+            except UploadTooLarge:
+                raise HTTPException(
+                    status_code=400,
+                    detail="El video debe ser menor a 100MB"
+                )
+            
+            print(f"✅ Video válido: {video_size / 1024 / 1024:.2f}MB")
             
             # Guardar path en BD (formato: bucket/path)
             submission.video_url = f"videos/{video_object_path}"
@@ -160,6 +173,8 @@ async def create_submission(
         print(f"✅ Submission created: ID={submission.submission_id}")
         if submission.video_url:
             print(f"   With video: {submission.video_url}")
+            # Después de responder: derivado de audio y encolado de la transcripción
+            background_tasks.add_task(prepare_video_background, submission.submission_id)
         
         return submission
         
@@ -173,6 +188,36 @@ async def create_submission(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error uploading files: {str(e)}")
 
+def prepare_video_background(submission_id: int):
+    """
+    Extrae el derivado de audio (Opus 16 kHz mono) del video recién subido y
+    luego encola la transcripción, para que el worker lea el derivado y no
+    el video completo.
+    """
+    from app.db.session import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        submission = db.query(Submission).filter(
+            Submission.submission_id == submission_id
+        ).first()
+        if not submission or not submission.video_url:
+            return
+        
+        bucket, object_name = submission.video_url.split('/', 1)
+        create_derivative(bucket, object_name)
+        
+        # El worker transcribe mientras la entrega espera su evaluación
+        if transcription_queue.TRANSCRIPTION_QUEUE:
+            transcription_queue.enqueue(
+                db, submission, transcription_queue.wants_word_timestamps(submission)
+            )
+    except Exception as e:
+        # La evaluación vuelve a encolar si hace falta
+        print(f"⚠️ Video post-processing failed for submission {submission_id}: {e}")
+    finally:
+        db.close()
+
 async def run_evaluation_background(submission_id: int):
     """Run evaluation in background"""
     from app.db.session import SessionLocal
@@ -204,6 +249,8 @@ async def run_evaluation_background(submission_id: int):
         }
         
         pipeline = EvaluationPipeline(db)
+        # Una sola evaluación: sin batch() (warm-up + release); las llamadas
+        # ya envían keep_alive y el modelo sigue residente entre evaluaciones
         result = await pipeline.evaluate_submission_complete(
             submission_id,
             assignment.requirements or "No specific requirements",
@@ -239,6 +286,18 @@ def get_submission(submission_id: int, db: Session = Depends(get_db)):
     
     return submission
 
+@router.get("/{submission_id}/transcription")
+def get_transcription_status(submission_id: int, db: Session = Depends(get_db)):
+    """Estado y avance del último trabajo de transcripción de la entrega"""
+    job = db.query(TranscriptionJob).filter(
+        TranscriptionJob.submission_id == submission_id
+    ).order_by(TranscriptionJob.job_id.desc()).first()
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="No transcription job for this submission")
+    
+    return transcription_queue.job_status(job)
+
 @router.post("/{submission_id}/evaluate")
 async def evaluate_submission(
     submission_id: int,
@@ -316,6 +375,8 @@ async def evaluate_submission(
     }
     
     pipeline = EvaluationPipeline(db)
+    # Una sola evaluación: sin batch() (warm-up + release); las llamadas
+    # ya envían keep_alive y el modelo sigue residente entre evaluaciones
     result = await pipeline.evaluate_submission_complete(
         submission_id,
         assignment.requirements or "No specific requirements",
@@ -30,6 +30,10 @@ class Settings(BaseSettings):
     
     # Whisper
     WHISPER_MODEL: str = "base"
+    # Motor: "openai" (openai-whisper, FP32) o "faster-whisper" (CTranslate2)
+    WHISPER_BACKEND: str = "openai"
+    # Solo faster-whisper: int8, int8_float32, float32...
+    WHISPER_COMPUTE_TYPE: str = "int8"
     
     # CORS
     CORS_ORIGINS: list = [
@@ -221,3 +221,30 @@ class SimpleLog(Base):
     
     # Relationships
     submission = relationship("Submission", back_populates="simple_logs")
+
+
+class TranscriptionJob(Base):
+    __tablename__ = "transcription_jobs"
+    
+    job_id = Column(Integer, primary_key=True, autoincrement=True)
+    submission_id = Column(BigInteger, ForeignKey("submissions.submission_id"), nullable=False, index=True)
+    video_url = Column(String(500), nullable=False)
+    language = Column(String(10), default="es")
+    word_timestamps = Column(Boolean, default=False)
+    # pending | running | completed | failed
+    status = Column(String(50), default="pending", index=True)
+    attempts = Column(Integer, default=0)
+    worker_id = Column(String(100))
+    # Avance por segmento (fracción del audio transcrita)
+    progress = Column(Float, default=0)
+    segments_done = Column(Integer, default=0)
+    model = Column(String(100))
+    result = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    
+    # Relationships
+    submission = relationship("Submission")
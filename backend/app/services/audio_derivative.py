@@ -0,0 +1,152 @@
+"""
+Derivado de audio de los videos subidos: Opus mono 16 kHz en Ogg, junto al
+video en MinIO (<objeto>.audio.ogg). Se genera después de la subida; la
+transcripción lo prefiere al video (unos pocos MB frente a ~100 MB). El
+video queda para reproducirlo.
+
+El derivado guarda el ETag del video de origen en sus metadatos: si el video
+se reemplaza, el derivado viejo se ignora.
+
+Ubicación: backend/app/services/audio_derivative.py
+"""
+
+import os
+import subprocess
+import threading
+from typing import Optional
+
+from minio.error import S3Error
+
+from app.services.minio_service import minio_service
+
+AUDIO_DERIVATIVE = os.getenv("AUDIO_DERIVATIVE", "true").lower() == "true"
+# Opus a 24 kbps: de sobra para voz (y para Whisper, que trabaja a 16 kHz)
+AUDIO_DERIVATIVE_BITRATE = os.getenv("AUDIO_DERIVATIVE_BITRATE", "24k")
+SUFFIX = ".audio.ogg"
+SOURCE_ETAG_KEY = "source-etag"
+STREAM_CHUNK_SIZE = 1024 * 1024
+PART_SIZE = 10 * 1024 * 1024
+
+
+def derivative_name(object_name: str) -> str:
+    return f"{object_name}{SUFFIX}"
+
+
+def _ffmpeg_command(source: str) -> list:
+    entrada = [] if source == "pipe:0" else ["-nostdin"]
+    return [
+        "ffmpeg", *entrada,
+        "-loglevel", "error",
+        "-i", source,
+        "-vn", "-ac", "1", "-ar", "16000",
+        "-c:a", "libopus", "-b:a", AUDIO_DERIVATIVE_BITRATE, "-application", "voip",
+        "-f", "ogg", "pipe:1"
+    ]
+
+
+def _encode_to_minio(command: list, bucket: str, target: str, source_etag: str, response=None) -> int:
+    """
+    Ejecuta ffmpeg y sube su salida a MinIO a medida que se produce
+    (multipart, tamaño desconocido). Con una respuesta de MinIO, un hilo
+    alimenta stdin con el video por trozos.
+
+    Returns:
+        Bytes del derivado
+    """
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE if response is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+    def feed():
+        try:
+            for chunk in response.stream(STREAM_CHUNK_SIZE):
+                process.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+    writer = None
+    if response is not None:
+        writer = threading.Thread(target=feed, daemon=True)
+        writer.start()
+
+    try:
+        minio_service.client.put_object(
+            bucket,
+            target,
+            process.stdout,
+            length=-1,
+            part_size=PART_SIZE,
+            content_type="audio/ogg",
+            metadata={SOURCE_ETAG_KEY: source_etag}
+        )
+    finally:
+        process.stdout.close()
+        process.wait()
+        if writer:
+            writer.join()
+        stderr_reader.join()
+
+    if process.returncode != 0:
+        # Lo subido está incompleto
+        minio_service.delete_file(target, bucket)
+        raise RuntimeError(f"ffmpeg failed: {b''.join(stderr_chunks).decode(errors='ignore').strip()[:500]}")
+    return minio_service.client.stat_object(bucket, target).size
+
+
+def create_derivative(bucket: str, object_name: str) -> Optional[str]:
+    """
+    Genera el derivado de audio de un video (tarea en segundo plano tras la
+    subida). Los errores se registran y no se propagan: sin derivado, la
+    transcripción lee el video.
+    """
+    if not AUDIO_DERIVATIVE:
+        return None
+    target = derivative_name(object_name)
+    try:
+        stat = minio_service.client.stat_object(bucket, object_name)
+        print(f"🎧 Creating audio derivative: {bucket}/{target}")
+        response = minio_service.client.get_object(bucket, object_name)
+        try:
+            size = _encode_to_minio(_ffmpeg_command("pipe:0"), bucket, target, stat.etag, response)
+        except RuntimeError as e:
+            # MP4 con el índice 'moov' al final: ffmpeg necesita acceso aleatorio
+            print(f"⚠️ Piped transcode failed ({e}), retrying with presigned URL")
+            size = _encode_to_minio(
+                _ffmpeg_command(minio_service.get_file_url(object_name, bucket)), bucket, target, stat.etag
+            )
+        finally:
+            response.close()
+            response.release_conn()
+        print(f"✅ Audio derivative ready: {size / 1024 / 1024:.2f} MB "
+              f"(video: {stat.size / 1024 / 1024:.2f} MB)")
+        return target
+    except Exception as e:
+        print(f"⚠️ Could not create audio derivative for {bucket}/{object_name}: {e}")
+        return None
+
+
+def find_derivative(bucket: str, object_name: str, source_etag: Optional[str] = None) -> Optional[str]:
+    """Nombre del derivado vigente del video, o None si no existe o es de otro video"""
+    if not AUDIO_DERIVATIVE:
+        return None
+    target = derivative_name(object_name)
+    try:
+        stat = minio_service.client.stat_object(bucket, target)
+        if source_etag is None:
+            source_etag = minio_service.client.stat_object(bucket, object_name).etag
+    except S3Error:
+        return None
+    # Metadatos de usuario: MinIO los devuelve con el prefijo x-amz-meta-
+    origen = stat.metadata.get(f"x-amz-meta-{SOURCE_ETAG_KEY}") if stat.metadata else None
+    return target if origen == source_etag else None
@@ -0,0 +1,295 @@
+"""
+Diarización en CPU para el análisis de participación.
+Sobre el PCM ya decodificado (16 kHz mono): ventanas de voz (VAD por
+energía), un embedding compacto por ventana (media y desviación del log-mel,
+calculado por lotes y suavizado con sus vecinas), clustering aglomerativo
+vectorizado (Ward) acotado por el tamaño esperado del grupo, y tiempo de
+habla por cluster.
+
+El número de ventanas se limita para no pasar de DIARIZATION_CPU_PER_MINUTE
+segundos de CPU por minuto de audio.
+
+Ubicación: backend/app/services/diarization.py
+"""
+
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.parallel_transcription import SAMPLE_RATE, detectar_voz
+
+DIARIZATION = os.getenv("DIARIZATION", "true").lower() == "true"
+# Tope de hablantes si no se conoce el tamaño del grupo
+DIARIZATION_MAX_SPEAKERS = int(os.getenv("DIARIZATION_MAX_SPEAKERS", "6"))
+# Distancia coseno entre centroides a partir de la cual no se unen clusters
+# (por debajo del tope de hablantes)
+DIARIZATION_THRESHOLD = float(os.getenv("DIARIZATION_THRESHOLD", "0.6"))
+# Presupuesto de CPU: segundos por minuto de audio
+DIARIZATION_CPU_PER_MINUTE = float(os.getenv("DIARIZATION_CPU_PER_MINUTE", "0.5"))
+# Clusters con menos de esta fracción del habla se absorben en el más cercano
+DIARIZATION_MIN_SHARE = float(os.getenv("DIARIZATION_MIN_SHARE", "0.05"))
+WINDOW_SECONDS = 1.5
+HOP_SECONDS = 0.75
+# Ventanas vecinas (de la misma región de voz) promediadas a cada lado
+SMOOTH_WINDOWS = 2
+
+# Log-mel: frames de 25 ms cada 10 ms, 40 bandas
+N_FFT = 400
+FRAME_HOP = 160
+N_MELS = 40
+BATCH_WINDOWS = 64
+
+# Costo estimado en CPU (s): por ventana (embedding) y del clustering (~n^3);
+# medidos con benchmarks/diarization_benchmark.py
+COST_PER_WINDOW = 1e-3
+COST_CLUSTER = 5e-10
+# La matriz de distancias es n x n float64: 3000 ventanas ~ 72 MB
+MAX_WINDOWS = 3000
+
+
+def _mel_filterbank(sr: int = SAMPLE_RATE, n_fft: int = N_FFT, n_mels: int = N_MELS) -> np.ndarray:
+    """Banco de filtros triangulares en escala mel: (n_fft // 2 + 1, n_mels)"""
+    def hz_a_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_a_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    puntos = mel_a_hz(np.linspace(hz_a_mel(60.0), hz_a_mel(sr / 2), n_mels + 2))
+    freqs = np.linspace(0, sr / 2, n_fft // 2 + 1)
+    bajo, centro, alto = puntos[:-2, None], puntos[1:-1, None], puntos[2:, None]
+    subida = (freqs[None, :] - bajo) / (centro - bajo)
+    bajada = (alto - freqs[None, :]) / (alto - centro)
+    return np.maximum(0.0, np.minimum(subida, bajada)).T.astype(np.float32)
+
+
+_MEL = _mel_filterbank()
+_HANN = np.hanning(N_FFT).astype(np.float32)
+
+
+def ventanas_de_voz(
+    regiones: List[Tuple[float, float]],
+    max_windows: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ventanas de WINDOW_SECONDS dentro de las regiones de voz. Si pasan de
+    max_windows se submuestrean uniformemente (mayor paso, misma cobertura).
+
+    Returns:
+        (inicios en segundos, índice de la región de cada ventana)
+    """
+    inicios, region_ids = [], []
+    for r, (inicio, fin) in enumerate(regiones):
+        ultimo = max(inicio, fin - WINDOW_SECONDS)
+        pos = np.arange(inicio, ultimo + 1e-6, HOP_SECONDS)
+        inicios.append(pos)
+        region_ids.append(np.full(len(pos), r, dtype=np.int32))
+    if not inicios:
+        return np.zeros(0), np.zeros(0, dtype=np.int32)
+
+    inicios = np.concatenate(inicios)
+    region_ids = np.concatenate(region_ids)
+    if max_windows and len(inicios) > max_windows:
+        elegidas = np.linspace(0, len(inicios) - 1, max_windows).round().astype(np.int64)
+        inicios, region_ids = inicios[elegidas], region_ids[elegidas]
+    return inicios, region_ids
+
+
+def embeddings(audio: np.ndarray, inicios: np.ndarray, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Media y desviación del log-mel de cada ventana, por lotes: todas las
+    ventanas de un lote se enmarcan con un único índice y se pasan por una
+    sola rfft. Devuelve (n_ventanas, 2 * N_MELS) estandarizados por
+    grabación.
+    """
+    largo = int(WINDOW_SECONDS * sr)
+    n_frames = 1 + (largo - N_FFT) // FRAME_HOP
+    # Índices de muestra de cada frame dentro de una ventana: (n_frames, N_FFT)
+    desplazamientos = (np.arange(n_frames) * FRAME_HOP)[:, None] + np.arange(N_FFT)[None, :]
+    relleno = np.concatenate([audio, np.zeros(largo, dtype=audio.dtype)])
+
+    salida = np.empty((len(inicios), 2 * N_MELS), dtype=np.float32)
+    for b in range(0, len(inicios), BATCH_WINDOWS):
+        base = (inicios[b:b + BATCH_WINDOWS] * sr).astype(np.int64)
+        frames = relleno[base[:, None, None] + desplazamientos[None, :, :]] * _HANN
+        potencia = np.abs(np.fft.rfft(frames, axis=-1)) ** 2
+        log_mel = np.log(potencia.astype(np.float32) @ _MEL + 1e-6)
+        salida[b:b + len(base), :N_MELS] = log_mel.mean(axis=1)
+        salida[b:b + len(base), N_MELS:] = log_mel.std(axis=1)
+
+    # Estandarización por grabación: quita el canal/micrófono común a todos
+    # y evita que unas pocas bandas dominen la distancia
+    salida -= salida.mean(axis=0, keepdims=True)
+    salida /= salida.std(axis=0, keepdims=True) + 1e-8
+    return salida
+
+
+def suavizar(emb: np.ndarray, region_ids: np.ndarray, vecinas: int = SMOOTH_WINDOWS) -> np.ndarray:
+    """
+    Promedio móvil de cada embedding con sus vecinas de la misma región de
+    voz (un turno dura varios segundos; 1.5 s aislados son ruidosos).
+    Suma acumulada: O(n) sin bucles. Devuelve vectores L2-normalizados.
+    """
+    n = len(emb)
+    acumulada = np.vstack([np.zeros((1, emb.shape[1]), dtype=np.float64), np.cumsum(emb, axis=0)])
+    idx = np.arange(n)
+    # region_ids está ordenado: límites de la región de cada ventana
+    desde = np.maximum(idx - vecinas, np.searchsorted(region_ids, region_ids, side='left'))
+    hasta = np.minimum(idx + vecinas + 1, np.searchsorted(region_ids, region_ids, side='right'))
+    media = (acumulada[hasta] - acumulada[desde]) / (hasta - desde)[:, None]
+    return (media / (np.linalg.norm(media, axis=1, keepdims=True) + 1e-8)).astype(np.float32)
+
+
+def agrupar(
+    emb: np.ndarray,
+    max_clusters: int,
+    threshold: float = DIARIZATION_THRESHOLD
+) -> np.ndarray:
+    """
+    Clustering aglomerativo de Ward sobre la matriz completa de distancias
+    (euclídea al cuadrado entre embeddings L2-normalizados): cada paso es un
+    argmin y una actualización de Lance-Williams vectorizados. Une mientras
+    haya más de max_clusters; por debajo del tope, solo si los centroides
+    del par están a distancia coseno menor que threshold.
+
+    Returns:
+        Etiquetas 0..k-1 por ventana
+    """
+    n = len(emb)
+    if n <= 1:
+        return np.zeros(n, dtype=np.int32)
+
+    x = emb.astype(np.float64)
+    cuadrados = (x * x).sum(axis=1)
+    dist = np.maximum(cuadrados[:, None] + cuadrados[None, :] - 2 * x @ x.T, 0.0)
+    np.fill_diagonal(dist, np.inf)
+    tamanos = np.ones(n)
+    sumas = x.copy()
+    etiquetas = np.arange(n)
+    activos = n
+
+    while activos > 1:
+        i, j = divmod(int(np.argmin(dist)), n)
+        if activos <= max_clusters:
+            ci = sumas[i] / np.linalg.norm(sumas[i])
+            cj = sumas[j] / np.linalg.norm(sumas[j])
+            if 1.0 - ci @ cj >= threshold:
+                break
+        # Ward (Lance-Williams) hacia todos los clusters a la vez
+        total = tamanos[i] + tamanos[j] + tamanos
+        fila = ((tamanos[i] + tamanos) * dist[i] + (tamanos[j] + tamanos) * dist[j] - tamanos * dist[i, j]) / total
+        dist[i, :] = fila
+        dist[:, i] = fila
+        dist[i, i] = np.inf
+        dist[j, :] = np.inf
+        dist[:, j] = np.inf
+        tamanos[i] += tamanos[j]
+        sumas[i] += sumas[j]
+        etiquetas[etiquetas == j] = i
+        activos -= 1
+
+    return np.unique(etiquetas, return_inverse=True)[1].astype(np.int32)
+
+
+def absorber_menores(emb: np.ndarray, etiquetas: np.ndarray, tiempos: np.ndarray, min_share: float) -> np.ndarray:
+    """Reasigna las ventanas de clusters con poco habla al centroide grande más cercano"""
+    habla = np.bincount(etiquetas, weights=tiempos)
+    grandes = np.flatnonzero(habla >= min_share * habla.sum())
+    if len(grandes) == 0 or len(grandes) == len(habla):
+        return etiquetas
+    centroides = np.stack([emb[etiquetas == c].mean(axis=0) for c in grandes])
+    menores = ~np.isin(etiquetas, grandes)
+    etiquetas = etiquetas.copy()
+    etiquetas[menores] = grandes[np.argmax(emb[menores] @ centroides.T, axis=1)]
+    return np.unique(etiquetas, return_inverse=True)[1].astype(np.int32)
+
+
+def max_ventanas(duracion: float, cpu_per_minute: float = DIARIZATION_CPU_PER_MINUTE) -> int:
+    """Mayor número de ventanas cuyo costo estimado cabe en el presupuesto"""
+    presupuesto = cpu_per_minute * max(duracion, 1.0) / 60.0
+    n = min(MAX_WINDOWS, int(presupuesto / COST_PER_WINDOW))
+    # El clustering es cúbico: bajar n hasta que el total quepa
+    while n > 2 and n * COST_PER_WINDOW + n ** 3 * COST_CLUSTER > presupuesto:
+        n = int(n * 0.9)
+    return max(2, n)
+
+
+def etiquetar_segmentos(segments: List[Dict], centros: np.ndarray, hablantes: np.ndarray):
+    """Hablante de cada segmento: mayoría de las ventanas que caen en él (o la más cercana)"""
+    desde = np.searchsorted(centros, [s['start'] for s in segments], side='left')
+    hasta = np.searchsorted(centros, [s['end'] for s in segments], side='right')
+    for segment, a, b in zip(segments, desde, hasta):
+        if b > a:
+            segment['speaker'] = int(np.bincount(hablantes[a:b]).argmax())
+        else:
+            medio = (segment['start'] + segment['end']) / 2
+            segment['speaker'] = int(hablantes[int(np.argmin(np.abs(centros - medio)))])
+
+
+def diarize(
+    audio: np.ndarray,
+    max_speakers: Optional[int] = None,
+    segments: Optional[List[Dict]] = None,
+    cpu_per_minute: Optional[float] = None,
+    sr: int = SAMPLE_RATE
+) -> Dict:
+    """
+    Args:
+        audio: PCM float32 mono 16 kHz
+        max_speakers: Tamaño esperado del grupo (tope de clusters)
+        segments: Segmentos de la transcripción; se etiquetan con 'speaker'
+        cpu_per_minute: Presupuesto (por defecto DIARIZATION_CPU_PER_MINUTE)
+
+    Returns:
+        num_speakers, speakers [{speaker_id, time}], speech_seconds,
+        windows, cpu_seconds
+    """
+    cpu_inicio = time.process_time()
+    duracion = len(audio) / sr
+    max_speakers = max_speakers or DIARIZATION_MAX_SPEAKERS
+
+    regiones = detectar_voz(audio, sr)
+    habla_total = sum(fin - inicio for inicio, fin in regiones)
+    inicios, region_ids = ventanas_de_voz(regiones, max_ventanas(duracion, cpu_per_minute or DIARIZATION_CPU_PER_MINUTE))
+    if len(inicios) == 0:
+        return {
+            'num_speakers': 0, 'speakers': [], 'speech_seconds': 0.0,
+            'windows': 0, 'max_speakers': max_speakers,
+            'cpu_seconds': round(time.process_time() - cpu_inicio, 3)
+        }
+
+    emb = suavizar(embeddings(audio, inicios, sr), region_ids)
+    # Cada ventana representa una parte igual del habla de su región
+    duraciones = np.array([fin - inicio for inicio, fin in regiones])
+    tiempos = duraciones[region_ids] / np.bincount(region_ids, minlength=len(regiones))[region_ids]
+
+    etiquetas = agrupar(emb, max_speakers)
+    etiquetas = absorber_menores(emb, etiquetas, tiempos, DIARIZATION_MIN_SHARE)
+    habla = np.bincount(etiquetas, weights=tiempos)
+    # Regiones sin ventana (submuestreo): su habla se reparte en proporción
+    habla *= habla_total / max(habla.sum(), 1e-9)
+
+    # Hablantes ordenados por tiempo de habla
+    orden = np.argsort(-habla)
+    speaker_id = np.empty(len(orden), dtype=np.int32)
+    speaker_id[orden] = np.arange(1, len(orden) + 1)
+
+    if segments:
+        etiquetar_segmentos(segments, inicios + WINDOW_SECONDS / 2, speaker_id[etiquetas])
+
+    cpu = time.process_time() - cpu_inicio
+    print(f"👥 Diarization: {len(orden)} speakers from {len(inicios)} windows "
+          f"({habla_total:.1f}s speech, {cpu:.2f}s CPU)")
+    return {
+        'num_speakers': int(len(orden)),
+        'speakers': [
+            {'speaker_id': int(speaker_id[c]), 'time': round(float(habla[c]), 2)}
+            for c in orden
+        ],
+        'speech_seconds': round(habla_total, 2),
+        'windows': int(len(inicios)),
+        'max_speakers': max_speakers,
+        'cpu_seconds': round(cpu, 3)
+    }
@@ -1,3 +1,4 @@
+import asyncio
 import zipfile
 import io
 import os
@@ -10,6 +11,10 @@ from app.services.ollama_service import ollama_service
 from app.services.codebert_service import codebert_service
 from app.services.whisper_service import whisper_service
 from app.services.minio_service import minio_service
+from app.services.relevance_screen import relevance_screen
+from app.services.llm_telemetry import LLM_USAGE_STEP, summarize_calls
+from app.services.rag_index import normalizar_semana
+from app.services import transcription_queue
 from datetime import datetime
 
 
@@ -36,6 +41,53 @@ class EvaluationPipeline:
         self.db.add(log)
         self.db.commit()
     
+    async def _transcribe_video(self, submission: Submission, word_timestamps: bool) -> Dict:
+        """
+        Con TRANSCRIPTION_QUEUE, encola (o reutiliza el trabajo encolado al
+        subir) y espera al worker; si no, transcribe aquí en un hilo para no
+        bloquear el event loop.
+        """
+        if transcription_queue.TRANSCRIPTION_QUEUE:
+            job = transcription_queue.enqueue(self.db, submission, word_timestamps)
+            print(f"📬 Waiting for transcription job {job.job_id} ({job.status})")
+            return await transcription_queue.wait_for(job.job_id)
+
+        bucket, object_name = submission.video_url.split('/', 1)
+        return await asyncio.to_thread(
+            whisper_service.transcribe_minio_object,
+            bucket,
+            object_name,
+            word_timestamps=word_timestamps,
+            max_speakers=transcription_queue.expected_speakers(self.db, submission) if word_timestamps else None
+        )
+    
+    def _log_llm_usage(self, submission_id: int, llm_calls: List[Dict], status: str):
+        """Tokens y tiempos de las llamadas al LLM de la evaluación (incluye las fallidas)"""
+        usage = summarize_calls(llm_calls)
+        self._log(
+            submission_id,
+            LLM_USAGE_STEP,
+            status,
+            f"{usage['calls']} LLM calls ({usage['failed_calls']} failed), "
+            f"{usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens",
+            {"calls": llm_calls, "totals": usage}
+        )
+    
+    def _log_transcription(self, submission_id: int, transcription_result: Dict):
+        """Registra qué modelo de Whisper produjo la transcripción"""
+        self._log(
+            submission_id,
+            "video_transcription",
+            "completed",
+            f"Video transcribed with {transcription_result.get('model')}",
+            {
+                "model": transcription_result.get('model'),
+                "duration": transcription_result.get('duration', 0),
+                "cached": transcription_result.get('cached', False),
+                "model_selection": transcription_result.get('model_selection')
+            }
+        )
+    
     def extract_code_from_zip(self, zip_path: str, temp_dir: str) -> Dict[str, str]:
         """
         Extract code files from ZIP submission
@@ -57,6 +109,17 @@ class EvaluationPipeline:
     
     async def _extract_code_from_zip(self, project_path: str) -> Optional[str]:
         """Extract code from ZIP file in MinIO (async version)"""
+        code_files = await self._extract_code_files_from_zip(project_path)
+        if not code_files:
+            return None
+        return self._join_code_files(code_files)
+    
+    def _join_code_files(self, code_files: Dict[str, str]) -> str:
+        """Concatenate extracted files with '// File:' headers"""
+        return "\n\n".join(f"// File: {filename}\n{content}\n" for filename, content in code_files.items())
+    
+    async def _extract_code_files_from_zip(self, project_path: str) -> Optional[Dict[str, str]]:
+        """Extract code files ({filename: content}) from ZIP file in MinIO"""
         try:
             if not project_path:
                 print(f"⚠️ No project_path provided")
@@ -84,7 +147,7 @@ class EvaluationPipeline:
                 return None
             
             # Extract code files
-            code_parts = []
+            code_files = {}
             try:
                 with zipfile.ZipFile(io.BytesIO(zip_data)) as zip_file:
                     print(f"📂 ZIP contains {len(zip_file.namelist())} files")
@@ -94,7 +157,7 @@ class EvaluationPipeline:
                         if not filename.endswith('/') and filename.endswith(('.cs', '.py', '.java', '.js', '.cpp', '.c', '.h', '.txt')):
                             try:
                                 content = zip_file.read(filename).decode('utf-8', errors='ignore')
-                                code_parts.append(f"// File: {filename}\n{content}\n")
+                                code_files[filename] = content
                                 print(f"📄 Extracted: {filename} ({len(content)} chars)")
                             except Exception as e:
                                 print(f"⚠️ Could not extract {filename}: {e}")
@@ -102,10 +165,10 @@ class EvaluationPipeline:
                 print(f"❌ Invalid ZIP file")
                 return None
             
-            if code_parts:
-                result = "\n\n".join(code_parts)
-                print(f"✅ Total code extracted: {len(result)} characters from {len(code_parts)} files")
-                return result
+            if code_files:
+                total_chars = sum(len(content) for content in code_files.values())
+                print(f"✅ Total code extracted: {total_chars} characters from {len(code_files)} files")
+                return code_files
             else:
                 print(f"⚠️ No code files found in ZIP")
                 return None
@@ -129,6 +192,32 @@ class EvaluationPipeline:
             "functionality_feedback": "Se requiere verificación manual para confirmar el cumplimiento completo de los requisitos funcionales."
         }
     
+    def _apply_video_relevance(self, submission: Submission, relevance_data: Dict) -> int:
+        """
+        Save the relevance check and return the video penalty (0 or 2 points)
+        """
+        is_relevant = relevance_data.get('is_relevant', True)
+        try:
+            confidence = float(relevance_data.get('confidence', 0.5))
+        except (TypeError, ValueError):
+            confidence = 0.5
+        reason = relevance_data.get('reason', '')
+        
+        # Guardar en BD
+        submission.video_relevance_check = json.dumps(relevance_data, ensure_ascii=False)
+        
+        print(f"📊 Video relevance: {'✅ Relevant' if is_relevant else '❌ Not relevant'} (confidence: {confidence:.2f})")
+        print(f"   Reason: {reason}")
+        
+        # Aplicar penalización si no es relevante
+        if not is_relevant or confidence < 0.6:
+            print(f"⚠️ VIDEO PENALTY APPLIED: -2 points (video not relevant to assignment)")
+            print(f"   Will deduct: -1 from Comprehension, -1 from Functionality")
+            return 2  # -2 puntos totales
+        
+        print(f"✅ Video is relevant, no penalty applied")
+        return 0
+    
     async def detect_plagiarism(
         self,
         assignment_id: int,
@@ -220,21 +309,14 @@ class EvaluationPipeline:
             if not submission or not submission.video_url:
                 raise Exception("Video not found for submission")
             
-            # Download video from MinIO
-            bucket, object_name = submission.video_url.split('/', 1)
-            video_data = minio_service.download_file(object_name, bucket)
-            
-            # Save to temp file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
-                tmp_file.write(video_data)
-                video_path = tmp_file.name
-            
-            # Transcribe with Whisper
+            # Transcribe with Whisper (single pass, reused for participation;
+            # cached by ETag, a cache hit skips the download)
             self._log(submission_id, "video_transcription", "started", "Transcribing video")
-            transcription_result = whisper_service.transcribe_video(video_path)
+            transcription_result = await self._transcribe_video(submission, word_timestamps=True)
+            self._log_transcription(submission_id, transcription_result)
             
             # Analyze participation
-            participation_data = whisper_service.analyze_participation_from_video(video_path)
+            participation_data = whisper_service.analyze_participation(transcription_result)
             
             # Analyze transcription with Ollama
             self._log(submission_id, "transcription_analysis", "started", "Analyzing transcription")
@@ -243,9 +325,6 @@ class EvaluationPipeline:
                 requirements
             )
             
-            # Cleanup
-            os.unlink(video_path)
-            
             self._log(
                 submission_id,
                 "video_analysis",
@@ -293,12 +372,17 @@ class EvaluationPipeline:
             return None
         
         print(f"✅ Submission found: {submission.submission_id}")
+        
+        # Registrar tokens y tiempos de todas las llamadas al LLM de esta evaluación
+        llm_calls = ollama_service.start_usage_tracking()
         print(f"   Project path: {submission.project_path}")
         print(f"   Video URL: {submission.video_url}")
         
         # 2. Descargar y extraer código del ZIP
+        code_files = None
         try:
-            code = await self._extract_code_from_zip(submission.project_path)
+            code_files = await self._extract_code_files_from_zip(submission.project_path)
+            code = self._join_code_files(code_files) if code_files else None
             
             if not code or len(code.strip()) == 0:
                 print(f"⚠️ No code found, using placeholder")
@@ -323,12 +407,11 @@ public class Program {
         video_transcript = None
         video_analysis = None
         video_penalty = 0  # Penalización si no hay video o no es relevante
+        check_relevance = False
         
         if submission.video_url:
             print(f"🎥 Video URL found: {submission.video_url}")
             
-            video_path = None
-            
             try:
                 # Solo soportar videos subidos a MinIO
                 if 'youtube.com' in submission.video_url or 'youtu.be' in submission.video_url:
@@ -344,24 +427,13 @@ public class Program {
                         print(f"⚠️ Invalid MinIO URL format: {submission.video_url}")
                         raise Exception("Invalid video URL format")
                     
-                    bucket, object_name = parts
-                    
-                    print(f"📥 Downloading from MinIO: {bucket}/{object_name}")
-                    video_data = minio_service.client.get_object(bucket, object_name)
-                    video_bytes = video_data.read()
-                    
-                    # Guardar temporalmente
-                    video_ext = object_name.split('.')[-1] if '.' in object_name else 'mp4'
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{video_ext}') as tmp_file:
-                        tmp_file.write(video_bytes)
-                        video_path = tmp_file.name
-                    
-                    print(f"✅ Video downloaded: {video_path} ({len(video_bytes) / 1024 / 1024:.2f} MB)")
-                    
-                    # Transcribir con Whisper
+                    # Transcribir con Whisper: una sola pasada, reutilizada para la participación.
+                    # Cacheada por ETag + modelo + idioma (un acierto no descarga el video)
+                    is_group_video = transcription_queue.wants_word_timestamps(submission)
                     print(f"🎤 Transcribing video with Whisper...")
-                    transcription_result = whisper_service.transcribe_video(video_path)
+                    transcription_result = await self._transcribe_video(submission, is_group_video)
                     video_transcript = transcription_result['text']
+                    self._log_transcription(submission_id, transcription_result)
                     
                     print(f"✅ Video transcribed: {len(video_transcript)} characters")
                     print(f"📝 Transcript preview: {video_transcript[:200]}...")
@@ -370,81 +442,26 @@ public class Program {
                     submission.video_transcription = video_transcript
                     submission.video_duration = transcription_result.get('duration', 0)
                     
-                    # Verificar relevancia del video con Ollama
-                    if len(video_transcript) > 50:
-                        print(f"🧠 Checking video relevance with Ollama...")
-                        
-                        relevance_prompt = f"""Eres un profesor evaluando si un video explicativo corresponde a una tarea de programación.
-
-REQUISITOS DE LA TAREA:
-{requirements[:800]}
-
-TRANSCRIPCIÓN DEL VIDEO:
-{video_transcript[:1500]}
-
-Analiza si el video:
-1. Explica el código relacionado a esta tarea
-2. Menciona conceptos técnicos relevantes a los requisitos
-3. Demuestra comprensión del problema planteado
-
-Responde SOLO en JSON:
-{{
-  "is_relevant": true,
-  "confidence": 0.85,
-  "mentions_requirements": true,
-  "demonstrates_understanding": true,
-  "reason": "El estudiante explica claramente la implementación de List<T> y eventos, que son requisitos clave."
-}}
-
-Donde:
-- is_relevant: true si el video corresponde a la tarea, false si habla de otro tema
-- confidence: 0.0 a 1.0 (qué tan seguro estás)
-- mentions_requirements: true si menciona conceptos de los requisitos
-- demonstrates_understanding: true si demuestra entender el problema
-- reason: explicación breve de tu evaluación
-
-RESPONDE SOLO CON EL JSON:"""
-                        
-                        relevance_result = await ollama_service.analyze_code(relevance_prompt, "")
-                        
-                        if relevance_result.get("success"):
-                            try:
-                                relevance_text = relevance_result.get("analysis", "").strip()
-                                
-                                # Extraer JSON
-                                if "{" in relevance_text and "}" in relevance_text:
-                                    start = relevance_text.find("{")
-                                    end = relevance_text.rfind("}") + 1
-                                    json_text = relevance_text[start:end]
-                                    relevance_data = json.loads(json_text)
-                                    
-                                    is_relevant = relevance_data.get('is_relevant', True)
-                                    confidence = relevance_data.get('confidence', 0.5)
-                                    reason = relevance_data.get('reason', '')
-                                    
-                                    # Guardar en BD
-                                    submission.video_relevance_check = json.dumps(relevance_data, ensure_ascii=False)
-                                    
-                                    print(f"📊 Video relevance: {'✅ Relevant' if is_relevant else '❌ Not relevant'} (confidence: {confidence:.2f})")
-                                    print(f"   Reason: {reason}")
-                                    
-                                    # Aplicar penalización si no es relevante
-                                    if not is_relevant or confidence < 0.6:
-                                        video_penalty = 2  # -2 puntos totales
-                                        print(f"⚠️ VIDEO PENALTY APPLIED: -2 points (video not relevant to assignment)")
-                                        print(f"   Will deduct: -1 from Comprehension, -1 from Functionality")
-                                    else:
-                                        print(f"✅ Video is relevant, no penalty applied")
-                                
-                            except json.JSONDecodeError as e:
-                                print(f"⚠️ Could not parse relevance check: {e}")
-                        else:
-                            print(f"⚠️ Relevance check failed, assuming video is acceptable")
+                    # La relevancia del video se verifica junto con la evaluación (paso 4)
+                    check_relevance = len(video_transcript) > 50
+                    
+                    # Pre-filtro por embeddings: los casos claros no necesitan al LLM.
+                    # El encoder (y su primera carga) es CPU: fuera del event loop
+                    if check_relevance:
+                        prescreen = await asyncio.to_thread(
+                            relevance_screen.screen,
+                            video_transcript,
+                            requirements,
+                            submission.assignment_id
+                        )
+                        if prescreen is not None:
+                            video_penalty = self._apply_video_relevance(submission, prescreen)
+                            check_relevance = False
                     
                     # Analizar participación (si es video de grupo)
-                    if submission.group_number and submission.group_number > 1:
+                    if is_group_video:
                         print(f"👥 Analyzing participation for group {submission.group_number}...")
-                        participation_data = whisper_service.analyze_participation_from_video(video_path)
+                        participation_data = whisper_service.analyze_participation(transcription_result)
                         
                         submission.speakers_detected = participation_data['num_speakers_detected']
                         
@@ -457,27 +474,12 @@ RESPONDE SOLO CON EL JSON:"""
                         print(f"✅ Detected {participation_data['num_speakers_detected']} speakers")
                         for speaker_info in participation_data['speaker_times']:
                             print(f"   Speaker {speaker_info['speaker_id']}: {speaker_info['time']}s ({speaker_info['percentage']:.1f}%)")
-                    
-                    # Limpiar archivo temporal
-                    if video_path and os.path.exists(video_path):
-                        try:
-                            os.unlink(video_path)
-                            print(f"🗑️ Cleaned up temporary file")
-                        except Exception as cleanup_error:
-                            print(f"⚠️ Could not delete temp file: {cleanup_error}")
                 
             except Exception as e:
                 print(f"⚠️ Video processing failed: {str(e)}")
                 print(f"⚠️ Continuing code evaluation without video analysis")
                 import traceback
                 traceback.print_exc()
-                
-                # Limpiar archivo temporal si existe
-                if video_path and os.path.exists(video_path):
-                    try:
-                        os.unlink(video_path)
-                    except:
-                        pass
         
         else:
             # No hay video - aplicar penalización
@@ -490,10 +492,18 @@ RESPONDE SOLO CON EL JSON:"""
                 "reason": "No video provided"
             }, ensure_ascii=False)
 
-        # 4. Evaluar con Ollama
-        print(f"🤖 Calling Ollama for evaluation...")
+        # 4. Evaluar con Ollama (con relevancia del video en la misma llamada si está habilitado)
+        combined = check_relevance and ollama_service.combined_video_eval
+        print(f"🤖 Calling Ollama for evaluation{' (with video relevance)' if combined else ''}...")
         try:
-            scores = await ollama_service.evaluate_code(code, requirements, rubric)
+            scores = await ollama_service.evaluate_code(
+                code,
+                requirements,
+                rubric,
+                code_files=code_files,
+                video_transcript=video_transcript if combined else None,
+                semana=normalizar_semana(submission.assignment.title) if submission.assignment else None
+            )
             print(f"📊 Scores received: {scores}")
         except Exception as e:
             print(f"❌ Error calling Ollama: {str(e)}")
@@ -501,6 +511,20 @@ RESPONDE SOLO CON EL JSON:"""
             traceback.print_exc()
             # Usar scores por defecto
             scores = self._fallback_scores()
+        
+        # 4.2. Relevancia del video: de la respuesta combinada o con una llamada aparte (fallback)
+        if check_relevance:
+            relevance_data = scores.pop("video_relevance", None)
+            if relevance_data is None:
+                if combined:
+                    print(f"⚠️ Combined response without valid video_relevance, falling back to separate check")
+                print(f"🧠 Checking video relevance with Ollama...")
+                relevance_data = await ollama_service.check_video_relevance(video_transcript, requirements)
+            
+            if relevance_data is not None:
+                video_penalty = self._apply_video_relevance(submission, relevance_data)
+            else:
+                print(f"⚠️ Relevance check failed, assuming video is acceptable")
 
         # 4.5. Escalar scores y aplicar penalización de video
         def scale_to_5(score):
@@ -608,6 +632,8 @@ RESPONDE SOLO CON EL JSON:"""
             print(f"✅ Feedback created with grade_id: {grade.grade_id}")
             print(f"✅ Evaluation completed successfully!")
             
+            self._log_llm_usage(submission_id, llm_calls, "completed")
+            
             return {
                 "grade_id": grade.grade_id,
                 "total_score": grade.ai_total_score,
@@ -619,4 +645,8 @@ RESPONDE SOLO CON EL JSON:"""
             self.db.rollback()
             import traceback
             traceback.print_exc()
+            try:
+                self._log_llm_usage(submission_id, llm_calls, "failed")
+            except Exception:
+                self.db.rollback()
             raise
@@ -0,0 +1,116 @@
+"""
+Telemetría de uso del LLM por evaluación.
+Resume los tokens y tiempos de Ollama guardados en SimpleLog (step="llm_usage")
+por tarea y por modelo, para planificar capacidad.
+
+Ubicación: backend/app/services/llm_telemetry.py
+"""
+
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from app.models.models import SimpleLog, Submission
+
+LLM_USAGE_STEP = "llm_usage"
+COLD_LOAD_MS = 1000
+
+
+def _fallida(call: Dict) -> bool:
+    return call.get("status", "ok") != "ok"
+
+
+def summarize_calls(calls: List[Dict]) -> Dict:
+    """
+    Totales de una evaluación (las llamadas compartidas por singleflight no
+    suman cómputo; las fallidas no traen tokens, solo el tiempo esperado)
+    """
+    fallidas = [c for c in calls if _fallida(c)]
+    propias = [c for c in calls if not c.get("shared") and not _fallida(c)]
+    return {
+        "calls": len(calls),
+        "shared_calls": sum(1 for c in calls if c.get("shared") and not _fallida(c)),
+        "failed_calls": len(fallidas),
+        "failed_ms": round(sum(c.get("elapsed_ms", 0) for c in fallidas), 1),
+        "prompt_tokens": sum(c.get("prompt_eval_count", 0) for c in propias),
+        "completion_tokens": sum(c.get("eval_count", 0) for c in propias),
+        "load_ms": round(sum(c.get("load_ms", 0) for c in propias), 1),
+        "prompt_eval_ms": round(sum(c.get("prompt_eval_ms", 0) for c in propias), 1),
+        "eval_ms": round(sum(c.get("eval_ms", 0) for c in propias), 1),
+        "total_ms": round(sum(c.get("total_ms", 0) for c in propias), 1),
+        "models": sorted({c.get("model") for c in calls if c.get("model")})
+    }
+
+
+def llm_usage_by_assignment_and_model(db: Session, assignment_id: Optional[int] = None) -> List[Dict]:
+    """
+    Agrega el uso del LLM por (assignment_id, modelo).
+
+    Returns:
+        Lista de filas con tokens, tokens/s, tiempos medios de prompt eval y carga
+    """
+    query = (
+        db.query(SimpleLog.details, Submission.assignment_id)
+        .join(Submission, SimpleLog.submission_id == Submission.submission_id)
+        .filter(SimpleLog.step == LLM_USAGE_STEP)
+    )
+    if assignment_id is not None:
+        query = query.filter(Submission.assignment_id == assignment_id)
+
+    grupos: Dict[tuple, Dict] = {}
+    for details, a_id in query.all():
+        for call in (details or {}).get("calls", []):
+            key = (a_id, call.get("model"))
+            g = grupos.setdefault(key, {
+                "assignment_id": a_id,
+                "model": call.get("model"),
+                "calls": 0,
+                "shared_calls": 0,
+                "failed_calls": 0,
+                "failed_ms": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "prompt_eval_ms": 0.0,
+                "eval_ms": 0.0,
+                "load_ms": 0.0,
+                "cold_loads": 0,
+                "purposes": {}
+            })
+            g["calls"] += 1
+            purpose = call.get("purpose", "analysis")
+            g["purposes"][purpose] = g["purposes"].get(purpose, 0) + 1
+            if _fallida(call):
+                g["failed_calls"] += 1
+                g["failed_ms"] += call.get("elapsed_ms", 0)
+                continue
+            if call.get("shared"):
+                g["shared_calls"] += 1
+                continue
+            g["prompt_tokens"] += call.get("prompt_eval_count", 0)
+            g["completion_tokens"] += call.get("eval_count", 0)
+            g["prompt_eval_ms"] += call.get("prompt_eval_ms", 0)
+            g["eval_ms"] += call.get("eval_ms", 0)
+            g["load_ms"] += call.get("load_ms", 0)
+            if call.get("load_ms", 0) > COLD_LOAD_MS:
+                g["cold_loads"] += 1
+
+    filas = []
+    for g in grupos.values():
+        propias = g["calls"] - g["shared_calls"] - g["failed_calls"]
+        filas.append({
+            "assignment_id": g["assignment_id"],
+            "model": g["model"],
+            "calls": g["calls"],
+            "shared_calls": g["shared_calls"],
+            "failed_calls": g["failed_calls"],
+            "failed_ms": round(g["failed_ms"], 1),
+            "purposes": g["purposes"],
+            "prompt_tokens": g["prompt_tokens"],
+            "completion_tokens": g["completion_tokens"],
+            "tokens_per_second": round(g["completion_tokens"] / (g["eval_ms"] / 1000), 2) if g["eval_ms"] else 0,
+            "prompt_tokens_per_second": round(g["prompt_tokens"] / (g["prompt_eval_ms"] / 1000), 2) if g["prompt_eval_ms"] else 0,
+            "avg_prompt_eval_ms": round(g["prompt_eval_ms"] / propias, 1) if propias else 0,
+            "avg_eval_ms": round(g["eval_ms"] / propias, 1) if propias else 0,
+            "avg_load_ms": round(g["load_ms"] / propias, 1) if propias else 0,
+            "cold_loads": g["cold_loads"]
+        })
+    filas.sort(key=lambda f: (f["assignment_id"] or 0, f["model"] or ""))
+    return filas
@@ -1,12 +1,40 @@
 from minio import Minio
 from minio.error import S3Error
-from typing import Optional, BinaryIO
+from typing import Optional, BinaryIO, Tuple
 import io
 from datetime import timedelta
 from app.core.config import get_settings
 
 settings = get_settings()
 
+# Subidas en streaming: partes multipart de 10 MB (S3 exige al menos 5 MB)
+UPLOAD_PART_SIZE = 10 * 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"Upload exceeds {max_size / 1024 / 1024:.0f}MB")
+
+
+class SizeLimitedReader:
+    """
+    Envuelve un archivo y falla apenas lo leído supera max_size, antes de
+    subir la parte siguiente (minio aborta el multipart upload).
+    """
+    
+    def __init__(self, raw: BinaryIO, max_size: Optional[int] = None):
+        self.raw = raw
+        self.max_size = max_size
+        self.bytes_read = 0
+    
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.raw.read(size)
+        self.bytes_read += len(chunk)
+        if self.max_size is not None and self.bytes_read > self.max_size:
+            raise UploadTooLarge(self.max_size)
+        return chunk
+
 
 class MinIOService:
     def __init__(self):
@@ -78,6 +106,44 @@ class MinIOService:
         except S3Error as e:
             raise Exception(f"Error uploading file: {str(e)}")
     
+    def upload_stream(
+        self,
+        stream: BinaryIO,
+        object_name: str,
+        bucket_name: Optional[str] = None,
+        content_type: str = "application/octet-stream",
+        max_size: Optional[int] = None
+    ) -> Tuple[str, int]:
+        """
+        Upload a file-like object of unknown size as a multipart upload,
+        holding at most one part in memory. Blocking: call it from a
+        threadpool in async endpoints.
+        
+        Args:
+            stream: Readable binary stream (e.g. UploadFile.file)
+            max_size: Abort with UploadTooLarge once more bytes are read
+        
+        Returns:
+            (object path, bytes uploaded)
+        """
+        if bucket_name is None:
+            bucket_name = self.bucket_submissions
+        
+        reader = SizeLimitedReader(stream, max_size)
+        try:
+            self.client.put_object(
+                bucket_name,
+                object_name,
+                reader,
+                length=-1,
+                part_size=UPLOAD_PART_SIZE,
+                content_type=content_type
+            )
+            return f"{bucket_name}/{object_name}", reader.bytes_read
+        
+        except S3Error as e:
+            raise Exception(f"Error uploading file: {str(e)}")
+    
     def download_file(self, object_name: str, bucket_name: Optional[str] = None) -> bytes:
         """
         Download file from MinIO
@@ -187,9 +253,12 @@ class MinIOService:
         content_type: str = "application/zip"
     ) -> str:
         """
-        Upload submission file with structured naming
+        Upload submission file with structured naming (streamed when
+        file_data is a file object)
         """
         object_name = f"submissions/{submission_id}/{filename}"
+        if not isinstance(file_data, bytes):
+            return self.upload_stream(file_data, object_name, self.bucket_submissions, content_type)[0]
         return self.upload_file(
             file_data,
             object_name,
@@ -6,12 +6,77 @@ Ubicación: backend/app/services/ollama_service.py
 """
 
 import httpx
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import asyncio
+import hashlib
 import json
 import os
+import time
 
 # Importar RAG service
 from app.services.rag_service import rag_service
+from app.services.prompt_packer import prompt_packer
+
+
+# ═══════════════════════════════════════════════════════
+# Prefijo estático del prompt de evaluación.
+# Se envía como "system" y es idéntico en todas las llamadas, de modo que
+# Ollama reutiliza su KV cache del prefijo y solo evalúa la parte variable.
+# NO interpolar datos de la tarea aquí.
+# ═══════════════════════════════════════════════════════
+EVALUATION_SYSTEM_PROMPT = """Eres un profesor de Ingeniería Informática evaluando un proyecto de C#/.NET. 
+Analiza el código y proporciona una evaluación detallada según la siguiente rúbrica (máximo 20 puntos):
+
+═══════════════════════════════════════════════════════
+RÚBRICA DE EVALUACIÓN (Total: 20 puntos)
+═══════════════════════════════════════════════════════
+
+1. COMPRENSIÓN DEL PROBLEMA (0-5 puntos):
+   - ¿Tiene todo lo solicitado en los requisitos?
+   - ¿Usa nombres específicos cuando se requieren?
+   - ¿La solución es adecuada al problema planteado?
+
+2. DISEÑO DE LA SOLUCIÓN (0-5 puntos):
+   - Arquitectura de clases y separación de responsabilidades
+   - Uso apropiado de List<T> y estructuras de datos
+   - Aplicación correcta de POO
+
+3. IMPLEMENTACIÓN (0-5 puntos):
+   - Calidad del código (legibilidad, nomenclatura)
+   - Uso correcto de C# y .NET Framework
+   - Manejo adecuado de eventos
+
+4. FUNCIONALIDAD (0-5 puntos):
+   - Cumplimiento de requisitos funcionales
+   - Validaciones de datos implementadas
+   - Flujo de navegación coherente
+
+Responde ÚNICAMENTE en JSON con esta estructura exacta:
+
+{
+  "comprehension_score": 4,
+  "design_score": 3,
+  "implementation_score": 4,
+  "functionality_score": 4,
+  "comprehension_feedback": "El estudiante demuestra buena comprensión. Ha implementado [ejemplos específicos]. Falta [aspectos]. Sugerencia: [recomendación].",
+  "design_feedback": "La arquitectura presenta [análisis]. Puntos positivos: [ejemplos]. Áreas de mejora: [sugerencias].",
+  "implementation_feedback": "Calidad del código: [evaluación]. Puntos fuertes: [ejemplos]. Considerar mejorar: [sugerencias].",
+  "functionality_feedback": "El proyecto cumple con [requisitos]. Funcionalidad: [detalles]. Pendiente: [aspectos]."
+}
+
+IMPORTANTE: 
+- Cada score debe ser 0-5 (NO 0-25)
+- Feedback específico y constructivo
+- Si nota total >= 16: menciona "¡Buen trabajo!"
+- Si nota total == 20: menciona "¡Excelente trabajo!"
+- Si nota total < 16: feedback detallado"""
+
+# Llamadas al LLM de la evaluación en curso (ver start_usage_tracking)
+_usage_calls: ContextVar[Optional[List[Dict]]] = ContextVar("ollama_usage_calls", default=None)
+
+SCORE_FIELDS = ["comprehension_score", "design_score", "implementation_score", "functionality_score"]
 
 
 class OllamaService:
@@ -20,6 +85,42 @@ class OllamaService:
         self.base_url = os.getenv("OLLAMA_URL", "http://ollama:11434")
         self.model = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
         self.timeout = float(os.getenv("OLLAMA_TIMEOUT", "900"))  # 15 minutos
+        # Ventana de contexto (0 = valor por defecto del modelo en Ollama)
+        self.num_ctx = int(os.getenv("OLLAMA_NUM_CTX", "0"))
+        
+        # keep_alive explícito: mantener el modelo cargado durante un lote
+        # y liberarlo (o dejarlo expirar pronto) al terminar
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        self.release_keep_alive = os.getenv("OLLAMA_RELEASE_KEEP_ALIVE", "2m")
+        self._batch_depth = 0
+        self._batch_lock = asyncio.Lock()
+        
+        # Singleflight: llamadas concurrentes idénticas comparten una sola generación
+        self._inflight: Dict[str, Dict] = {}
+        self.singleflight_stats = {"requests": 0, "collapsed": 0}
+        
+        # Cascada: un modelo pequeño evalúa primero y solo se escala al grande
+        # si la respuesta es inválida, cae cerca de un límite de nota o es inconsistente
+        self.cascade = os.getenv("OLLAMA_CASCADE", "false").lower() == "true"
+        self.triage_model = os.getenv("OLLAMA_TRIAGE_MODEL", "llama3.1:8b")
+        self.cascade_runs = max(1, int(os.getenv("OLLAMA_CASCADE_RUNS", "2")))
+        self.cascade_boundaries = [
+            float(b) for b in os.getenv("OLLAMA_CASCADE_BOUNDARIES", "10.5,16").split(",") if b.strip()
+        ]
+        self.cascade_margin = float(os.getenv("OLLAMA_CASCADE_MARGIN", "1.0"))
+        self.cascade_max_spread = float(os.getenv("OLLAMA_CASCADE_MAX_SPREAD", "2.0"))
+        self.cascade_stats = {
+            "evaluations": 0,
+            "escalated": 0,
+            "reasons": {},
+            "triage_seconds": 0.0,
+            "large_calls": 0,
+            "large_seconds": 0.0,
+            "saved_seconds": 0.0
+        }
+        
+        # Relevancia del video y evaluación en una sola llamada (fallback: dos llamadas)
+        self.combined_video_eval = os.getenv("OLLAMA_COMBINED_VIDEO_EVAL", "true").lower() == "true"
         
         # RAG settings
         self.use_rag = os.getenv("USE_RAG", "true").lower() == "true"
@@ -27,12 +128,12 @@ class OllamaService:
         
         print(f"🔧 OllamaService initialized with URL: {self.base_url}")
         print(f"🔧 Model: {self.model}, Timeout: {self.timeout}s")
+        if self.cascade:
+            print(f"🔧 Cascade: {self.triage_model} x{self.cascade_runs} → {self.model}")
         print(f"🔧 RAG enabled: {self.use_rag}, Examples: {self.rag_examples}")
-        
-        # Mostrar stats del RAG
+        # El dataset RAG se indexa en la primera búsqueda (no al importar)
         if self.use_rag:
-            stats = rag_service.get_stats()
-            print(f"🔧 RAG Dataset: {stats.get('total', 0)} evaluaciones históricas")
+            print(f"🔧 RAG Dataset: {rag_service.dataset_path} (carga perezosa, retriever: {rag_service.retriever})")
     
     async def check_health(self) -> bool:
         """Check if Ollama is running"""
@@ -43,8 +144,166 @@ class OllamaService:
         except:
             return False
     
-    async def analyze_code(self, code: str, requirements: str = "", context: Dict = None) -> Dict:
+    def _options(self) -> Optional[Dict]:
+        """Opciones de Ollama comunes a todas las llamadas (cambiarlas recarga el modelo)"""
+        if self.num_ctx:
+            return {"num_ctx": self.num_ctx}
+        return None
+    
+    def _usage(self, result: Dict) -> Dict:
+        """
+        Tokens y tiempos de una respuesta de Ollama
+        (las duraciones vienen en nanosegundos y se convierten a milisegundos)
+        """
+        def ms(key):
+            return round(result.get(key, 0) / 1e6, 1)
+        
+        eval_ms = ms("eval_duration")
+        eval_count = result.get("eval_count", 0)
+        return {
+            "prompt_eval_count": result.get("prompt_eval_count", 0),
+            "eval_count": eval_count,
+            "load_ms": ms("load_duration"),
+            "prompt_eval_ms": ms("prompt_eval_duration"),
+            "eval_ms": eval_ms,
+            "total_ms": ms("total_duration"),
+            "tokens_per_second": round(eval_count / (eval_ms / 1000), 2) if eval_ms else 0
+        }
+    
+    def start_usage_tracking(self) -> List[Dict]:
+        """
+        Empieza a registrar las llamadas al LLM del contexto actual (una evaluación).
+        Devuelve la lista que se irá llenando con el uso de cada llamada.
+        """
+        calls: List[Dict] = []
+        _usage_calls.set(calls)
+        return calls
+    
+    async def _post_generate(self, payload: Dict) -> Dict:
+        """POST /api/generate con el timeout configurado"""
+        timeout = httpx.Timeout(self.timeout, connect=10.0)
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            response = await client.post(
+                f"{self.base_url}/api/generate",
+                json=payload
+            )
+            response.raise_for_status()
+            return response.json()
+    
+    def _request_key(self, payload: Dict) -> str:
+        """Clave de deduplicación: hash del payload completo (modelo, system, prompt, opciones)"""
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    async def _generate_singleflight(self, payload: Dict) -> Tuple[Dict, bool]:
+        """
+        Si ya hay una generación idéntica en curso, espera su resultado
+        en lugar de enviar otra petición a Ollama.
+        
+        Returns:
+            (resultado de Ollama, True si se reutilizó una generación en curso)
+        """
+        key = self._request_key(payload)
+        self.singleflight_stats["requests"] += 1
+        
+        entry = self._inflight.get(key)
+        shared = entry is not None
+        if shared:
+            self.singleflight_stats["collapsed"] += 1
+            print(f"🔗 Singleflight: joining in-flight Ollama request "
+                  f"({self.singleflight_stats['collapsed']} collapsed so far)")
+        else:
+            # La generación es una tarea propia: no depende del llamador que la inició
+            task = asyncio.create_task(self._post_generate(payload))
+            entry = self._inflight[key] = {"task": task, "waiters": 0}
+            task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is entry else None)
+            # Evita el warning "exception was never retrieved" si nadie más esperaba
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        
+        entry["waiters"] += 1
+        try:
+            # shield: si un llamador (también el primero) se cancela, los demás siguen esperando
+            return await asyncio.shield(entry["task"]), shared
+        finally:
+            entry["waiters"] -= 1
+            # Sin nadie esperando, no tiene sentido seguir generando
+            if entry["waiters"] == 0 and not entry["task"].done():
+                entry["task"].cancel()
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+    
+    async def warm_up(self, model: Optional[str] = None) -> Dict:
+        """
+        Carga el modelo y evalúa el prefijo estático de evaluación,
+        para que la primera evaluación del lote no pague la carga en frío.
+        """
+        model = model or self.model
+        payload = {
+            "model": model,
+            "system": EVALUATION_SYSTEM_PROMPT,
+            "prompt": "OK",
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {**(self._options() or {}), "num_predict": 1}
+        }
+        try:
+            result = await self._post_generate(payload)
+            usage = self._usage(result)
+            print(f"🔥 Ollama warm-up {model}: load {usage['load_ms']}ms, "
+                  f"prefix eval {usage['prompt_eval_ms']}ms ({usage['prompt_eval_count']} tokens)")
+            return usage
+        except Exception as e:
+            print(f"⚠️ Ollama warm-up failed: {str(e)}")
+            return {}
+    
+    async def release(self, model: Optional[str] = None, keep_alive: Optional[str] = None):
+        """Indica a Ollama cuándo descargar el modelo ("0" = inmediatamente)"""
+        model = model or self.model
+        keep_alive = keep_alive if keep_alive is not None else self.release_keep_alive
+        try:
+            await self._post_generate({"model": model, "keep_alive": keep_alive})
+            print(f"💤 Ollama release {model} (keep_alive={keep_alive})")
+        except Exception as e:
+            print(f"⚠️ Ollama release failed: {str(e)}")
+    
+    @asynccontextmanager
+    async def batch(self):
+        """
+        Delimita un lote de evaluaciones (varias entregas seguidas). Las
+        sesiones concurrentes comparten el mismo lote: se precalienta al entrar
+        el primero y se libera al salir el último. No usarlo para una sola
+        evaluación: pagaría el warm-up y la liberación del modelo.
+        """
+        async with self._batch_lock:
+            self._batch_depth += 1
+            first = self._batch_depth == 1
+        if first:
+            if self.cascade:
+                await self.warm_up(self.triage_model)
+            await self.warm_up()
+        try:
+            yield self
+        finally:
+            async with self._batch_lock:
+                self._batch_depth -= 1
+                last = self._batch_depth == 0
+            if last:
+                if self.cascade:
+                    await self.release(self.triage_model)
+                await self.release()
+    
+    async def analyze_code(
+        self,
+        code: str,
+        requirements: str = "",
+        context: Dict = None,
+        system: Optional[str] = None,
+        model: Optional[str] = None,
+        purpose: str = "analysis"
+    ) -> Dict:
         """Analyze code with Llama"""
+        model = model or self.model
+        start = time.perf_counter()
         try:
             # Construir el prompt
             if requirements:
@@ -52,36 +311,43 @@ class OllamaService:
             else:
                 prompt = code
             
-            # Crear timeout explícito
-            timeout = httpx.Timeout(self.timeout, connect=10.0)
+            payload = {
+                "model": model,
+                "prompt": prompt,
+                "stream": False,
+                "keep_alive": self.keep_alive
+            }
+            if system:
+                payload["system"] = system
+            options = self._options()
+            if options:
+                payload["options"] = options
             
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                payload = {
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False
-                }
-                
-                print(f"🔍 Calling Ollama at {self.base_url} with model: {self.model}")
-                
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json=payload
-                )
-                
-                response.raise_for_status()
-                result = response.json()
-                
-                print(f"✅ Ollama response received")
-                
-                return {
-                    "analysis": result.get("response", ""),
-                    "model": self.model,
-                    "success": True
-                }
+            print(f"🔍 Calling Ollama at {self.base_url} with model: {model}")
+            
+            result, shared = await self._generate_singleflight(payload)
+            usage = self._usage(result)
+            
+            print(f"✅ Ollama response received{' (shared)' if shared else ''}")
+            if usage["load_ms"] > 1000:
+                print(f"🧊 Cold load: {usage['load_ms']}ms")
+            print(f"⏱️ Prompt eval: {usage['prompt_eval_ms']}ms ({usage['prompt_eval_count']} tokens), "
+                  f"generation: {usage['eval_ms']}ms ({usage['eval_count']} tokens, {usage['tokens_per_second']} tok/s), "
+                  f"total: {usage['total_ms']}ms")
+            
+            self._record_call(model, purpose, "ok", shared=shared, **usage)
+            
+            return {
+                "analysis": result.get("response", ""),
+                "model": model,
+                "usage": usage,
+                "shared": shared,
+                "success": True
+            }
                 
         except httpx.TimeoutException as e:
             print(f"❌ Timeout calling Ollama: {str(e)}")
+            self._record_call(model, purpose, "timeout", start=start, error=str(e))
             return {
                 "analysis": "",
                 "error": f"Timeout after {self.timeout}s",
@@ -91,14 +357,112 @@ class OllamaService:
             print(f"❌ Error calling Ollama: {str(e)}")
             import traceback
             traceback.print_exc()
+            self._record_call(model, purpose, "error", start=start, error=str(e))
             return {
                 "analysis": "",
                 "error": str(e),
                 "success": False
             }
     
-    async def evaluate_code(self, code: str, requirements: str, rubric: Dict) -> Dict:
-        """Evaluate code against requirements and rubric - CON RAG"""
+    def _record_call(self, model: str, purpose: str, status: str, start: Optional[float] = None,
+                     error: Optional[str] = None, **usage):
+        """
+        Agrega la llamada al uso de la evaluación en curso. Las fallidas
+        (timeout/error) también se registran, con el tiempo que se esperó.
+        """
+        calls = _usage_calls.get()
+        if calls is None:
+            return
+        call = {"model": model, "purpose": purpose, "status": status, "shared": usage.pop("shared", False), **usage}
+        if start is not None:
+            call["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if error:
+            call["error"] = error[:300]
+        calls.append(call)
+    
+    def _extract_json(self, text: str) -> Optional[Dict]:
+        """Extrae el primer objeto JSON de la respuesta del modelo"""
+        text = (text or "").strip()
+        if "{" not in text or "}" not in text:
+            return None
+        start = text.find("{")
+        end = text.rfind("}") + 1
+        try:
+            data = json.loads(text[start:end])
+        except json.JSONDecodeError as e:
+            print(f"⚠️ Could not parse JSON: {e}")
+            return None
+        return data if isinstance(data, dict) else None
+    
+    def _valid_relevance(self, data) -> bool:
+        """Una verificación de relevancia es válida si trae is_relevant booleano"""
+        return isinstance(data, dict) and isinstance(data.get("is_relevant"), bool)
+    
+    async def check_video_relevance(self, video_transcript: str, requirements: str) -> Optional[Dict]:
+        """
+        Verifica en una llamada aparte si el video corresponde a la tarea.
+        Es el camino de respaldo cuando la respuesta combinada no trae la relevancia.
+        """
+        relevance_prompt = f"""Eres un profesor evaluando si un video explicativo corresponde a una tarea de programación.
+
+REQUISITOS DE LA TAREA:
+{prompt_packer.pack_requirements(requirements)}
+
+TRANSCRIPCIÓN DEL VIDEO:
+{prompt_packer.pack_transcript(video_transcript)}
+
+Analiza si el video:
+1. Explica el código relacionado a esta tarea
+2. Menciona conceptos técnicos relevantes a los requisitos
+3. Demuestra comprensión del problema planteado
+
+Responde SOLO en JSON:
+{{
+  "is_relevant": true,
+  "confidence": 0.85,
+  "mentions_requirements": true,
+  "demonstrates_understanding": true,
+  "reason": "El estudiante explica claramente la implementación de List<T> y eventos, que son requisitos clave."
+}}
+
+Donde:
+- is_relevant: true si el video corresponde a la tarea, false si habla de otro tema
+- confidence: 0.0 a 1.0 (qué tan seguro estás)
+- mentions_requirements: true si menciona conceptos de los requisitos
+- demonstrates_understanding: true si demuestra entender el problema
+- reason: explicación breve de tu evaluación
+
+RESPONDE SOLO CON EL JSON:"""
+        
+        result = await self.analyze_code(relevance_prompt, "", purpose="video_relevance")
+        if not result.get("success"):
+            return None
+        
+        data = self._extract_json(result.get("analysis", ""))
+        return data if self._valid_relevance(data) else None
+    
+    async def evaluate_code(
+        self,
+        code: str,
+        requirements: str,
+        rubric: Dict,
+        code_files: Optional[Dict[str, str]] = None,
+        video_transcript: Optional[str] = None,
+        semana: Optional[str] = None
+    ) -> Dict:
+        """
+        Evaluate code against requirements and rubric - CON RAG.
+        Si se pasa video_transcript, la misma respuesta incluye "video_relevance".
+        `semana` de la tarea prioriza ejemplos históricos de la misma semana.
+        """
+        
+        # Empaquetar código y requisitos dentro del presupuesto de tokens
+        if code_files:
+            packed = prompt_packer.pack(code_files, requirements)
+        else:
+            packed = prompt_packer.pack_code(code, requirements)
+        codigo_prompt = packed["code"]
+        requisitos_prompt = prompt_packer.pack_requirements(requirements)
         
         # ═══════════════════════════════════════════════════════
         # NUEVO: Buscar ejemplos similares con RAG
@@ -107,7 +471,7 @@ class OllamaService:
         ejemplos = []
         if self.use_rag:
             print(f"🔍 RAG: Buscando {self.rag_examples} proyectos similares...")
-            ejemplos = await rag_service.buscar_similares(code, self.rag_examples)
+            ejemplos = await rag_service.buscar_similares(code, self.rag_examples, semana=semana)
             
             if ejemplos:
                 ejemplos_texto = rag_service.formatear_ejemplos_para_prompt(ejemplos)
@@ -122,68 +486,83 @@ class OllamaService:
         # Instrucción adicional si hay ejemplos RAG
         instruccion_rag = ""
         if ejemplos_texto:
-            instruccion_rag = "- EVALÚA CON EL MISMO CRITERIO de los ejemplos anteriores"
+            instruccion_rag = "IMPORTANTE: EVALÚA CON EL MISMO CRITERIO de los ejemplos anteriores\n"
         
-        prompt = f"""Eres un profesor de Ingeniería Informática evaluando un proyecto de C#/.NET. 
-Analiza el código y proporciona una evaluación detallada según la siguiente rúbrica (máximo 20 puntos):
+        # Evaluación combinada: la relevancia del video va en la parte variable,
+        # así el prefijo "system" sigue siendo idéntico en todas las llamadas
+        instruccion_video = ""
+        if video_transcript:
+            instruccion_video = f"""TRANSCRIPCIÓN DEL VIDEO EXPLICATIVO:
+{prompt_packer.pack_transcript(video_transcript)}
 
 ═══════════════════════════════════════════════════════
-RÚBRICA DE EVALUACIÓN (Total: 20 puntos)
-═══════════════════════════════════════════════════════
-
-1. COMPRENSIÓN DEL PROBLEMA (0-5 puntos):
-   - ¿Tiene todo lo solicitado en los requisitos?
-   - ¿Usa nombres específicos cuando se requieren?
-   - ¿La solución es adecuada al problema planteado?
+Además de la rúbrica, indica si el video corresponde a esta tarea agregando
+al JSON el campo "video_relevance":
 
-2. DISEÑO DE LA SOLUCIÓN (0-5 puntos):
-   - Arquitectura de clases y separación de responsabilidades
-   - Uso apropiado de List<T> y estructuras de datos
-   - Aplicación correcta de POO
-
-3. IMPLEMENTACIÓN (0-5 puntos):
-   - Calidad del código (legibilidad, nomenclatura)
-   - Uso correcto de C# y .NET Framework
-   - Manejo adecuado de eventos
+  "video_relevance": {{
+    "is_relevant": true,
+    "confidence": 0.85,
+    "mentions_requirements": true,
+    "demonstrates_understanding": true,
+    "reason": "El estudiante explica la implementación de List<T> y eventos, que son requisitos clave."
+  }}
 
-4. FUNCIONALIDAD (0-5 puntos):
-   - Cumplimiento de requisitos funcionales
-   - Validaciones de datos implementadas
-   - Flujo de navegación coherente
+- is_relevant: true si el video corresponde a la tarea, false si habla de otro tema
+- confidence: 0.0 a 1.0 (qué tan seguro estás)
 
-{ejemplos_texto}═══════════════════════════════════════════════════════
+"""
+        
+        # Solo la parte variable va en el prompt; la rúbrica es el prefijo "system"
+        prompt = f"""{ejemplos_texto}═══════════════════════════════════════════════════════
 REQUISITOS DE LA TAREA ACTUAL:
-{requirements[:800]}
+{requisitos_prompt}
 
 CÓDIGO DEL ESTUDIANTE A EVALUAR:
-{code[:1500]}
+{codigo_prompt}
 
 ═══════════════════════════════════════════════════════
-
-Responde ÚNICAMENTE en JSON con esta estructura exacta:
-
-{{
-  "comprehension_score": 4,
-  "design_score": 3,
-  "implementation_score": 4,
-  "functionality_score": 4,
-  "comprehension_feedback": "El estudiante demuestra buena comprensión. Ha implementado [ejemplos específicos]. Falta [aspectos]. Sugerencia: [recomendación].",
-  "design_feedback": "La arquitectura presenta [análisis]. Puntos positivos: [ejemplos]. Áreas de mejora: [sugerencias].",
-  "implementation_feedback": "Calidad del código: [evaluación]. Puntos fuertes: [ejemplos]. Considerar mejorar: [sugerencias].",
-  "functionality_feedback": "El proyecto cumple con [requisitos]. Funcionalidad: [detalles]. Pendiente: [aspectos]."
-}}
-
-IMPORTANTE: 
-- Cada score debe ser 0-5 (NO 0-25)
-- Feedback específico y constructivo
-{instruccion_rag}
-- Si nota total >= 16: menciona "¡Buen trabajo!"
-- Si nota total == 20: menciona "¡Excelente trabajo!"
-- Si nota total < 16: feedback detallado
-
+{instruccion_video}{instruccion_rag}
 RESPONDE SOLO CON EL JSON, SIN TEXTO ADICIONAL:"""
         
-        result = await self.analyze_code(prompt, "")
+        if self.cascade:
+            result, scores = await self._evaluate_cascade(prompt)
+        else:
+            result, scores = await self._generate_scores(prompt, self.model, "evaluation")
+        
+        if scores is None:
+            return self._fallback_scores()
+        scores.pop("_missing_fields", None)
+        
+        # Relevancia del video (evaluación combinada); si no es válida,
+        # el pipeline hace la verificación aparte
+        if video_transcript:
+            relevance = scores.pop("video_relevance", None)
+            if self._valid_relevance(relevance):
+                scores["video_relevance"] = relevance
+            else:
+                print(f"⚠️ Combined response has no valid video_relevance")
+        
+        # Agregar metadata de RAG
+        scores["_rag_used"] = self.use_rag and len(ejemplos) > 0
+        scores["_rag_examples"] = len(ejemplos) if self.use_rag else 0
+        scores["_prompt_packing"] = packed["stats"]
+        scores["_usage"] = result.get("usage", {})
+        scores["_model"] = result.get("model", self.model)
+        
+        return scores
+    
+    async def _generate_scores(self, prompt: str, model: str, purpose: str) -> Tuple[Dict, Optional[Dict]]:
+        """
+        Llama al modelo con el prefijo de evaluación y parsea la respuesta.
+        purpose: "evaluation", "triage" o "escalation" (para la telemetría;
+        los dos modelos de la cascada pueden ser el mismo).
+        
+        Returns:
+            (resultado de Ollama, scores o None si la respuesta no es válida)
+        """
+        result = await self.analyze_code(
+            prompt, "", system=EVALUATION_SYSTEM_PROMPT, model=model, purpose=purpose
+        )
         
         print(f"🔍 DEBUG - Result success: {result.get('success')}")
         print(f"🔍 DEBUG - Result keys: {result.keys()}")
@@ -192,15 +571,27 @@ RESPONDE SOLO CON EL JSON, SIN TEXTO ADICIONAL:"""
         
         if not result.get("success"):
             print(f"❌ LLM call failed: {result.get('error')}")
-            return self._fallback_scores()
+            return result, None
         
-        # Parse JSON
+        scores, missing_fields = self._parse_scores(result.get("analysis", ""))
+        if scores is not None:
+            scores["_missing_fields"] = missing_fields
+        return result, scores
+    
+    def _parse_scores(self, analysis_text: str) -> Tuple[Optional[Dict], List[str]]:
+        """
+        Parsea y normaliza el JSON de evaluación.
+        
+        Returns:
+            (scores o None si no hay JSON válido, campos que faltaban y se completaron)
+        """
+        json_text = ""
         try:
-            analysis_text = result.get("analysis", "").strip()
+            analysis_text = (analysis_text or "").strip()
             
             if not analysis_text:
                 print(f"❌ Empty response from Ollama")
-                return self._fallback_scores()
+                return None, []
             
             # Buscar JSON en la respuesta
             if "{" in analysis_text and "}" in analysis_text:
@@ -210,13 +601,13 @@ RESPONDE SOLO CON EL JSON, SIN TEXTO ADICIONAL:"""
             else:
                 print(f"❌ No JSON found in response")
                 print(f"   Raw response: {analysis_text[:500]}")
-                return self._fallback_scores()
+                return None, []
             
             print(f"📝 Parsing JSON... ({len(json_text)} chars)")
             scores = json.loads(json_text)
             
             # Validar y escalar scores si es necesario
-            for key in ["comprehension_score", "design_score", "implementation_score", "functionality_score"]:
+            for key in SCORE_FIELDS:
                 if key in scores:
                     score = float(scores[key])
                     if score > 5:
@@ -232,9 +623,7 @@ RESPONDE SOLO CON EL JSON, SIN TEXTO ADICIONAL:"""
             print(f"   Functionality: {scores.get('functionality_score', 0)}/5")
             
             # Validar que tenga todos los campos requeridos
-            required_fields = [
-                "comprehension_score", "design_score", 
-                "implementation_score", "functionality_score",
+            required_fields = SCORE_FIELDS + [
                 "comprehension_feedback", "design_feedback",
                 "implementation_feedback", "functionality_feedback"
             ]
@@ -250,21 +639,100 @@ RESPONDE SOLO CON EL JSON, SIN TEXTO ADICIONAL:"""
                     else:
                         scores[field] = "Feedback no disponible"
             
-            # Agregar metadata de RAG
-            scores["_rag_used"] = self.use_rag and len(ejemplos) > 0
-            scores["_rag_examples"] = len(ejemplos) if self.use_rag else 0
-            
-            return scores
+            return scores, missing_fields
             
         except json.JSONDecodeError as e:
             print(f"❌ Parse error: {e}")
             print(f"   Attempted to parse: {json_text[:500]}")
-            return self._fallback_scores()
+            return None, []
         except Exception as e:
             print(f"❌ Unexpected error during parsing: {e}")
             import traceback
             traceback.print_exc()
-            return self._fallback_scores()
+            return None, []
+    
+    def _escalation_reason(self, runs: List[Optional[Dict]]) -> Optional[str]:
+        """
+        Decide si la evaluación del modelo pequeño debe escalar al grande.
+        
+        Returns:
+            Motivo de escalamiento o None si la triage es confiable
+        """
+        if any(scores is None for scores in runs):
+            return "invalid"
+        if any(scores["_missing_fields"] for scores in runs):
+            return "invalid"
+        
+        totals = [sum(float(scores[f]) for f in SCORE_FIELDS) for scores in runs]
+        if max(totals) - min(totals) > self.cascade_max_spread:
+            return "inconsistent"
+        
+        mean_total = sum(totals) / len(totals)
+        if any(abs(mean_total - boundary) <= self.cascade_margin for boundary in self.cascade_boundaries):
+            return "boundary"
+        
+        return None
+    
+    async def _evaluate_cascade(self, prompt: str) -> Tuple[Dict, Optional[Dict]]:
+        """
+        Cascada: el modelo pequeño evalúa primero (varias corridas) y solo se
+        escala al modelo grande si la respuesta es inválida, está cerca de un
+        límite de nota o las corridas no coinciden.
+        """
+        start = time.perf_counter()
+        runs = []
+        result = {}
+        # Corridas secuenciales: son prompts idénticos que NO deben agruparse
+        for _ in range(self.cascade_runs):
+            result, scores = await self._generate_scores(prompt, self.triage_model, "triage")
+            runs.append(scores)
+            if scores is None:
+                break
+        triage_seconds = time.perf_counter() - start
+        
+        reason = self._escalation_reason(runs)
+        stats = self.cascade_stats
+        stats["evaluations"] += 1
+        stats["triage_seconds"] += triage_seconds
+        
+        if reason is None:
+            # Promediar las corridas; el feedback es el de la primera
+            scores = runs[0]
+            for field in SCORE_FIELDS:
+                scores[field] = round(sum(float(r[field]) for r in runs) / len(runs), 2)
+            if stats["large_calls"]:
+                avg_large = stats["large_seconds"] / stats["large_calls"]
+                stats["saved_seconds"] += max(0.0, avg_large - triage_seconds)
+            scores["_cascade"] = {"escalated": False, "triage_model": self.triage_model, "runs": len(runs)}
+            self._log_cascade(f"resolved by {self.triage_model} in {triage_seconds:.1f}s")
+            return result, scores
+        
+        stats["escalated"] += 1
+        stats["reasons"][reason] = stats["reasons"].get(reason, 0) + 1
+        
+        large_start = time.perf_counter()
+        result, scores = await self._generate_scores(prompt, self.model, "escalation")
+        large_seconds = time.perf_counter() - large_start
+        stats["large_calls"] += 1
+        stats["large_seconds"] += large_seconds
+        
+        if scores is not None:
+            scores["_cascade"] = {
+                "escalated": True,
+                "reason": reason,
+                "triage_model": self.triage_model,
+                "runs": len(runs)
+            }
+        self._log_cascade(f"escalated to {self.model} ({reason}), "
+                          f"triage {triage_seconds:.1f}s + large {large_seconds:.1f}s")
+        return result, scores
+    
+    def _log_cascade(self, message: str):
+        stats = self.cascade_stats
+        rate = stats["escalated"] / stats["evaluations"] * 100 if stats["evaluations"] else 0
+        print(f"🪜 Cascade: {message}")
+        print(f"   Escalation rate: {rate:.1f}% ({stats['escalated']}/{stats['evaluations']}), "
+              f"reasons: {stats['reasons']}, estimated time saved: {stats['saved_seconds']:.0f}s")
     
     def _fallback_scores(self) -> Dict:
         """Default scores when evaluation fails"""
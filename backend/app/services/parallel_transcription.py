@@ -0,0 +1,232 @@
+"""
+Transcripción segmentada por VAD y en paralelo.
+Detecta voz por energía sobre el PCM ya decodificado (16 kHz mono), descarta
+el silencio, arma segmentos de duración acotada y los transcribe en un pool
+de procesos con el modelo precargado en cada worker. Los timestamps de cada
+segmento se desplazan a su posición en el audio original.
+
+Ubicación: backend/app/services/parallel_transcription.py
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Duración máxima de cada segmento (Whisper trabaja en ventanas de 30 s)
+WHISPER_SEGMENT_SECONDS = float(os.getenv("WHISPER_SEGMENT_SECONDS", "30"))
+# VAD: margen sobre el piso de ruido (dB) y silencio mínimo para cortar (s)
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "12"))
+VAD_MIN_SILENCE = float(os.getenv("VAD_MIN_SILENCE", "0.6"))
+VAD_MIN_SPEECH = 0.25
+VAD_PADDING = 0.2
+FRAME_MS = 30
+
+
+def detectar_voz(audio: np.ndarray, sr: int = SAMPLE_RATE) -> List[Tuple[float, float]]:
+    """
+    VAD por energía: frames de 30 ms cuyo RMS supera el piso de ruido
+    (percentil 10) en VAD_THRESHOLD_DB. Une regiones separadas por menos de
+    VAD_MIN_SILENCE y descarta las más cortas que VAD_MIN_SPEECH.
+
+    Returns:
+        [(inicio, fin)] en segundos
+    """
+    frame = int(sr * FRAME_MS / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return []
+
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    rms_db = 10 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-10)
+    umbral = max(np.percentile(rms_db, 10) + VAD_THRESHOLD_DB, -50.0)
+    voz = rms_db > umbral
+
+    # Bordes de las rachas de frames con voz
+    cambios = np.diff(np.concatenate(([0], voz.astype(np.int8), [0])))
+    inicios = np.flatnonzero(cambios == 1)
+    fines = np.flatnonzero(cambios == -1)
+
+    frame_s = FRAME_MS / 1000
+    regiones: List[List[float]] = []
+    for i, f in zip(inicios, fines):
+        inicio, fin = i * frame_s, f * frame_s
+        if regiones and inicio - regiones[-1][1] < VAD_MIN_SILENCE:
+            regiones[-1][1] = fin
+        else:
+            regiones.append([inicio, fin])
+
+    duracion = len(audio) / sr
+    return [
+        (max(0.0, inicio - VAD_PADDING), min(duracion, fin + VAD_PADDING))
+        for inicio, fin in regiones
+        if fin - inicio >= VAD_MIN_SPEECH
+    ]
+
+
+def _punto_de_corte(audio: Optional[np.ndarray], desde: float, hasta: float, sr: int = SAMPLE_RATE) -> float:
+    """Frame más silencioso entre desde y hasta (para no cortar una palabra)"""
+    if audio is None:
+        return hasta
+    frame = int(sr * FRAME_MS / 1000)
+    tramo = audio[int(desde * sr):int(hasta * sr)]
+    n_frames = len(tramo) // frame
+    if n_frames == 0:
+        return hasta
+    energia = np.mean(tramo[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1)
+    return desde + (int(np.argmin(energia)) + 0.5) * FRAME_MS / 1000
+
+
+def segmentar(
+    regiones: List[Tuple[float, float]],
+    max_seconds: float = WHISPER_SEGMENT_SECONDS,
+    audio: Optional[np.ndarray] = None
+) -> List[Tuple[float, float]]:
+    """
+    Agrupa regiones de voz consecutivas en segmentos de hasta max_seconds
+    (menos llamadas al modelo) y parte las regiones más largas, en el punto
+    más silencioso de sus últimos 5 s si se pasa el audio.
+    """
+    segmentos: List[List[float]] = []
+    for inicio, fin in regiones:
+        while fin - inicio > max_seconds:
+            corte = _punto_de_corte(audio, inicio + max_seconds * 0.8, inicio + max_seconds)
+            segmentos.append([inicio, corte])
+            inicio = corte
+        if segmentos and fin - segmentos[-1][0] <= max_seconds:
+            segmentos[-1][1] = fin
+        else:
+            segmentos.append([inicio, fin])
+    return [(inicio, fin) for inicio, fin in segmentos]
+
+
+# ── Worker ────────────────────────────────────────────────
+_worker_backend = None
+
+
+def _init_worker(backend_name: str, model_name: str, compute_type: Optional[str], threads: int):
+    """Carga el modelo una vez por proceso del pool"""
+    global _worker_backend
+    from app.services.whisper_backends import get_backend
+    _worker_backend = get_backend(backend_name, compute_type)
+    _worker_backend.load(model_name, threads)
+
+
+def _transcribir_segmento(audio: np.ndarray, offset: float, language: str, word_timestamps: bool) -> Dict:
+    result = _worker_backend.transcribe(
+        audio,
+        language=language,
+        word_timestamps=word_timestamps,
+        condition_on_previous_text=False
+    )
+    segments = []
+    for segment in result['segments']:
+        segments.append({
+            'start': segment['start'] + offset,
+            'end': segment['end'] + offset,
+            'text': segment['text'],
+            'words': [
+                {**w, 'start': w['start'] + offset, 'end': w['end'] + offset}
+                for w in segment.get('words', [])
+            ]
+        })
+    return {'offset': offset, 'language': result['language'], 'segments': segments}
+
+
+class ParallelTranscriber:
+    """Pool de procesos con Whisper precargado, creado en el primer uso"""
+
+    def __init__(
+        self,
+        model_name: str,
+        backend_name: str = "openai",
+        compute_type: Optional[str] = None,
+        workers: int = WHISPER_WORKERS
+    ):
+        self.model_name = model_name
+        self.backend_name = backend_name
+        self.compute_type = compute_type
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            print(f"🧵 Starting Whisper pool: {self.workers} workers x {threads} threads "
+                  f"({self.model_name}, {self.backend_name})")
+            # spawn: torch no es seguro tras fork
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.backend_name, self.model_name, self.compute_type, threads)
+            )
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def transcribe(
+        self,
+        audio: np.ndarray,
+        language: str = "es",
+        word_timestamps: bool = False,
+        progress: Optional[Callable[[float, float], None]] = None
+    ) -> Dict:
+        """
+        progress(segundos de voz transcritos, segundos de voz totales) se
+        llama cada vez que termina un segmento.
+
+        Returns:
+            Mismo esquema que WhisperService.transcribe (text, language,
+            segments, duration) más las estadísticas del VAD
+        """
+        inicio = time.perf_counter()
+        duracion = len(audio) / SAMPLE_RATE
+        segmentos = segmentar(detectar_voz(audio), audio=audio)
+        voz = sum(fin - ini for ini, fin in segmentos)
+        print(f"🔇 VAD: {len(segmentos)} segments, {voz:.1f}s of speech in {duracion:.1f}s "
+              f"({(1 - voz / duracion) * 100 if duracion else 0:.0f}% silence dropped)")
+
+        pool = self._get_pool()
+        futures = {
+            pool.submit(
+                _transcribir_segmento,
+                audio[int(ini * SAMPLE_RATE):int(fin * SAMPLE_RATE)],
+                ini,
+                language,
+                word_timestamps
+            ): fin - ini
+            for ini, fin in segmentos
+        }
+        partes = []
+        hecho = 0.0
+        for future in as_completed(futures):
+            partes.append(future.result())
+            hecho += futures[future]
+            if progress is not None:
+                progress(hecho, voz)
+        partes.sort(key=lambda p: p['offset'])
+
+        segments = [s for parte in partes for s in parte['segments']]
+        print(f"✅ Parallel transcription: {len(segments)} segments in {time.perf_counter() - inicio:.1f}s")
+        return {
+            'text': "".join(s['text'] for s in segments).strip(),
+            'language': partes[0]['language'] if partes else language,
+            'segments': segments,
+            'duration': duracion,
+            'word_timestamps': word_timestamps,
+            'vad': {
+                'segments': len(segmentos),
+                'speech_seconds': round(voz, 2),
+                'workers': self.workers
+            }
+        }
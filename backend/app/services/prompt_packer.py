@@ -0,0 +1,315 @@
+"""
+Empaquetado de código para el prompt de evaluación.
+Filtra archivos generados, comprime el C# (usings, comentarios, líneas vacías;
+los demás lenguajes solo pierden las líneas vacías),
+ordena los archivos por relevancia a los requisitos y llena un presupuesto
+de tokens medido con el tokenizer del modelo.
+
+Ubicación: backend/app/services/prompt_packer.py
+"""
+
+import math
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+# Presupuestos en tokens (reemplazan a code[:1500] / requirements[:800])
+PROMPT_CODE_TOKENS = int(os.getenv("PROMPT_CODE_TOKENS", "1500"))
+PROMPT_REQUIREMENTS_TOKENS = int(os.getenv("PROMPT_REQUIREMENTS_TOKENS", "300"))
+PROMPT_TRANSCRIPT_TOKENS = int(os.getenv("PROMPT_TRANSCRIPT_TOKENS", "400"))
+# Tokenizer de HuggingFace equivalente al modelo de Ollama (repo id o ruta local).
+# Si no está disponible se usa una estimación por caracteres.
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "")
+CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "3.5"))
+
+# Mismos criterios que entrenamiento/dataset_extractor/extraer_dataset.py
+ARCHIVOS_EXCLUIR = ('.designer.cs', '.g.cs', '.g.i.cs', 'assemblyinfo.cs')
+CARPETAS_EXCLUIR = {'bin', 'obj', '.vs', 'properties', 'packages', '.git', 'debug', 'release'}
+
+# Mínimo de tokens restantes para incluir un archivo truncado
+MIN_CHUNK_TOKENS = 64
+MARCA_TRUNCADO = "\n// ... (archivo truncado)"
+# Entre archivos empaquetados (también cuenta contra el presupuesto)
+SEPARADOR = "\n\n"
+
+_USING_RE = re.compile(r'^\s*(global\s+)?using\s+(static\s+)?[\w.]+(\s*=\s*[\w.<>, ]+)?\s*;\s*$')
+_REGION_RE = re.compile(r'^\s*#\s*(region|endregion)\b')
+_WORD_RE = re.compile(r'[A-Za-z][A-Za-z0-9]*')
+_CAMEL_RE = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+_FILE_HEADER_RE = re.compile(r'^// File: (.+)$', re.MULTILINE)
+
+PALABRAS_IGNORAR = {
+    # C#
+    'using', 'public', 'private', 'protected', 'internal', 'class', 'void', 'static',
+    'string', 'return', 'this', 'null', 'true', 'false', 'new', 'var', 'int', 'bool',
+    'object', 'sender', 'event', 'args', 'namespace', 'system', 'else', 'for', 'foreach',
+    'while', 'partial', 'readonly', 'get', 'set', 'value', 'double', 'decimal',
+    # Español
+    'que', 'los', 'las', 'una', 'con', 'por', 'para', 'del', 'debe', 'cada', 'como',
+    'sus', 'este', 'esta', 'ser', 'son', 'mas', 'sin', 'sobre', 'tambien', 'cuando',
+}
+
+
+def _normalizar(texto: str) -> str:
+    """Quita tildes para que 'Categoría' y 'Categoria' coincidan"""
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+
+
+def extraer_terminos(texto: str) -> set:
+    """Tokeniza identificadores (separando camelCase) y palabras del enunciado"""
+    terminos = set()
+    for palabra in _WORD_RE.findall(_normalizar(texto)):
+        for parte in _CAMEL_RE.findall(palabra):
+            parte = parte.lower()
+            if len(parte) > 2 and parte not in PALABRAS_IGNORAR:
+                terminos.add(parte)
+    return terminos
+
+
+def es_archivo_ruido(filename: str) -> bool:
+    """True para archivos generados o de carpetas de build"""
+    ruta = filename.replace('\\', '/')
+    nombre = ruta.rsplit('/', 1)[-1].lower()
+    if nombre.endswith(ARCHIVOS_EXCLUIR):
+        return True
+    partes = [p.lower() for p in ruta.split('/')[:-1]]
+    return any(p in CARPETAS_EXCLUIR for p in partes)
+
+
+def quitar_comentarios(code: str) -> str:
+    """
+    Elimina comentarios // y /* */ respetando literales de cadena y carácter
+    (incluye cadenas verbatim @"...").
+    """
+    out = []
+    i, n = 0, len(code)
+    while i < n:
+        c = code[i]
+        nxt = code[i + 1] if i + 1 < n else ''
+        if c == '/' and nxt == '/':
+            fin = code.find('\n', i)
+            i = n if fin == -1 else fin
+        elif c == '/' and nxt == '*':
+            fin = code.find('*/', i + 2)
+            i = n if fin == -1 else fin + 2
+        elif c == '@' and nxt == '"':
+            # Verbatim: "" es una comilla escapada
+            j = i + 2
+            while j < n:
+                if code[j] == '"':
+                    if j + 1 < n and code[j + 1] == '"':
+                        j += 2
+                        continue
+                    break
+                j += 1
+            out.append(code[i:j + 1])
+            i = j + 1
+        elif c in ('"', "'"):
+            j = i + 1
+            while j < n and code[j] != c and code[j] != '\n':
+                j += 2 if code[j] == '\\' else 1
+            out.append(code[i:j + 1])
+            i = j + 1
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out)
+
+
+def comprimir_csharp(code: str) -> str:
+    """Quita usings, comentarios, #region, indentación y líneas vacías"""
+    lineas = []
+    for linea in quitar_comentarios(code).splitlines():
+        if _USING_RE.match(linea) or _REGION_RE.match(linea):
+            continue
+        linea = linea.strip()
+        if linea:
+            lineas.append(linea)
+    return '\n'.join(lineas)
+
+
+def quitar_lineas_vacias(code: str) -> str:
+    """Sin líneas vacías ni espacios finales; la indentación se conserva (Python)"""
+    return '\n'.join(linea.rstrip() for linea in code.splitlines() if linea.strip())
+
+
+def comprimir(nombre: str, code: str) -> str:
+    """
+    Comprime según el lenguaje: las reglas de C# solo se aplican a .cs (en
+    Python, '//' es división entera y '#' no es #region). Sin nombre (código
+    concatenado sin cabeceras) se asume C#, como en el resto del pipeline.
+    """
+    if not nombre or nombre.lower().endswith('.cs'):
+        return comprimir_csharp(code)
+    return quitar_lineas_vacias(code)
+
+
+def separar_archivos(code: str) -> Dict[str, str]:
+    """
+    Reconstruye el conjunto de archivos a partir del texto concatenado
+    por EvaluationPipeline ('// File: nombre').
+    """
+    cabeceras = list(_FILE_HEADER_RE.finditer(code))
+    if not cabeceras:
+        return {"": code}
+    archivos = {}
+    for idx, match in enumerate(cabeceras):
+        fin = cabeceras[idx + 1].start() if idx + 1 < len(cabeceras) else len(code)
+        archivos[match.group(1).strip()] = code[match.end():fin]
+    return archivos
+
+
+class PromptPacker:
+    """
+    Selecciona el código a incluir en el prompt dentro de un presupuesto de tokens.
+    """
+
+    def __init__(self):
+        self.tokenizer_name = PROMPT_TOKENIZER
+        self._tokenizer = None
+        self._tokenizer_loaded = False
+
+    def _get_tokenizer(self):
+        """Carga perezosa del tokenizer (transformers ya es dependencia del backend)"""
+        if not self._tokenizer_loaded:
+            self._tokenizer_loaded = True
+            if self.tokenizer_name:
+                try:
+                    from transformers import AutoTokenizer
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+                    print(f"✅ PromptPacker: tokenizer {self.tokenizer_name} cargado")
+                except Exception as e:
+                    print(f"⚠️ PromptPacker: no se pudo cargar {self.tokenizer_name}: {e}")
+                    print(f"   Usando estimación de {CHARS_PER_TOKEN} caracteres por token")
+        return self._tokenizer
+
+    def count_tokens(self, texto: str) -> int:
+        """Cuenta tokens con el tokenizer del modelo (o estimación)"""
+        if not texto:
+            return 0
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            return len(tokenizer.encode(texto, add_special_tokens=False))
+        return math.ceil(len(texto) / CHARS_PER_TOKEN)
+
+    def truncar(self, texto: str, max_tokens: int) -> str:
+        """Trunca por líneas completas hasta entrar en max_tokens"""
+        if self.count_tokens(texto) <= max_tokens:
+            return texto
+        lineas = texto.splitlines()
+        lo, hi = 0, len(lineas)
+        # Búsqueda binaria del mayor prefijo de líneas que cabe
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.count_tokens('\n'.join(lineas[:mid])) <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        if lo == 0:
+            # Una sola línea enorme (p. ej. la transcripción de Whisper):
+            # mayor prefijo de caracteres que cabe, medido con el tokenizer
+            return self._truncar_caracteres(lineas[0] if lineas else texto, max_tokens)
+        return '\n'.join(lineas[:lo])
+
+    def _truncar_caracteres(self, texto: str, max_tokens: int) -> str:
+        lo, hi = 0, len(texto)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.count_tokens(texto[:mid]) <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        return texto[:lo]
+
+    def pack_requirements(self, requirements: str) -> str:
+        """Recorta los requisitos al presupuesto de tokens"""
+        return self.truncar((requirements or "").strip(), PROMPT_REQUIREMENTS_TOKENS)
+
+    def pack_transcript(self, transcript: str) -> str:
+        """Recorta la transcripción del video al presupuesto de tokens"""
+        return self.truncar((transcript or "").strip(), PROMPT_TRANSCRIPT_TOKENS)
+
+    def rank_files(self, files: Dict[str, str], requirements: str) -> List[Tuple[float, str, str]]:
+        """
+        Ordena archivos (ya comprimidos) por relevancia a los requisitos:
+        términos compartidos con el enunciado, con peso extra si coinciden con el nombre.
+        """
+        terminos_req = extraer_terminos(requirements or "")
+        ranked = []
+        for orden, (nombre, contenido) in enumerate(files.items()):
+            coincidencias = len(terminos_req & extraer_terminos(contenido))
+            coincidencias_nombre = len(terminos_req & extraer_terminos(os.path.basename(nombre)))
+            score = coincidencias + 2 * coincidencias_nombre
+            ranked.append((score, -orden, nombre, contenido))
+        ranked.sort(reverse=True)
+        return [(score, nombre, contenido) for score, _, nombre, contenido in ranked]
+
+    def pack(
+        self,
+        files: Dict[str, str],
+        requirements: str,
+        budget: Optional[int] = None
+    ) -> Dict:
+        """
+        Empaqueta el conjunto de archivos dentro del presupuesto.
+
+        Returns:
+            Dict con el código empaquetado y estadísticas
+        """
+        budget = budget or PROMPT_CODE_TOKENS
+
+        comprimidos = {}
+        descartados = 0
+        for nombre, contenido in files.items():
+            if nombre and es_archivo_ruido(nombre):
+                descartados += 1
+                continue
+            compacto = comprimir(nombre, contenido)
+            if compacto:
+                comprimidos[nombre] = compacto
+
+        # Archivos completos por relevancia; uno que no cabe no corta la
+        # lista: los siguientes (más chicos) pueden caber todavía
+        partes = {}
+        omitidos = []
+        usados = 0
+        costo_separador = self.count_tokens(SEPARADOR)
+        for orden, (score, nombre, contenido) in enumerate(self.rank_files(comprimidos, requirements)):
+            bloque = f"// File: {nombre}\n{contenido}" if nombre else contenido
+            costo = self.count_tokens(bloque) + (costo_separador if partes else 0)
+            if costo <= budget - usados:
+                partes[orden] = bloque
+                usados += costo
+            else:
+                omitidos.append((orden, bloque))
+
+        # Lo que sobra: el más relevante de los omitidos, truncado
+        separador = costo_separador if partes else 0
+        restante = budget - usados - separador - self.count_tokens(MARCA_TRUNCADO)
+        if omitidos and restante >= MIN_CHUNK_TOKENS:
+            orden, bloque = omitidos[0]
+            truncado = self.truncar(bloque, restante)
+            partes[orden] = truncado + MARCA_TRUNCADO
+            usados += separador + self.count_tokens(truncado + MARCA_TRUNCADO)
+
+        stats = {
+            "files_total": len(files),
+            "files_noise": descartados,
+            "files_included": len(partes),
+            "tokens_used": usados,
+            "token_budget": budget,
+            "tokenizer": self.tokenizer_name if self._tokenizer is not None else "estimate",
+        }
+        print(f"📦 PromptPacker: {stats['files_included']}/{stats['files_total']} archivos, "
+              f"{usados}/{budget} tokens ({descartados} generados descartados)")
+
+        return {"code": SEPARADOR.join(partes[orden] for orden in sorted(partes)), "stats": stats}
+
+    def pack_code(self, code: str, requirements: str, budget: Optional[int] = None) -> Dict:
+        """Igual que pack() pero a partir del código concatenado"""
+        return self.pack(separar_archivos(code), requirements, budget)
+
+
+# Singleton
+prompt_packer = PromptPacker()
@@ -0,0 +1,441 @@
+"""
+Índices de recuperación para el RAG.
+Se construyen una sola vez al cargar el dataset; las consultas solo
+recorren las listas de postings de sus términos.
+
+Ubicación: backend/app/services/rag_index.py
+"""
+
+import fcntl
+import hashlib
+import heapq
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Keywords de C# ignoradas por la búsqueda por palabras clave
+STOPWORDS_KEYWORDS = {
+    'using', 'public', 'private', 'class', 'void', 'static', 'string',
+    'return', 'this', 'null', 'true', 'false'
+}
+
+
+def tokenizar_keywords(texto: str) -> set:
+    """Términos de la búsqueda por keywords: palabras de más de 3 caracteres sin keywords de C#"""
+    terminos = set()
+    for palabra in texto.lower().split():
+        if len(palabra) > 3 and palabra not in STOPWORDS_KEYWORDS:
+            terminos.add(palabra)
+    return terminos
+
+
+_SEMANA_RE = re.compile(r'\b(?:semana|week|sem|s)\s*[-_#.]?\s*0*(\d{1,2})\b', re.IGNORECASE)
+
+
+def normalizar_semana(texto: Optional[str]) -> Optional[str]:
+    """
+    Número de semana de una carpeta del dataset o del título de una tarea
+    ("Semana 05", "S5", "Sem-5 - Formularios" -> "5"). None si no hay.
+    """
+    if not texto:
+        return None
+    texto = str(texto)
+    if texto.strip().isdigit():
+        return str(int(texto.strip()))
+    m = _SEMANA_RE.search(texto)
+    return str(int(m.group(1))) if m else None
+
+
+def particiones(valores: List[Optional[str]]) -> Dict[str, np.ndarray]:
+    """Valor -> doc_ids (int32) que lo tienen; los None no forman partición"""
+    grupos: Dict[str, List[int]] = {}
+    for doc_id, valor in enumerate(valores):
+        if valor is not None:
+            grupos.setdefault(valor, []).append(doc_id)
+    return {valor: np.asarray(ids, dtype=np.int32) for valor, ids in grupos.items()}
+
+
+def rrf(rankings: List[np.ndarray], k: int = 60) -> Dict[int, float]:
+    """Reciprocal Rank Fusion: suma de 1 / (k + posición) de cada ranking"""
+    fusion: Dict[int, float] = {}
+    for ranking in rankings:
+        for posicion, doc_id in enumerate(ranking.tolist(), 1):
+            fusion[doc_id] = fusion.get(doc_id, 0.0) + 1.0 / (k + posicion)
+    return fusion
+
+
+class KeywordIndex:
+    """
+    Índice invertido término -> documentos.
+    El puntaje de un documento es el número de términos de la consulta que contiene.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, List[int]] = {}
+        self.num_docs = 0
+
+    def add(self, doc_id: int, texto: str):
+        for termino in tokenizar_keywords(texto):
+            self.postings.setdefault(termino, []).append(doc_id)
+        self.num_docs = max(self.num_docs, doc_id + 1)
+
+    @classmethod
+    def build(cls, textos: Iterable[str]) -> "KeywordIndex":
+        index = cls()
+        for doc_id, texto in enumerate(textos):
+            index.add(doc_id, texto)
+        return index
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, int]]:
+        """
+        Returns:
+            [(doc_id, coincidencias)] de mayor a menor, solo con coincidencias > 0
+        """
+        conteo = Counter()
+        for termino in tokenizar_keywords(query):
+            docs = self.postings.get(termino)
+            if docs:
+                conteo.update(docs)
+        # Desempate estable por doc_id (mismo orden que el dataset)
+        mejores = heapq.nsmallest(limit, conteo.items(), key=lambda item: (-item[1], item[0]))
+        return mejores
+
+
+# Palabras reservadas y tipos comunes de C# (ruido para BM25)
+CSHARP_KEYWORDS = {
+    'abstract', 'as', 'base', 'bool', 'break', 'byte', 'case', 'catch', 'char', 'checked',
+    'class', 'const', 'continue', 'decimal', 'default', 'delegate', 'do', 'double', 'else',
+    'enum', 'event', 'explicit', 'extern', 'false', 'finally', 'fixed', 'float', 'for',
+    'foreach', 'goto', 'if', 'implicit', 'in', 'int', 'interface', 'internal', 'is', 'lock',
+    'long', 'namespace', 'new', 'null', 'object', 'operator', 'out', 'override', 'params',
+    'private', 'protected', 'public', 'readonly', 'ref', 'return', 'sbyte', 'sealed', 'short',
+    'sizeof', 'stackalloc', 'static', 'string', 'struct', 'switch', 'this', 'throw', 'true',
+    'try', 'typeof', 'uint', 'ulong', 'unchecked', 'unsafe', 'ushort', 'using', 'virtual',
+    'void', 'volatile', 'while', 'var', 'get', 'set', 'value', 'partial', 'async', 'await',
+    'system', 'sender', 'args', 'eventargs', 'file',
+}
+
+_IDENT_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_CAMEL_RE = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+')
+
+
+def tokenizar_csharp(texto: str) -> List[str]:
+    """
+    Tokenizer para código C#: separa identificadores en camelCase/snake_case
+    (btnAgregarProducto_Click -> btn, agregar, producto, click), pasa a
+    minúsculas y descarta keywords del lenguaje. Conserva repeticiones (tf).
+    """
+    tokens = []
+    for ident in _IDENT_RE.findall(texto):
+        for parte in _CAMEL_RE.findall(ident):
+            parte = parte.lower()
+            if len(parte) > 2 and parte not in CSHARP_KEYWORDS:
+                tokens.append(parte)
+    return tokens
+
+
+class BM25Index:
+    """
+    BM25 con estadísticas precalculadas.
+    Las postings se guardan en formato CSR (indptr / doc_ids / weights) como
+    arrays de NumPy, con el peso BM25 de cada (término, documento) ya calculado:
+    puntuar una consulta es concatenar sus postings y sumar con bincount.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float32)
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self.num_docs = 0
+
+    @classmethod
+    def build(
+        cls,
+        textos: Iterable[str],
+        k1: float = 1.2,
+        b: float = 0.75,
+        referencia: Optional["BM25Index"] = None
+    ) -> "BM25Index":
+        """
+        referencia: índice de otro segmento del mismo corpus; su df, número de
+        documentos y longitud media se suman a los de este, así los puntajes de
+        un segmento pequeño son comparables con los del grande.
+        """
+        index = cls(k1, b)
+        vocab: Dict[str, int] = {}
+        term_docs: List[List[int]] = []
+        term_tfs: List[List[int]] = []
+        lengths = []
+
+        for doc_id, texto in enumerate(textos):
+            tokens = tokenizar_csharp(texto)
+            lengths.append(len(tokens))
+            for termino, tf in Counter(tokens).items():
+                term_id = vocab.get(termino)
+                if term_id is None:
+                    term_id = vocab[termino] = len(term_docs)
+                    term_docs.append([])
+                    term_tfs.append([])
+                term_docs[term_id].append(doc_id)
+                term_tfs[term_id].append(tf)
+
+        index.vocab = vocab
+        index.num_docs = len(lengths)
+        index.doc_lengths = np.asarray(lengths, dtype=np.int32)
+        if not vocab:
+            return index
+
+        df = np.fromiter((len(d) for d in term_docs), dtype=np.int64, count=len(term_docs))
+        index.indptr = np.concatenate(([0], np.cumsum(df)))
+        index.doc_ids = np.fromiter((d for docs in term_docs for d in docs), dtype=np.int32, count=int(df.sum()))
+        tf = np.fromiter((t for tfs in term_tfs for t in tfs), dtype=np.float32, count=int(df.sum()))
+
+        n = index.num_docs
+        total_length = float(index.doc_lengths.sum())
+        df_total = df
+        if referencia is not None and referencia.num_docs:
+            df_ref = np.diff(referencia.indptr)
+            df_total = df.copy()
+            for termino, term_id in vocab.items():
+                ref_id = referencia.vocab.get(termino)
+                if ref_id is not None:
+                    df_total[term_id] += df_ref[ref_id]
+            n += referencia.num_docs
+            total_length += float(referencia.doc_lengths.sum())
+        index.idf = np.log(1 + (n - df_total + 0.5) / (df_total + 0.5)).astype(np.float32)
+        avgdl = max(1.0, total_length / max(1, n))
+        dl = index.doc_lengths[index.doc_ids].astype(np.float32)
+        idf_por_posting = np.repeat(index.idf, df)
+        index.weights = (
+            idf_por_posting * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        ).astype(np.float32)
+        return index
+
+    def query_term_ids(self, query: str) -> List[int]:
+        """Términos únicos de la consulta presentes en el vocabulario"""
+        return [self.vocab[t] for t in set(tokenizar_csharp(query)) if t in self.vocab]
+
+    def score(self, query: str, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Puntaje BM25 de todos los documentos (vector de tamaño num_docs) o
+        solo de `candidates` (mismo orden que candidates): las postings de
+        otros documentos se descartan antes de sumar.
+        """
+        n = self.num_docs if candidates is None else len(candidates)
+        term_ids = self.query_term_ids(query)
+        if not term_ids or n == 0:
+            return np.zeros(n, dtype=np.float32)
+        slices = [slice(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        if candidates is None:
+            return np.bincount(docs, weights=weights, minlength=self.num_docs).astype(np.float32)
+
+        # Posición de cada posting entre los candidatos (búsqueda binaria sobre
+        # los candidatos ordenados; las particiones ya vienen ordenadas)
+        candidates = np.asarray(candidates)
+        orden = np.argsort(candidates, kind="stable")
+        ordenados = candidates[orden]
+        pos = np.minimum(np.searchsorted(ordenados, docs), n - 1)
+        dentro = ordenados[pos] == docs
+        return np.bincount(orden[pos[dentro]], weights=weights[dentro], minlength=n).astype(np.float32)
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """
+        Returns:
+            [(doc_id, score)] de mayor a menor, solo con score > 0
+        """
+        return top_k(self.score(query), limit)
+
+
+def top_k(scores: np.ndarray, limit: int) -> List[Tuple[int, float]]:
+    """Top-k con argpartition (O(n)) y orden solo de los k elegidos"""
+    if scores.size == 0 or limit <= 0:
+        return []
+    k = min(limit, scores.size)
+    candidatos = np.argpartition(-scores, k - 1)[:k]
+    candidatos = candidatos[np.argsort(-scores[candidatos], kind="stable")]
+    return [(int(i), float(scores[i])) for i in candidatos if scores[i] > 0]
+
+
+class CodeEmbedder:
+    """
+    Embeddings de código con el mismo modelo y preprocesamiento que
+    entrenamiento/dataset_extractor/cargar_pgvector.py (truncado a 8000
+    caracteres, ajuste a la dimensión de la tabla). Cachea por hash del contenido.
+    """
+
+    def __init__(self, model_name: str, dimension: int = 768, cache_size: int = 512):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.cache_size = cache_size
+        self.model = None
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def initialize(self):
+        if self.model is None:
+            with self._lock:
+                if self.model is None:
+                    print(f"📥 Loading RAG embedding model: {self.model_name}")
+                    from sentence_transformers import SentenceTransformer
+                    self.model = SentenceTransformer(self.model_name)
+                    print("✅ RAG embedding model loaded")
+
+    def _ajustar(self, embeddings: np.ndarray) -> np.ndarray:
+        """Padding/truncado a la dimensión de la tabla (como cargar_pgvector.py)"""
+        dim = embeddings.shape[1]
+        if dim < self.dimension:
+            embeddings = np.pad(embeddings, ((0, 0), (0, self.dimension - dim)))
+        return embeddings[:, :self.dimension].astype(np.float32)
+
+    def encode_batch(self, codigos: List[str], batch_size: int = 16) -> np.ndarray:
+        """Embeddings sin normalizar de varios códigos (matriz n x dimension)"""
+        self.initialize()
+        truncados = [c[:8000] for c in codigos]
+        embeddings = self.model.encode(
+            truncados, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False
+        )
+        return self._ajustar(np.atleast_2d(embeddings))
+
+    def encode(self, codigo: str) -> Tuple[np.ndarray, bool]:
+        """
+        Returns:
+            (embedding, True si vino de la caché)
+        """
+        key = hashlib.sha256(codigo.encode("utf-8")).hexdigest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached, True
+
+        embedding = self.encode_batch([codigo])[0]
+        with self._lock:
+            self._cache[key] = embedding
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return embedding, False
+
+
+def hash_archivo(path: str) -> str:
+    """sha256 del contenido de un archivo (lectura por bloques)"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class VectorIndex:
+    """
+    Embeddings del corpus normalizados (filas de norma 1) en un .npy junto al
+    dataset.jsonl, abierto con memory-map: los workers de uvicorn comparten las
+    mismas páginas a través de la caché del sistema operativo.
+    Un .json al lado guarda el hash del dataset y el modelo; si no coinciden
+    se reconstruye.
+    """
+
+    BLOCK_ROWS = 8192
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+        self.num_docs = matrix.shape[0]
+
+    @staticmethod
+    def paths(dataset_path: str) -> Tuple[str, str]:
+        base, _ = os.path.splitext(dataset_path)
+        return f"{base}.embeddings.npy", f"{base}.embeddings.json"
+
+    @classmethod
+    def load_or_build(
+        cls,
+        dataset_path: str,
+        textos: Callable[[], List[str]],
+        embedder: "CodeEmbedder",
+        dtype: str = "float16"
+    ) -> "VectorIndex":
+        npy_path, meta_path = cls.paths(dataset_path)
+        esperado = {
+            "dataset_sha256": hash_archivo(dataset_path),
+            "model": embedder.model_name,
+            "dimension": embedder.dimension,
+            "dtype": dtype
+        }
+
+        # Un solo proceso construye; los demás esperan el lock y luego cargan
+        with open(f"{npy_path}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                meta = None
+                if os.path.exists(npy_path) and os.path.exists(meta_path):
+                    with open(meta_path, 'r', encoding='utf-8') as f:
+                        meta = json.load(f)
+                if meta is None or any(meta.get(k) != v for k, v in esperado.items()):
+                    cls._build(npy_path, meta_path, textos(), embedder, dtype, esperado)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        index = cls(np.load(npy_path, mmap_mode='r'))
+        print(f"✅ RAG vector index: {index.num_docs} embeddings ({dtype}, mmap)")
+        return index
+
+    @staticmethod
+    def embeddings_normalizados(textos: List[str], embedder: "CodeEmbedder") -> np.ndarray:
+        if not textos:
+            return np.zeros((0, embedder.dimension), dtype=np.float32)
+        matrix = embedder.encode_batch(textos)
+        normas = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(normas, 1e-12)
+
+    @staticmethod
+    def _build(npy_path: str, meta_path: str, textos: List[str], embedder: "CodeEmbedder", dtype: str, meta: Dict):
+        print(f"🔄 Construyendo índice vectorial RAG ({len(textos)} documentos)...")
+        inicio = time.perf_counter()
+        matrix = VectorIndex.embeddings_normalizados(textos, embedder)
+
+        # Escritura atómica: los lectores nunca ven un archivo a medias
+        tmp_npy = f"{npy_path}.tmp.npy"
+        np.save(tmp_npy, matrix.astype(dtype))
+        os.replace(tmp_npy, npy_path)
+        tmp_meta = f"{meta_path}.tmp"
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump({**meta, "count": len(textos)}, f)
+        os.replace(tmp_meta, meta_path)
+        print(f"✅ Índice vectorial guardado en {npy_path} ({time.perf_counter() - inicio:.1f}s)")
+
+    def score(self, query: np.ndarray, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Similitud coseno con el embedding de la consulta: de todos los documentos
+        o solo de `candidates` (mismo orden que candidates).
+        """
+        n = self.num_docs if candidates is None else len(candidates)
+        norma = np.linalg.norm(query)
+        if n == 0 or norma == 0:
+            return np.zeros(n, dtype=np.float32)
+        q = (query / norma).astype(np.float32)
+        if candidates is not None:
+            # Solo se tocan las filas de los candidatos
+            return self.matrix[candidates].astype(np.float32) @ q
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ q
+        # float16 no usa BLAS: se convierte por bloques para acotar la memoria temporal
+        scores = np.empty(n, dtype=np.float32)
+        for inicio in range(0, n, self.BLOCK_ROWS):
+            bloque = self.matrix[inicio:inicio + self.BLOCK_ROWS]
+            scores[inicio:inicio + len(bloque)] = bloque.astype(np.float32) @ q
+        return scores
+
+    def search(self, query: np.ndarray, limit: int) -> List[Tuple[int, float]]:
+        return top_k(self.score(query), limit)
@@ -0,0 +1,156 @@
+"""
+Ingesta incremental de evaluaciones revisadas por el docente al corpus RAG.
+Cada cierto tiempo busca Grades revisados con puntajes finales que aún no
+están en el corpus, arma el ejemplo en el formato de dataset.jsonl y lo
+agrega a RAGService sin reiniciar ni reconstruir índices.
+
+Ubicación: backend/app/services/rag_ingestion.py
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.db.session import SessionLocal
+from app.models.models import Grade, Feedback, Submission
+from app.services.evaluation_pipeline import EvaluationPipeline
+from app.services.rag_index import normalizar_semana
+from app.services.rag_service import rag_service
+
+RAG_INGEST = os.getenv("RAG_INGEST", "true").lower() == "true"
+RAG_INGEST_INTERVAL = int(os.getenv("RAG_INGEST_INTERVAL", "300"))
+# Compactar cuando haya al menos N segmentos incrementales
+RAG_COMPACT_SEGMENTS = int(os.getenv("RAG_COMPACT_SEGMENTS", "8"))
+# Grades cuyo código no se pudo extraer: reintentos con backoff exponencial
+RAG_INGEST_MAX_RETRIES = int(os.getenv("RAG_INGEST_MAX_RETRIES", "5"))
+# "published" también pasó por la revisión del docente
+ESTADOS_REVISADOS = ("reviewed", "published")
+
+# grade_id -> (intentos fallidos, momento del próximo intento)
+_fallidos: Dict[int, Tuple[int, float]] = {}
+
+
+def _debe_intentar(grade_id: int) -> bool:
+    intentos, proximo = _fallidos.get(grade_id, (0, 0.0))
+    return intentos < RAG_INGEST_MAX_RETRIES and time.monotonic() >= proximo
+
+
+def _registrar_fallo(grade_id: int, motivo: str):
+    intentos = _fallidos.get(grade_id, (0, 0.0))[0] + 1
+    _fallidos[grade_id] = (intentos, time.monotonic() + RAG_INGEST_INTERVAL * 2 ** intentos)
+    if intentos >= RAG_INGEST_MAX_RETRIES:
+        print(f"⚠️ RAG: grade {grade_id} descartado tras {intentos} intentos ({motivo})")
+    else:
+        print(f"⚠️ RAG: grade {grade_id} no ingestado ({motivo}), reintento {intentos}/{RAG_INGEST_MAX_RETRIES}")
+
+
+def _puntajes_finales(grade: Grade) -> Optional[Dict[str, float]]:
+    rubrica = {
+        "comprension": grade.final_comprehension_score,
+        "diseno": grade.final_design_score,
+        "implementacion": grade.final_implementation_score,
+        "funcionalidad": grade.final_functionality_score
+    }
+    if any(v is None for v in rubrica.values()):
+        return None
+    return {k: round(float(v), 2) for k, v in rubrica.items()}
+
+
+def _feedback(db, grade: Grade) -> str:
+    partes = []
+    feedback = db.query(Feedback).filter(Feedback.grade_id == grade.grade_id).first()
+    if feedback and feedback.general_comments:
+        partes.append(feedback.general_comments)
+    if grade.instructor_notes:
+        partes.append(f"Notas del docente: {grade.instructor_notes}")
+    return "\n\n".join(partes) or "Sin feedback"
+
+
+async def construir_ejemplo(db, grade: Grade) -> Optional[Dict]:
+    """Ejemplo con el mismo formato que extraer_dataset.py (o None si falta código o puntajes)"""
+    rubrica = _puntajes_finales(grade)
+    if rubrica is None:
+        return None
+    submission = db.query(Submission).filter(Submission.submission_id == grade.submission_id).first()
+    if not submission:
+        return None
+
+    codigo = await EvaluationPipeline(db)._extract_code_from_zip(submission.project_path)
+    if not codigo:
+        return None
+
+    titulo = submission.assignment.title if submission.assignment else ""
+    return {
+        "id": f"grade_{grade.grade_id}",
+        "grade_id": grade.grade_id,
+        "assignment_id": submission.assignment_id,
+        "seccion": submission.section_id,
+        "semana": normalizar_semana(titulo) or titulo,
+        "nombre_archivo": os.path.basename(submission.project_path or ""),
+        "codigo": codigo,
+        "puntaje_total": round(sum(rubrica.values()), 2),
+        "rubrica": rubrica,
+        "feedback": _feedback(db, grade)
+    }
+
+
+async def ingestar_revisados() -> int:
+    """
+    Agrega al corpus los Grades revisados que faltan.
+
+    Returns:
+        Número de evaluaciones agregadas
+    """
+    # Lectura del JSONL: fuera del event loop
+    await asyncio.to_thread(rag_service.sincronizar)
+    ingestados = await asyncio.to_thread(rag_service.ids_en_corpus)
+    db = SessionLocal()
+    try:
+        revisados = (
+            db.query(Grade.grade_id)
+            .filter(Grade.status.in_(ESTADOS_REVISADOS))
+            .filter(Grade.final_total_score.isnot(None))
+            .all()
+        )
+        ids = sorted(g for (g,) in revisados if g not in ingestados and _debe_intentar(g))
+        if not ids:
+            return 0
+        pendientes: List[Grade] = db.query(Grade).filter(Grade.grade_id.in_(ids)).order_by(Grade.grade_id).all()
+
+        ejemplos = []
+        for grade in pendientes:
+            try:
+                ejemplo = await construir_ejemplo(db, grade)
+            except Exception as e:
+                _registrar_fallo(grade.grade_id, str(e))
+                continue
+            if ejemplo:
+                _fallidos.pop(grade.grade_id, None)
+                ejemplos.append(ejemplo)
+            else:
+                # Sin código extraíble o sin puntajes finales completos
+                _registrar_fallo(grade.grade_id, "sin código o puntajes")
+        if not ejemplos:
+            return 0
+
+        # Escritura al JSONL + índices del segmento nuevo: fuera del event loop
+        return await asyncio.to_thread(rag_service.agregar_ejemplos, ejemplos)
+    finally:
+        db.close()
+
+
+async def ingest_loop():
+    """Tarea de fondo: ingesta periódica y compactación de segmentos"""
+    print(f"📥 RAG ingest loop started (every {RAG_INGEST_INTERVAL}s)")
+    while True:
+        try:
+            agregados = await ingestar_revisados()
+            if agregados:
+                print(f"📥 RAG: {agregados} evaluaciones revisadas ingestadas")
+            await asyncio.to_thread(rag_service.compactar, RAG_COMPACT_SEGMENTS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ RAG ingest error: {e}")
+        await asyncio.sleep(RAG_INGEST_INTERVAL)
@@ -5,98 +5,629 @@ Usa el dataset.jsonl para encontrar proyectos similares y enriquecer los prompts
 Ubicación: backend/app/services/rag_service.py
 """
 
+import asyncio
+import fcntl
+import heapq
 import json
 import os
-from typing import List, Dict, Optional
+import threading
+import time
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.services.rag_index import (
+    KeywordIndex, BM25Index, CodeEmbedder, VectorIndex,
+    normalizar_semana, particiones, rrf, top_k
+)
 
 # Configuración
 DATASET_PATH = os.getenv("DATASET_PATH", "/app/app/entrenamiento/dataset.jsonl")
+# Recuperador: "bm25", "keyword", "vector" o "hybrid" (en proceso) o "pgvector"
+RAG_RETRIEVER = os.getenv("RAG_RETRIEVER", "bm25")
+# hybrid: posiciones de cada ranking que entran a la fusión RRF y constante k
+RAG_HYBRID_DEPTH = int(os.getenv("RAG_HYBRID_DEPTH", "50"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# Tipo de los embeddings en el .npy del recuperador "vector"
+RAG_VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float16")
+# hybrid: si el encoder o el índice vectorial fallan, solo BM25 durante N segundos
+RAG_VECTOR_RETRY_SECONDS = float(os.getenv("RAG_VECTOR_RETRY_SECONDS", "60"))
+
+# pgvector (tabla cargada con entrenamiento/dataset_extractor/cargar_pgvector.py)
+RAG_PGVECTOR_URL = os.getenv("RAG_PGVECTOR_URL") or get_settings().DATABASE_URL
+RAG_EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "microsoft/codebert-base")
+RAG_EMBEDDING_DIM = 768
+# Listas del índice ivfflat revisadas por consulta (lists = 100 al crear el índice)
+RAG_IVFFLAT_PROBES = int(os.getenv("RAG_IVFFLAT_PROBES", "10"))
+RAG_PGVECTOR_POOL_SIZE = int(os.getenv("RAG_PGVECTOR_POOL_SIZE", "4"))
+RAG_PGVECTOR_TIMEOUT = float(os.getenv("RAG_PGVECTOR_TIMEOUT", "5"))
+# Tras un fallo de conexión, reintentar pgvector después de N segundos
+RAG_PGVECTOR_RETRY_SECONDS = float(os.getenv("RAG_PGVECTOR_RETRY_SECONDS", "60"))
+
+SQL_BUSCAR_SIMILARES = """
+SELECT 
+    id, seccion, semana, nombre_archivo, puntaje_total,
+    rubrica_comprension, rubrica_diseno, rubrica_implementacion, rubrica_funcionalidad,
+    feedback, codigo,
+    1 - (codigo_embedding <=> $1::vector) as similitud
+FROM evaluaciones_historicas
+ORDER BY codigo_embedding <=> $1::vector
+LIMIT $2
+"""
+
+
+class Segmento:
+    """
+    Rango de líneas de un JSONL con sus índices, inmutable una vez construido.
+    No retiene los documentos: solo offsets y columnas pequeñas; el código
+    completo se lee del archivo para los top-k. Los ids son locales al segmento.
+    """
+    
+    def __init__(self, path: str, desde: int = 0, hasta: Optional[int] = None):
+        self.path = path
+        self.desde = desde
+        self.hasta = hasta
+        self.offsets = np.zeros(0, dtype=np.int64)
+        self.lengths = np.zeros(0, dtype=np.int32)
+        self.puntajes = np.zeros(0, dtype=np.float32)
+        self.semanas: List[Optional[str]] = []
+        self.grade_ids: List[int] = []
+        self.particiones_semana: Dict[str, np.ndarray] = {}
+        self.bm25_index = BM25Index()
+        self.keyword_index: Optional[KeywordIndex] = None
+        self.vector_index: Optional[VectorIndex] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def num_docs(self) -> int:
+        return len(self.offsets)
+    
+    def _leer_lineas(self):
+        """(offset, longitud, documento) de cada línea no vacía del rango"""
+        with open(self.path, 'rb') as f:
+            f.seek(self.desde)
+            offset = self.desde
+            for linea in f:
+                if self.hasta is not None and offset >= self.hasta:
+                    break
+                if linea.strip():
+                    yield offset, len(linea), json.loads(linea)
+                offset += len(linea)
+    
+    def codigos(self):
+        for _, _, ejemplo in self._leer_lineas():
+            yield ejemplo.get('codigo', '')
+    
+    @classmethod
+    def desde_jsonl(
+        cls,
+        path: str,
+        desde: int = 0,
+        hasta: Optional[int] = None,
+        referencia: Optional[BM25Index] = None
+    ) -> "Segmento":
+        """
+        Recorre el rango una vez: offsets, puntajes y semanas + índice BM25.
+        referencia: BM25 del dataset base, para que los idf sean comparables.
+        """
+        segmento = cls(path, desde, hasta)
+        offsets, lengths, puntajes, semanas, grade_ids = [], [], [], [], []
+        
+        def codigos():
+            for offset, longitud, ejemplo in segmento._leer_lineas():
+                offsets.append(offset)
+                lengths.append(longitud)
+                puntaje = ejemplo.get('puntaje_total')
+                puntajes.append(puntaje if isinstance(puntaje, (int, float)) else np.nan)
+                semanas.append(normalizar_semana(ejemplo.get('semana')))
+                if ejemplo.get('grade_id') is not None:
+                    grade_ids.append(ejemplo['grade_id'])
+                yield ejemplo.get('codigo', '')
+        
+        # Tokenizar una sola vez: las consultas solo recorren postings
+        segmento.bm25_index = BM25Index.build(codigos(), referencia=referencia)
+        segmento.offsets = np.asarray(offsets, dtype=np.int64)
+        segmento.lengths = np.asarray(lengths, dtype=np.int32)
+        segmento.puntajes = np.asarray(puntajes, dtype=np.float32)
+        segmento.semanas = semanas
+        segmento.grade_ids = grade_ids
+        segmento.particiones_semana = particiones(semanas)
+        return segmento
+    
+    def documentos(self, doc_ids: List[int]) -> List[Dict]:
+        """Lee del JSONL solo las líneas pedidas"""
+        resultados = []
+        with open(self.path, 'rb') as f:
+            for doc_id in doc_ids:
+                f.seek(int(self.offsets[doc_id]))
+                resultados.append(json.loads(f.read(int(self.lengths[doc_id]))))
+        return resultados
+    
+    def get_keyword_index(self) -> KeywordIndex:
+        """Índice de keywords, construido solo si se usa ese recuperador"""
+        if self.keyword_index is None:
+            with self._lock:
+                if self.keyword_index is None:
+                    self.keyword_index = KeywordIndex.build(self.codigos())
+        return self.keyword_index
+    
+    def get_vector_index(self, embedder: CodeEmbedder, persistente: bool) -> VectorIndex:
+        """
+        persistente: .npy memory-mapped junto al JSONL (dataset base).
+        Si no, embeddings en memoria (segmentos de evaluaciones ingestadas).
+        """
+        if self.vector_index is None:
+            with self._lock:
+                if self.vector_index is None:
+                    if persistente:
+                        self.vector_index = VectorIndex.load_or_build(
+                            self.path, lambda: list(self.codigos()), embedder, RAG_VECTOR_DTYPE
+                        )
+                    else:
+                        self.vector_index = VectorIndex(
+                            VectorIndex.embeddings_normalizados(list(self.codigos()), embedder).astype(np.float32)
+                        )
+        return self.vector_index
 
 
 class RAGService:
     """
     Servicio de Retrieval Augmented Generation.
     Busca evaluaciones históricas similares para incluir en el prompt.
+    
+    El corpus es una tupla de segmentos: el dataset base (dataset.jsonl) y
+    segmentos append-only con las evaluaciones revisadas por el docente
+    (ingested.jsonl, ver rag_ingestion.py). Ingestar y compactar publican una
+    tupla nueva con una sola asignación; las consultas leen la tupla vigente
+    al empezar y nunca esperan a un escritor.
     """
     
-    def __init__(self):
-        self.dataset: List[Dict] = []
-        self.db_pool = None  # Para pgvector (futuro)
-        self._cargar_dataset()
+    def __init__(self, dataset_path: str = DATASET_PATH, retriever: str = RAG_RETRIEVER):
+        self.dataset_path = dataset_path
+        base, _ = os.path.splitext(dataset_path)
+        self.ingested_path = f"{base}.ingested.jsonl"
+        self.retriever = retriever
+        # El dataset se indexa en el primer uso (importar el servicio no lee el JSONL)
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._segmentos: tuple = (Segmento(dataset_path),)
+        self._ingested_end = 0
+        self.ids_ingestados: set = set()
+        self.db_pool = None  # Pool asyncpg para pgvector (perezoso)
+        self.pgvector_url = RAG_PGVECTOR_URL
+        self.embedder = CodeEmbedder(RAG_EMBEDDING_MODEL, RAG_EMBEDDING_DIM)
+        self._pool_lock = asyncio.Lock()
+        self._pgvector_retry_at = 0.0
+        self._vector_retry_at = 0.0
+    
+    @property
+    def num_docs(self) -> int:
+        return sum(s.num_docs for s in self._segmentos)
+    
+    def _asegurar_cargado(self) -> bool:
+        """Indexa el dataset (y lo ya ingestado) la primera vez. Returns: True si hay documentos"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._cargar_dataset()
+                    self._loaded = True
+        return self.num_docs > 0
     
     def _cargar_dataset(self):
-        """Carga el dataset en memoria"""
-        if os.path.exists(DATASET_PATH):
+        base = Segmento(self.dataset_path)
+        if not os.path.exists(self.dataset_path):
+            print(f"⚠️ Dataset RAG no encontrado en: {self.dataset_path}")
+            print(f"   El sistema funcionará sin ejemplos históricos")
+        else:
             try:
-                with open(DATASET_PATH, 'r', encoding='utf-8') as f:
-                    for linea in f:
-                        if linea.strip():
-                            self.dataset.append(json.loads(linea))
-                print(f"✅ RAG Dataset cargado: {len(self.dataset)} evaluaciones históricas")
+                inicio = time.perf_counter()
+                base = Segmento.desde_jsonl(self.dataset_path)
+                print(f"✅ RAG Dataset indexado: {base.num_docs} evaluaciones históricas "
+                      f"({len(base.bm25_index.vocab)} términos BM25, retriever: {self.retriever}, "
+                      f"{(time.perf_counter() - inicio) * 1000:.0f}ms)")
             except Exception as e:
                 print(f"⚠️ Error cargando dataset RAG: {e}")
-                self.dataset = []
+                base = Segmento(self.dataset_path)
+        
+        with self._write_lock:
+            self._segmentos = (base,)
+            self._sincronizar_ingestados()
+    
+    def _fin_ingestado(self) -> int:
+        """
+        Tamaño de ingested.jsonl tomado con lock compartido: los escritores
+        agregan líneas completas con lock exclusivo, así que todo lo anterior
+        a este punto está completo (y no cambia: el archivo es append-only).
+        """
+        with open(self.ingested_path, 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                return os.fstat(f.fileno()).st_size
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def _sincronizar_ingestados(self, fin: Optional[int] = None):
+        """
+        Publica como segmento nuevo lo que otro proceso (u otro worker) agregó
+        a ingested.jsonl desde la última lectura. Requiere _write_lock.
+        fin: tamaño ya leído por quien tiene el lock exclusivo del archivo.
+        """
+        if not os.path.exists(self.ingested_path):
+            return
+        if fin is None:
+            fin = self._fin_ingestado()
+        if fin <= self._ingested_end:
+            return
+        segmento = Segmento.desde_jsonl(
+            self.ingested_path, self._ingested_end, fin, referencia=self._segmentos[0].bm25_index
+        )
+        self._ingested_end = fin
+        if segmento.num_docs:
+            self.ids_ingestados.update(segmento.grade_ids)
+            self._segmentos = self._segmentos + (segmento,)
+            print(f"📥 RAG: {segmento.num_docs} evaluaciones revisadas incorporadas "
+                  f"({len(self._segmentos) - 1} segmentos incrementales)")
+    
+    def agregar_ejemplos(self, ejemplos: List[Dict]) -> int:
+        """
+        Agrega evaluaciones al corpus sin reconstruir nada: se escriben al
+        final de ingested.jsonl y se publica un segmento nuevo solo con ellas.
+        Los ejemplos deben traer "grade_id" (se ignoran los ya ingestados).
+        
+        Returns:
+            Número de ejemplos agregados
+        
+        Si el índice aún no se cargó en este proceso solo se escribe el JSONL:
+        la primera consulta lo indexará completo.
+        """
+        with self._write_lock:
+            with open(self.ingested_path, 'ab') as f:
+                # Lock entre procesos: varios workers pueden ingestar a la vez
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    # Con el lock exclusivo tomado: no volver a bloquear el archivo
+                    if self._loaded:
+                        self._sincronizar_ingestados(os.fstat(f.fileno()).st_size)
+                        existentes = self.ids_ingestados
+                    else:
+                        existentes = self._leer_ids_ingestados(os.fstat(f.fileno()).st_size)
+                    nuevos = [e for e in ejemplos if e.get('grade_id') not in existentes]
+                    if not nuevos:
+                        return 0
+                    f.seek(0, os.SEEK_END)
+                    for ejemplo in nuevos:
+                        f.write((json.dumps(ejemplo, ensure_ascii=False) + "\n").encode('utf-8'))
+                    f.flush()
+                    if self._loaded:
+                        self._sincronizar_ingestados(os.fstat(f.fileno()).st_size)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        return len(nuevos)
+    
+    def _leer_ids_ingestados(self, fin: Optional[int] = None) -> set:
+        """grade_ids presentes en ingested.jsonl, sin construir índices"""
+        if not os.path.exists(self.ingested_path):
+            return set()
+        if fin is None:
+            fin = self._fin_ingestado()
+        segmento = Segmento(self.ingested_path, 0, fin)
+        return {e['grade_id'] for _, _, e in segmento._leer_lineas() if e.get('grade_id') is not None}
+    
+    def ids_en_corpus(self) -> set:
+        """grade_ids ya ingestados (con el índice sin cargar, leídos del JSONL)"""
+        if self._loaded:
+            return self.ids_ingestados
+        return self._leer_ids_ingestados()
+    
+    def sincronizar(self):
+        """
+        Incorpora lo que otros procesos agregaron a ingested.jsonl. Sin el
+        índice cargado no hace nada: la primera consulta lo leerá completo.
+        """
+        if not self._loaded:
+            return
+        with self._write_lock:
+            self._sincronizar_ingestados()
+    
+    def compactar(self, min_segmentos: int = 2) -> bool:
+        """
+        Fusiona los segmentos incrementales en uno (BM25 con estadísticas
+        comunes). Se construye fuera del lock de escritura y se publica con un
+        intercambio atómico; lo ingestado mientras tanto se conserva.
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return False
+        try:
+            segmentos = self._segmentos
+            deltas = segmentos[1:]
+            if len(deltas) < min_segmentos:
+                return False
+            
+            inicio = time.perf_counter()
+            fusionado = Segmento.desde_jsonl(
+                self.ingested_path, deltas[0].desde, deltas[-1].hasta, referencia=segmentos[0].bm25_index
+            )
+            if all(d.vector_index is not None for d in deltas):
+                fusionado.vector_index = VectorIndex(np.concatenate([d.vector_index.matrix for d in deltas]))
+            
+            with self._write_lock:
+                actuales = self._segmentos
+                self._segmentos = (actuales[0], fusionado) + actuales[1 + len(deltas):]
+            print(f"🗜️ RAG: {len(deltas)} segmentos compactados ({fusionado.num_docs} documentos, "
+                  f"{(time.perf_counter() - inicio) * 1000:.0f}ms)")
+            return True
+        finally:
+            self._compact_lock.release()
+    
+    @staticmethod
+    def _inicios(segmentos: tuple) -> np.ndarray:
+        """Id global del primer documento de cada segmento"""
+        return np.concatenate(([0], np.cumsum([s.num_docs for s in segmentos])[:-1])).astype(np.int64)
+    
+    def documentos(self, doc_ids: List[int], segmentos: Optional[tuple] = None) -> List[Dict]:
+        """Documentos por id global (orden: dataset base y luego lo ingestado)"""
+        if not doc_ids or not self._asegurar_cargado():
+            return []
+        segmentos = segmentos or self._segmentos
+        inicios = self._inicios(segmentos)
+        resultados = []
+        for doc_id in doc_ids:
+            i = int(np.searchsorted(inicios, doc_id, side='right')) - 1
+            resultados.extend(segmentos[i].documentos([doc_id - int(inicios[i])]))
+        return resultados
+    
+    def _top_global(self, segmentos: tuple, puntuar, limit: int) -> List[Tuple[int, float]]:
+        """Top-k global a partir del top-k de cada segmento: puntuar(seg, i) -> [(id local, score)]"""
+        candidatos = []
+        for inicio, (i, segmento) in zip(self._inicios(segmentos), enumerate(segmentos)):
+            if segmento.num_docs:
+                candidatos.extend((int(inicio) + d, score) for d, score in puntuar(segmento, i))
+        return heapq.nsmallest(limit, candidatos, key=lambda item: (-item[1], item[0]))
+    
+    def buscar_ids(self, codigo: str, limit: int = 5, retriever: Optional[str] = None,
+                   semana: Optional[str] = None, segmentos: Optional[tuple] = None) -> List[int]:
+        """Ids globales de los más similares con el recuperador en proceso indicado"""
+        if not self._asegurar_cargado():
+            return []
+        segmentos = segmentos or self._segmentos
+        retriever = retriever or self.retriever
+        
+        if retriever == "keyword":
+            # Puntuar por intersección de postings: el costo depende de los
+            # términos de la consulta, no del tamaño del corpus
+            scored = self._top_global(segmentos, lambda s, i: s.get_keyword_index().search(codigo, limit), limit)
+        elif retriever == "vector":
+            embedding, _ = self.embedder.encode(codigo)
+            scored = self._top_global(
+                segmentos,
+                lambda s, i: s.get_vector_index(self.embedder, i == 0).search(embedding, limit),
+                limit
+            )
+        elif retriever == "hybrid":
+            return self._ids_hibrido(codigo, limit, semana, segmentos)
         else:
-            print(f"⚠️ Dataset RAG no encontrado en: {DATASET_PATH}")
-            print(f"   El sistema funcionará sin ejemplos históricos")
+            scored = self._top_global(segmentos, lambda s, i: s.bm25_index.search(codigo, limit), limit)
+        return [doc_id for doc_id, score in scored]
     
     def buscar_similares_simple(self, codigo: str, limit: int = 5) -> List[Dict]:
         """
         Búsqueda simple por keywords (fallback sin pgvector).
         Para producción, usar pgvector con embeddings.
         """
-        if not self.dataset:
+        if not self._asegurar_cargado():
             return []
         
-        # Extraer keywords del código (palabras relevantes)
-        keywords = set()
-        for palabra in codigo.lower().replace('\n', ' ').replace('\t', ' ').split():
-            # Filtrar palabras muy cortas y keywords de C#
-            if len(palabra) > 3 and palabra not in {'using', 'public', 'private', 'class', 'void', 'static', 'string', 'return', 'this', 'null', 'true', 'false'}:
-                keywords.add(palabra)
-        
-        # Puntuar cada ejemplo por coincidencia
-        scored = []
-        for ejemplo in self.dataset:
-            codigo_ejemplo = ejemplo.get('codigo', '').lower()
-            
-            # Contar coincidencias de keywords
-            coincidencias = sum(1 for kw in keywords if kw in codigo_ejemplo)
-            
-            # Bonus si es la misma semana (similar complejidad)
-            semana_ejemplo = ejemplo.get('semana', '')
-            
-            scored.append((coincidencias, ejemplo))
+        segmentos = self._segmentos
+        resultados = self.documentos(self.buscar_ids(codigo, limit, "keyword", segmentos=segmentos), segmentos)
+        
+        if resultados:
+            print(f"🔍 RAG: Encontrados {len(resultados)} proyectos similares")
+        
+        return resultados
+    
+    def buscar_similares_bm25(self, codigo: str, limit: int = 5) -> List[Dict]:
+        """
+        Búsqueda BM25 con tokenizer de C# (camelCase, sin keywords).
+        Normaliza por longitud, así los proyectos largos no dominan.
+        """
+        if not self._asegurar_cargado():
+            return []
         
-        # Ordenar por coincidencias y retornar top N
-        scored.sort(key=lambda x: x[0], reverse=True)
+        segmentos = self._segmentos
+        resultados = self.documentos(self.buscar_ids(codigo, limit, "bm25", segmentos=segmentos), segmentos)
+        
+        if resultados:
+            print(f"🔍 RAG (BM25): Encontrados {len(resultados)} proyectos similares")
+        
+        return resultados
+    
+    def buscar_similares_vector(self, codigo: str, limit: int = 5) -> List[Dict]:
+        """
+        Búsqueda semántica en proceso: producto punto contra los embeddings
+        memory-mapped (mismo modelo que pgvector, sin base de datos).
+        """
+        if not self._asegurar_cargado():
+            return []
         
-        # Filtrar los que tienen al menos algunas coincidencias
-        resultados = [item[1] for item in scored[:limit] if item[0] > 0]
+        segmentos = self._segmentos
+        inicio = time.perf_counter()
+        try:
+            doc_ids = self.buscar_ids(codigo, limit, "vector", segmentos=segmentos)
+        except Exception as e:
+            print(f"⚠️ RAG vector index no disponible, usando BM25: {e}")
+            self.retriever = "bm25"
+            return self.buscar_similares_bm25(codigo, limit)
+        search_ms = (time.perf_counter() - inicio) * 1000
+        resultados = self.documentos(doc_ids, segmentos)
         
         if resultados:
-            print(f"🔍 RAG: Encontrados {len(resultados)} proyectos similares")
+            print(f"🔍 RAG (vector): Encontrados {len(resultados)} proyectos similares ({search_ms:.1f}ms)")
         
         return resultados
     
-    async def buscar_similares_pgvector(self, codigo: str, limit: int = 5) -> List[Dict]:
+    def _ids_hibrido(self, codigo: str, limit: int, semana: Optional[str], segmentos: tuple) -> List[int]:
+        semana = normalizar_semana(semana) if semana else None
+        # Filtrar por semana solo si entre todos los segmentos hay al menos `limit` ejemplos
+        filtrar = semana is not None and sum(
+            len(s.particiones_semana.get(semana, ())) for s in segmentos
+        ) >= limit
+        
+        def candidatos(segmento):
+            return segmento.particiones_semana.get(semana, np.zeros(0, dtype=np.int32)) if filtrar else None
+        
+        def bm25(segmento, i):
+            c = candidatos(segmento)
+            # Solo se puntúan los candidatos de la semana
+            scores = segmento.bm25_index.score(codigo, c)
+            if c is None:
+                return top_k(scores, RAG_HYBRID_DEPTH)
+            return [(int(c[j]), score) for j, score in top_k(scores, RAG_HYBRID_DEPTH)]
+        
+        rankings = [self._top_global(segmentos, bm25, RAG_HYBRID_DEPTH)]
+        
+        if time.monotonic() >= self._vector_retry_at:
+            try:
+                embedding, _ = self.embedder.encode(codigo)
+                
+                def vector(segmento, i):
+                    c = candidatos(segmento)
+                    scores = segmento.get_vector_index(self.embedder, i == 0).score(embedding, c)
+                    if c is None:
+                        return top_k(scores, RAG_HYBRID_DEPTH)
+                    return [(int(c[j]), score) for j, score in top_k(scores, RAG_HYBRID_DEPTH)]
+                
+                rankings.append(self._top_global(segmentos, vector, RAG_HYBRID_DEPTH))
+            except Exception as e:
+                print(f"⚠️ RAG hybrid sin índice vectorial, solo BM25: {e}")
+                self._vector_retry_at = time.monotonic() + RAG_VECTOR_RETRY_SECONDS
+        
+        fusion = rrf([np.asarray([d for d, _ in r], dtype=np.int64) for r in rankings], RAG_RRF_K)
+        return sorted(fusion, key=lambda d: (-fusion[d], d))[:limit]
+    
+    def buscar_similares_hibrido(self, codigo: str, limit: int = 5, semana: Optional[str] = None) -> List[Dict]:
         """
-        Búsqueda semántica con pgvector (requiere embeddings cargados).
-        TODO: Implementar cuando se cargue el dataset con embeddings.
+        Recuperación híbrida: filtra candidatos por la partición de la semana
+        (si tiene al menos `limit` ejemplos), puntúa BM25 y vector solo sobre
+        ellos y fusiona ambos rankings con RRF. Sin índice vectorial, queda BM25
+        hasta RAG_VECTOR_RETRY_SECONDS después.
         """
-        # Por ahora, usar fallback
-        return self.buscar_similares_simple(codigo, limit)
+        if not self._asegurar_cargado():
+            return []
+        
+        segmentos = self._segmentos
+        inicio = time.perf_counter()
+        doc_ids = self._ids_hibrido(codigo, limit, semana, segmentos)
+        search_ms = (time.perf_counter() - inicio) * 1000
+        resultados = self.documentos(doc_ids, segmentos)
+        
+        if resultados:
+            filtro = f"semana {normalizar_semana(semana)}" if semana else "sin filtro"
+            print(f"🔍 RAG (hybrid): Encontrados {len(resultados)} proyectos similares ({filtro}, {search_ms:.1f}ms)")
+        
+        return resultados
+    
+    async def _get_pool(self):
+        """Crea el pool asyncpg una sola vez; cada conexión fija ivfflat.probes"""
+        if self.db_pool is not None:
+            return self.db_pool
+        async with self._pool_lock:
+            if self.db_pool is None:
+                import asyncpg
+
+                async def configurar(conn):
+                    await conn.execute(f"SET ivfflat.probes = {RAG_IVFFLAT_PROBES}")
+
+                self.db_pool = await asyncpg.create_pool(
+                    self.pgvector_url,
+                    min_size=1,
+                    max_size=RAG_PGVECTOR_POOL_SIZE,
+                    timeout=RAG_PGVECTOR_TIMEOUT,
+                    init=configurar
+                )
+                print(f"✅ RAG pgvector pool listo (probes={RAG_IVFFLAT_PROBES})")
+        return self.db_pool
+    
+    async def close(self):
+        if self.db_pool is not None:
+            await self.db_pool.close()
+            self.db_pool = None
     
-    async def buscar_similares(self, codigo: str, limit: int = 5) -> List[Dict]:
-        """Método principal de búsqueda"""
-        # Intentar pgvector primero (futuro)
-        # resultados = await self.buscar_similares_pgvector(codigo, limit)
+    def _fila_a_ejemplo(self, fila) -> Dict:
+        """Convierte una fila de evaluaciones_historicas al formato del dataset.jsonl"""
+        return {
+            "id": fila["id"],
+            "seccion": fila["seccion"],
+            "semana": fila["semana"],
+            "nombre_archivo": fila["nombre_archivo"],
+            "puntaje_total": fila["puntaje_total"],
+            "rubrica": {
+                "comprension": fila["rubrica_comprension"],
+                "diseno": fila["rubrica_diseno"],
+                "implementacion": fila["rubrica_implementacion"],
+                "funcionalidad": fila["rubrica_funcionalidad"]
+            },
+            "feedback": fila["feedback"],
+            "codigo": fila["codigo"],
+            "similitud": float(fila["similitud"])
+        }
+    
+    def _buscar_en_memoria(self, codigo: str, limit: int) -> List[Dict]:
+        if self.retriever == "keyword":
+            return self.buscar_similares_simple(codigo, limit)
+        if self.retriever == "vector":
+            return self.buscar_similares_vector(codigo, limit)
+        return self.buscar_similares_bm25(codigo, limit)
+    
+    async def buscar_similares_pgvector(self, codigo: str, limit: int = 5) -> List[Dict]:
+        """
+        Búsqueda semántica con pgvector (embeddings CodeBERT de cargar_pgvector.py).
+        Si la base no está disponible usa el recuperador en memoria y no
+        reintenta hasta RAG_PGVECTOR_RETRY_SECONDS después.
+        """
+        # Búsqueda en memoria (y su carga perezosa del índice): fuera del event loop
+        if time.monotonic() < self._pgvector_retry_at:
+            return await asyncio.to_thread(self._buscar_en_memoria, codigo, limit)
         
-        # Por ahora usar búsqueda simple
-        resultados = self.buscar_similares_simple(codigo, limit)
+        try:
+            inicio = time.perf_counter()
+            # El encoder es CPU: fuera del event loop
+            embedding, cached = await asyncio.to_thread(self.embedder.encode, codigo)
+            embed_ms = (time.perf_counter() - inicio) * 1000
+            
+            inicio = time.perf_counter()
+            pool = await self._get_pool()
+            vector = "[" + ",".join(f"{v:.6f}" for v in embedding) + "]"
+            filas = await pool.fetch(SQL_BUSCAR_SIMILARES, vector, limit, timeout=RAG_PGVECTOR_TIMEOUT)
+            query_ms = (time.perf_counter() - inicio) * 1000
+        except Exception as e:
+            print(f"⚠️ RAG pgvector no disponible, usando búsqueda en memoria: {e}")
+            self._pgvector_retry_at = time.monotonic() + RAG_PGVECTOR_RETRY_SECONDS
+            return await asyncio.to_thread(self._buscar_en_memoria, codigo, limit)
         
+        resultados = [self._fila_a_ejemplo(f) for f in filas]
+        print(f"🔍 RAG (pgvector): {len(resultados)} proyectos similares "
+              f"(embedding {embed_ms:.0f}ms{' cache' if cached else ''}, consulta {query_ms:.0f}ms)")
         return resultados
     
+    async def buscar_similares(self, codigo: str, limit: int = 5, semana: Optional[str] = None) -> List[Dict]:
+        """
+        Método principal de búsqueda.
+        `semana` (de la tarea evaluada) restringe los candidatos del recuperador hybrid.
+        """
+        if self.retriever == "hybrid":
+            return await asyncio.to_thread(self.buscar_similares_hibrido, codigo, limit, semana)
+        if self.retriever == "pgvector":
+            return await self.buscar_similares_pgvector(codigo, limit)
+        if self.retriever == "vector":
+            # El encoder (y la primera construcción del índice) es CPU: fuera del event loop
+            return await asyncio.to_thread(self.buscar_similares_vector, codigo, limit)
+        
+        # bm25 / keyword: la primera consulta indexa el dataset completo
+        return await asyncio.to_thread(self._buscar_en_memoria, codigo, limit)
+    
     def formatear_ejemplos_para_prompt(self, ejemplos: List[Dict]) -> str:
         """
         Formatea los ejemplos históricos para incluir en el prompt de Ollama.
@@ -144,18 +675,22 @@ Fragmento del código evaluado:
         return texto
     
     def get_stats(self) -> Dict:
-        """Retorna estadísticas del dataset"""
-        if not self.dataset:
+        """Retorna estadísticas del dataset (lo indexa si aún no se cargó)"""
+        if not self._asegurar_cargado():
             return {"total": 0, "loaded": False}
         
-        puntajes = [d.get('puntaje_total', 0) for d in self.dataset]
+        segmentos = self._segmentos
+        puntajes = np.concatenate([s.puntajes for s in segmentos])
+        puntajes = puntajes[~np.isnan(puntajes)]
         
         return {
-            "total": len(self.dataset),
+            "total": sum(s.num_docs for s in segmentos),
             "loaded": True,
-            "puntaje_promedio": round(sum(puntajes) / len(puntajes), 2) if puntajes else 0,
-            "puntaje_min": min(puntajes) if puntajes else 0,
-            "puntaje_max": max(puntajes) if puntajes else 0
+            "ingested": sum(s.num_docs for s in segmentos[1:]),
+            "segments": len(segmentos),
+            "puntaje_promedio": round(float(puntajes.mean()), 2) if puntajes.size else 0,
+            "puntaje_min": float(puntajes.min()) if puntajes.size else 0,
+            "puntaje_max": float(puntajes.max()) if puntajes.size else 0
         }
 
 
@@ -0,0 +1,177 @@
+"""
+Pre-filtro de relevancia del video por embeddings.
+Compara la transcripción con los requisitos usando un sentence encoder local
+y solo deja para el LLM los casos ambiguos.
+
+Ubicación: backend/app/services/relevance_screen.py
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+RELEVANCE_PRESCREEN = os.getenv("RELEVANCE_PRESCREEN", "true").lower() == "true"
+# Modelo multilingüe (transcripciones y enunciados en español)
+RELEVANCE_EMBEDDING_MODEL = os.getenv(
+    "RELEVANCE_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+)
+# Similitud máxima >= HIGH: relevante; <= LOW: no relevante; en medio: se consulta al LLM
+RELEVANCE_HIGH = float(os.getenv("RELEVANCE_HIGH", "0.55"))
+RELEVANCE_LOW = float(os.getenv("RELEVANCE_LOW", "0.25"))
+# Ventanas de la transcripción (en palabras)
+CHUNK_WORDS = int(os.getenv("RELEVANCE_CHUNK_WORDS", "60"))
+CHUNK_STRIDE = int(os.getenv("RELEVANCE_CHUNK_STRIDE", "45"))
+CACHE_SIZE = 256
+
+
+def dividir_transcripcion(texto: str, palabras: int = CHUNK_WORDS, paso: int = CHUNK_STRIDE) -> List[str]:
+    """Divide la transcripción en ventanas solapadas de N palabras"""
+    tokens = texto.split()
+    if len(tokens) <= palabras:
+        return [" ".join(tokens)] if tokens else []
+    chunks = []
+    for inicio in range(0, len(tokens) - palabras + paso, paso):
+        chunk = tokens[inicio:inicio + palabras]
+        if chunk:
+            chunks.append(" ".join(chunk))
+    return chunks
+
+
+def dividir_requisitos(texto: str) -> List[str]:
+    """Un fragmento por línea/oración del enunciado (más el enunciado completo)"""
+    partes = [p.strip(" -•*\t") for p in re.split(r'[\n\r]+|(?<=[.;:])\s+', texto or "")]
+    partes = [p for p in partes if len(p.split()) >= 3]
+    return [texto.strip()] + partes if texto and texto.strip() else partes
+
+
+class RelevanceScreenService:
+    """
+    Decide la relevancia de los casos claros sin llamar al LLM.
+    Los embeddings de requisitos se cachean por Assignment.
+    """
+
+    def __init__(self):
+        self.enabled = RELEVANCE_PRESCREEN
+        self.model_name = RELEVANCE_EMBEDDING_MODEL
+        self.high = RELEVANCE_HIGH
+        self.low = RELEVANCE_LOW
+        self.model = None
+        self._initialized = False
+        # screen() corre en hilos: una sola carga del modelo y cache consistente
+        self._lock = threading.Lock()
+        # (assignment_id, hash de requisitos) -> matriz de embeddings normalizados
+        self._requirements_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self.stats = {"decided_relevant": 0, "decided_not_relevant": 0, "ambiguous": 0}
+
+    def initialize(self):
+        """Carga perezosa del sentence encoder"""
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    print(f"📥 Loading relevance encoder: {self.model_name}")
+                    from sentence_transformers import SentenceTransformer
+                    self.model = SentenceTransformer(self.model_name)
+                    self._initialized = True
+                    print("✅ Relevance encoder loaded")
+
+    def _encode(self, textos: List[str]) -> np.ndarray:
+        self.initialize()
+        return self.model.encode(
+            textos,
+            batch_size=32,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).astype(np.float32)
+
+    def requirement_embeddings(self, requirements: str, assignment_id: Optional[int] = None) -> np.ndarray:
+        """Embeddings de los requisitos, cacheados por assignment y contenido"""
+        key = (assignment_id, hashlib.sha1((requirements or "").encode("utf-8")).hexdigest())
+        with self._lock:
+            cached = self._requirements_cache.get(key)
+            if cached is not None:
+                self._requirements_cache.move_to_end(key)
+                return cached
+
+        embeddings = self._encode(dividir_requisitos(requirements))
+        with self._lock:
+            self._requirements_cache[key] = embeddings
+            if len(self._requirements_cache) > CACHE_SIZE:
+                self._requirements_cache.popitem(last=False)
+        return embeddings
+
+    def max_similarity(self, transcript: str, requirements: str, assignment_id: Optional[int] = None) -> float:
+        """Similitud coseno máxima entre ventanas de la transcripción y fragmentos de requisitos"""
+        chunks = dividir_transcripcion(transcript)
+        req = self.requirement_embeddings(requirements, assignment_id)
+        if not chunks or req.size == 0:
+            return 0.0
+        # (chunks x dim) @ (dim x req) en una sola multiplicación
+        sims = self._encode(chunks) @ req.T
+        return float(sims.max())
+
+    def classify(self, similarity: float) -> str:
+        if similarity >= self.high:
+            return "relevant"
+        if similarity <= self.low:
+            return "not_relevant"
+        return "ambiguous"
+
+    def _contar(self, clave: str):
+        # screen() corre en varios hilos a la vez
+        with self._lock:
+            self.stats[clave] += 1
+
+    def screen(self, transcript: str, requirements: str, assignment_id: Optional[int] = None) -> Optional[Dict]:
+        """
+        Returns:
+            Dict compatible con la verificación del LLM para casos claros,
+            None si el caso es ambiguo (o el pre-filtro no está disponible)
+        """
+        if not self.enabled:
+            return None
+
+        # Solo un modelo que no carga desactiva el pre-filtro para siempre
+        try:
+            self.initialize()
+        except Exception as e:
+            print(f"⚠️ Relevance pre-screen unavailable, disabling: {e}")
+            self.enabled = False
+            return None
+
+        try:
+            similarity = self.max_similarity(transcript, requirements, assignment_id)
+        except Exception as e:
+            print(f"⚠️ Relevance pre-screen failed, falling back to LLM: {e}")
+            return None
+
+        decision = self.classify(similarity)
+        print(f"🧮 Relevance pre-screen: max similarity {similarity:.3f} → {decision}")
+
+        if decision == "ambiguous":
+            self._contar("ambiguous")
+            return None
+
+        if decision == "relevant":
+            self._contar("decided_relevant")
+            confidence = 0.6 + 0.4 * (similarity - self.high) / max(1e-6, 1 - self.high)
+        else:
+            self._contar("decided_not_relevant")
+            confidence = 0.6 + 0.4 * (self.low - similarity) / max(1e-6, self.low + 1)
+
+        return {
+            "is_relevant": decision == "relevant",
+            "confidence": round(min(1.0, confidence), 2),
+            "reason": f"Pre-filtro por embeddings: similitud máxima {similarity:.2f} con los requisitos",
+            "method": "embedding",
+            "similarity": round(similarity, 4)
+        }
+
+
+# Singleton
+relevance_screen = RelevanceScreenService()
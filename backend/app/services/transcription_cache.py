@@ -0,0 +1,89 @@
+"""
+Caché de transcripciones de Whisper en MinIO.
+La clave es el ETag del video (hash del contenido que calcula MinIO) más el
+modelo y el idioma: re-evaluar una entrega o recibir el mismo video otra vez
+no vuelve a descargarlo ni a transcribirlo.
+
+Ubicación: backend/app/services/transcription_cache.py
+"""
+
+import io
+import json
+import os
+from typing import Dict, Optional
+
+from minio.error import S3Error
+
+from app.services.minio_service import minio_service
+
+TRANSCRIPTION_CACHE = os.getenv("TRANSCRIPTION_CACHE", "true").lower() == "true"
+TRANSCRIPTION_CACHE_PREFIX = os.getenv("TRANSCRIPTION_CACHE_PREFIX", "_transcripts")
+
+
+class TranscriptionCache:
+    """Artefactos JSON en <bucket de videos>/_transcripts/<etag>/<modelo>_<idioma>[_words].json"""
+
+    def __init__(self):
+        self.enabled = TRANSCRIPTION_CACHE
+        self.bucket = minio_service.bucket_videos
+        self.prefix = TRANSCRIPTION_CACHE_PREFIX
+        self.stats = {"hits": 0, "misses": 0}
+
+    def etag(self, bucket: str, object_name: str) -> Optional[str]:
+        """ETag del objeto (sin comillas) o None si no existe"""
+        try:
+            return minio_service.client.stat_object(bucket, object_name).etag.strip('"')
+        except S3Error:
+            return None
+
+    def _object_name(self, etag: str, model: str, language: str, word_timestamps: bool) -> str:
+        nombre = f"{model}_{language}{'_words' if word_timestamps else ''}".replace("/", "-")
+        return f"{self.prefix}/{etag}/{nombre}.json"
+
+    def _leer(self, object_name: str) -> Optional[Dict]:
+        try:
+            response = minio_service.client.get_object(self.bucket, object_name)
+            try:
+                return json.loads(response.read())
+            finally:
+                response.close()
+                response.release_conn()
+        except S3Error:
+            return None
+
+    def get(self, etag: str, model: str, language: str, word_timestamps: bool = False) -> Optional[Dict]:
+        """
+        Transcripción cacheada. Sin word timestamps también sirve una entrada
+        que sí los tiene (es un superconjunto).
+        """
+        if not self.enabled or not etag:
+            return None
+        modos = [True] if word_timestamps else [False, True]
+        for modo in modos:
+            result = self._leer(self._object_name(etag, model, language, modo))
+            if result is not None:
+                self.stats["hits"] += 1
+                return result
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, etag: str, model: str, language: str, result: Dict):
+        if not self.enabled or not etag:
+            return
+        object_name = self._object_name(etag, model, language, bool(result.get('word_timestamps')))
+        data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        try:
+            minio_service.client.put_object(
+                self.bucket,
+                object_name,
+                io.BytesIO(data),
+                len(data),
+                content_type="application/json"
+            )
+            print(f"💾 Transcription cached: {self.bucket}/{object_name}")
+        except S3Error as e:
+            print(f"⚠️ Could not cache transcription: {e}")
+
+
+# Singleton
+transcription_cache = TranscriptionCache()
@@ -0,0 +1,225 @@
+"""
+Cola durable de transcripciones en Postgres (tabla transcription_jobs).
+La API encola y espera por polling; transcription_worker.py reclama los
+trabajos con FOR UPDATE SKIP LOCKED, así varios workers no toman el mismo.
+
+Ubicación: backend/app/services/transcription_queue.py
+"""
+
+import asyncio
+import os
+from datetime import timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.models.models import Student, Submission, TranscriptionJob
+
+# Activada: la API no carga Whisper, transcribe el servicio transcription-worker
+TRANSCRIPTION_QUEUE = os.getenv("TRANSCRIPTION_QUEUE", "false").lower() == "true"
+TRANSCRIPTION_POLL_SECONDS = float(os.getenv("TRANSCRIPTION_POLL_SECONDS", "2"))
+# Máximo que la evaluación espera una transcripción
+TRANSCRIPTION_JOB_TIMEOUT = float(os.getenv("TRANSCRIPTION_JOB_TIMEOUT", "3600"))
+# Un trabajo 'running' sin heartbeat en este tiempo se considera de un worker caído
+TRANSCRIPTION_STALE_SECONDS = int(os.getenv("TRANSCRIPTION_STALE_SECONDS", "300"))
+TRANSCRIPTION_MAX_ATTEMPTS = int(os.getenv("TRANSCRIPTION_MAX_ATTEMPTS", "3"))
+
+ACTIVE_STATUSES = ("pending", "running", "completed")
+
+
+def wants_word_timestamps(submission: Submission) -> bool:
+    """Los videos de grupo necesitan palabras con tiempos para la participación"""
+    return bool(submission.group_number and submission.group_number > 1)
+
+
+def expected_speakers(db: Session, submission: Submission) -> Optional[int]:
+    """Tamaño del grupo: alumnos de la sección con el mismo group_number"""
+    total = db.query(func.count(Student.student_id)).filter(
+        Student.section_id == submission.section_id,
+        Student.group_number == submission.group_number
+    ).scalar()
+    return total or None
+
+
+def enqueue(db: Session, submission: Submission, word_timestamps: bool = False, language: str = "es") -> TranscriptionJob:
+    """
+    Encola la transcripción del video de la entrega. Reutiliza un trabajo
+    vigente del mismo video si cubre lo pedido (uno con palabras sirve para
+    una petición sin palabras, no al revés).
+    """
+    query = db.query(TranscriptionJob).filter(
+        TranscriptionJob.submission_id == submission.submission_id,
+        TranscriptionJob.video_url == submission.video_url,
+        TranscriptionJob.language == language,
+        TranscriptionJob.status.in_(ACTIVE_STATUSES)
+    )
+    if word_timestamps:
+        query = query.filter(TranscriptionJob.word_timestamps.is_(True))
+    job = query.order_by(TranscriptionJob.job_id.desc()).first()
+    if job is not None:
+        return job
+
+    job = TranscriptionJob(
+        submission_id=submission.submission_id,
+        video_url=submission.video_url,
+        language=language,
+        word_timestamps=word_timestamps,
+        status="pending"
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    print(f"📬 Transcription job {job.job_id} queued for submission {submission.submission_id}")
+    return job
+
+
+def claim(db: Session, worker_id: str) -> Optional[TranscriptionJob]:
+    """
+    Toma el trabajo pendiente más antiguo (o uno abandonado por un worker
+    caído). Un trabajo abandonado que ya agotó sus intentos (p. ej. uno que
+    tumba al worker cada vez) queda como fallido en lugar de reclamarse.
+    """
+    stale = func.now() - timedelta(seconds=TRANSCRIPTION_STALE_SECONDS)
+    abandonado = (TranscriptionJob.status == "running") & (TranscriptionJob.heartbeat_at < stale)
+    agotados = db.query(TranscriptionJob).filter(
+        abandonado, func.coalesce(TranscriptionJob.attempts, 0) >= TRANSCRIPTION_MAX_ATTEMPTS
+    ).update(
+        {
+            TranscriptionJob.status: "failed",
+            TranscriptionJob.error: f"Worker stopped responding ({TRANSCRIPTION_MAX_ATTEMPTS} attempts)",
+            TranscriptionJob.completed_at: func.now()
+        },
+        synchronize_session=False
+    )
+    if agotados:
+        print(f"⚠️ {agotados} abandoned transcription job(s) marked as failed")
+    db.commit()
+
+    job = (
+        db.query(TranscriptionJob)
+        .filter(or_(
+            TranscriptionJob.status == "pending",
+            abandonado & (func.coalesce(TranscriptionJob.attempts, 0) < TRANSCRIPTION_MAX_ATTEMPTS)
+        ))
+        .order_by(TranscriptionJob.job_id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        db.rollback()
+        return None
+
+    job.status = "running"
+    job.worker_id = worker_id
+    job.attempts = (job.attempts or 0) + 1
+    job.progress = 0
+    job.segments_done = 0
+    job.started_at = func.now()
+    job.heartbeat_at = func.now()
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def heartbeat(db: Session, job_id: int):
+    db.query(TranscriptionJob).filter(TranscriptionJob.job_id == job_id).update(
+        {TranscriptionJob.heartbeat_at: func.now()}, synchronize_session=False
+    )
+    db.commit()
+
+
+def report_progress(db: Session, job_id: int, segments_done: int, done: float, total: float):
+    db.query(TranscriptionJob).filter(TranscriptionJob.job_id == job_id).update(
+        {
+            TranscriptionJob.segments_done: segments_done,
+            TranscriptionJob.progress: round(min(1.0, done / total), 4) if total else 0,
+            TranscriptionJob.heartbeat_at: func.now()
+        },
+        synchronize_session=False
+    )
+    db.commit()
+
+
+def complete(db: Session, job: TranscriptionJob, result: Dict):
+    """Guarda el resultado en el trabajo y la transcripción en la entrega"""
+    job.status = "completed"
+    job.progress = 1.0
+    job.model = result.get('model')
+    job.result = result
+    job.error = None
+    job.completed_at = func.now()
+
+    submission = db.query(Submission).filter(Submission.submission_id == job.submission_id).first()
+    # La entrega pudo cambiar de video mientras se transcribía
+    if submission and submission.video_url == job.video_url:
+        submission.video_transcription = result['text']
+        submission.video_duration = result.get('duration', 0)
+    db.commit()
+
+
+def fail(db: Session, job: TranscriptionJob, error: str):
+    """Reintenta hasta TRANSCRIPTION_MAX_ATTEMPTS; después queda como fallido"""
+    job.error = error[:2000]
+    job.status = "pending" if (job.attempts or 0) < TRANSCRIPTION_MAX_ATTEMPTS else "failed"
+    if job.status == "failed":
+        job.completed_at = func.now()
+    db.commit()
+
+
+def queue_depth(db: Session) -> int:
+    """Trabajos pendientes (para la selección adaptativa del modelo)"""
+    return db.query(func.count(TranscriptionJob.job_id)).filter(TranscriptionJob.status == "pending").scalar() or 0
+
+
+def job_status(job: TranscriptionJob) -> Dict:
+    return {
+        "job_id": job.job_id,
+        "submission_id": job.submission_id,
+        "status": job.status,
+        "progress": job.progress or 0,
+        "segments_done": job.segments_done or 0,
+        "attempts": job.attempts or 0,
+        "model": job.model,
+        "word_timestamps": job.word_timestamps,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "completed_at": job.completed_at
+    }
+
+
+async def wait_for(job_id: int, timeout: float = TRANSCRIPTION_JOB_TIMEOUT) -> Dict:
+    """
+    Espera (sin bloquear el event loop) a que el worker termine el trabajo.
+
+    Returns:
+        El resultado de la transcripción (mismo esquema que WhisperService.transcribe)
+    """
+    from app.db.session import SessionLocal
+
+    loop = asyncio.get_running_loop()
+    limite = loop.time() + timeout
+    ultimo_avance = None
+    while True:
+        # Sesión nueva por consulta: no retener una conexión mientras se espera
+        db = SessionLocal()
+        try:
+            job = db.query(TranscriptionJob).filter(TranscriptionJob.job_id == job_id).first()
+            if job is None:
+                raise Exception(f"Transcription job {job_id} not found")
+            if job.status == "completed":
+                return {**job.result, 'job_id': job_id}
+            if job.status == "failed":
+                raise Exception(f"Transcription job {job_id} failed: {job.error}")
+            avance = (job.status, job.segments_done)
+        finally:
+            db.close()
+
+        if avance != ultimo_avance:
+            print(f"⏳ Transcription job {job_id}: {avance[0]}, {avance[1]} segments done")
+            ultimo_avance = avance
+        if loop.time() >= limite:
+            raise TimeoutError(f"Transcription job {job_id} did not finish in {timeout:.0f}s")
+        await asyncio.sleep(TRANSCRIPTION_POLL_SECONDS)
@@ -0,0 +1,133 @@
+"""
+Motores de transcripción intercambiables para WhisperService.
+Todos devuelven el mismo esquema: text, language y segments con
+start/end/text/words (cada palabra con word/start/end/probability).
+
+- "openai": openai-whisper en FP32 (PyTorch)
+- "faster-whisper": CTranslate2, int8 en CPU por defecto
+
+Ubicación: backend/app/services/whisper_backends.py
+"""
+
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+
+class OpenAIWhisperBackend:
+    name = "openai"
+
+    def __init__(self, compute_type: Optional[str] = None):
+        # openai-whisper en CPU solo soporta FP32
+        self.compute_type = "float32"
+        self.model = None
+
+    def load(self, model_name: str, threads: Optional[int] = None):
+        import whisper
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = whisper.load_model(model_name)
+
+    def transcribe(
+        self,
+        audio: Union[str, np.ndarray],
+        language: str = "es",
+        word_timestamps: bool = False,
+        condition_on_previous_text: bool = True,
+        progress: Optional[Callable[[float, float], None]] = None
+    ) -> Dict:
+        # openai-whisper no expone avance: solo se informa al terminar
+        result = self.model.transcribe(
+            audio,
+            language=language,
+            fp16=False,  # Use FP32 for better compatibility
+            verbose=False,
+            word_timestamps=word_timestamps,
+            condition_on_previous_text=condition_on_previous_text
+        )
+        segments = [
+            {
+                'start': segment['start'],
+                'end': segment['end'],
+                'text': segment['text'],
+                'words': [
+                    {'word': w['word'], 'start': w['start'], 'end': w['end'], 'probability': w.get('probability')}
+                    for w in segment.get('words', [])
+                ]
+            }
+            for segment in result['segments']
+        ]
+        if progress is not None and segments:
+            progress(segments[-1]['end'], segments[-1]['end'])
+        return {'text': result['text'], 'language': result['language'], 'segments': segments}
+
+
+class FasterWhisperBackend:
+    name = "faster-whisper"
+
+    def __init__(self, compute_type: Optional[str] = None):
+        self.compute_type = compute_type or "int8"
+        self.model = None
+
+    def load(self, model_name: str, threads: Optional[int] = None):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(
+            model_name,
+            device="cpu",
+            compute_type=self.compute_type,
+            cpu_threads=threads or 0
+        )
+
+    def transcribe(
+        self,
+        audio: Union[str, np.ndarray],
+        language: str = "es",
+        word_timestamps: bool = False,
+        condition_on_previous_text: bool = True,
+        progress: Optional[Callable[[float, float], None]] = None
+    ) -> Dict:
+        segments_iter, info = self.model.transcribe(
+            audio,
+            language=language,
+            word_timestamps=word_timestamps,
+            condition_on_previous_text=condition_on_previous_text
+        )
+        # El resultado es un generador: la decodificación ocurre al recorrerlo
+        segments: List[Dict] = []
+        for segment in segments_iter:
+            segments.append({
+                'start': segment.start,
+                'end': segment.end,
+                'text': segment.text,
+                'words': [
+                    {'word': w.word, 'start': w.start, 'end': w.end, 'probability': w.probability}
+                    for w in (segment.words or [])
+                ]
+            })
+            if progress is not None:
+                progress(min(segment.end, info.duration), info.duration)
+        return {
+            'text': "".join(s['text'] for s in segments),
+            'language': info.language,
+            'segments': segments
+        }
+
+
+BACKENDS = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+}
+
+
+def get_backend(name: str, compute_type: Optional[str] = None):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown Whisper backend '{name}' (available: {', '.join(BACKENDS)})")
+    return BACKENDS[name](compute_type)
+
+
+def model_id(backend: str, model_name: str, compute_type: Optional[str] = None) -> str:
+    """Identificador del modelo efectivo (clave de caché y logs)"""
+    if backend == OpenAIWhisperBackend.name:
+        return model_name
+    return f"{model_name}-{backend}-{compute_type or 'int8'}"
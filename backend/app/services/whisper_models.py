@@ -0,0 +1,154 @@
+"""
+Selección adaptativa del modelo Whisper y residencia de modelos en memoria.
+
+El modelo se elige por trabajo: el más grande cuya latencia estimada
+(duración del audio x RTF x trabajos por delante) cumple el objetivo. Los
+modelos cargados viven en una LRU con presupuesto de memoria.
+
+Ubicación: backend/app/services/whisper_models.py
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Activada: el modelo se elige por duración, cola y objetivo de latencia
+WHISPER_ADAPTIVE = os.getenv("WHISPER_ADAPTIVE", "false").lower() == "true"
+# Candidatos, de menor a mayor
+WHISPER_ADAPTIVE_MODELS = [
+    m.strip() for m in os.getenv("WHISPER_ADAPTIVE_MODELS", "tiny,base,small").split(",") if m.strip()
+]
+# Segundos hasta tener la transcripción (incluye la espera detrás de la cola)
+WHISPER_LATENCY_TARGET = float(os.getenv("WHISPER_LATENCY_TARGET", "300"))
+# Memoria máxima para modelos residentes
+WHISPER_MEMORY_BUDGET_MB = float(os.getenv("WHISPER_MEMORY_BUDGET_MB", "3000"))
+
+# RTF en CPU (segundos de cómputo por segundo de audio), estimación inicial.
+# Se ajusta con lo observado; WHISPER_RTF='{"small": 0.4}' sobrescribe valores.
+RTF_ESTIMATES = {
+    "tiny": 0.06,
+    "base": 0.12,
+    "small": 0.35,
+    "medium": 1.0,
+    "large": 2.2,
+}
+RTF_ESTIMATES.update(json.loads(os.getenv("WHISPER_RTF", "{}")))
+
+# Memoria residente aproximada (MB) con openai-whisper en FP32
+MEMORY_MB = {
+    "tiny": 400,
+    "base": 600,
+    "small": 1400,
+    "medium": 3500,
+    "large": 6500,
+}
+# CTranslate2 int8 ocupa bastante menos
+INT8_MEMORY_FACTOR = 0.4
+# Peso de cada observación en la media móvil del RTF
+RTF_ALPHA = 0.3
+
+
+def _familia(model_name: str) -> str:
+    """'small.en' / 'large-v3' -> 'small' / 'large'"""
+    return model_name.split(".")[0].split("-")[0]
+
+
+def memoria_estimada(model_name: str, compute_type: Optional[str] = None) -> float:
+    mb = MEMORY_MB.get(_familia(model_name), MEMORY_MB["large"])
+    if compute_type and compute_type.startswith("int8"):
+        mb *= INT8_MEMORY_FACTOR
+    return mb
+
+
+class ModelSelector:
+    """Elige el modelo más grande que cumple el objetivo de latencia"""
+
+    def __init__(
+        self,
+        candidates: List[str] = WHISPER_ADAPTIVE_MODELS,
+        latency_target: float = WHISPER_LATENCY_TARGET,
+        memory_budget_mb: float = WHISPER_MEMORY_BUDGET_MB,
+        compute_type: Optional[str] = None
+    ):
+        # Los que no caben en el presupuesto nunca se eligen
+        self.candidates = [
+            m for m in candidates if memoria_estimada(m, compute_type) <= memory_budget_mb
+        ] or candidates[:1]
+        self.latency_target = latency_target
+        self.rtf = {m: RTF_ESTIMATES.get(_familia(m), RTF_ESTIMATES["large"]) for m in self.candidates}
+        self._lock = threading.Lock()
+
+    def estimate(self, model_name: str, duration: float, queue_depth: int = 0) -> float:
+        """Latencia estimada: este trabajo más los que tiene delante (de duración parecida)"""
+        return duration * self.rtf[model_name] * (1 + queue_depth)
+
+    def select(self, duration: float, queue_depth: int = 0) -> Dict:
+        elegido = self.candidates[0]
+        for model_name in self.candidates:
+            if self.estimate(model_name, duration, queue_depth) <= self.latency_target:
+                elegido = model_name
+        return {
+            "model": elegido,
+            "estimated_seconds": round(self.estimate(elegido, duration, queue_depth), 1),
+            "queue_depth": queue_depth,
+            "latency_target": self.latency_target
+        }
+
+    def observe(self, model_name: str, duration: float, elapsed: float):
+        """Actualiza el RTF del modelo con una transcripción real"""
+        if model_name not in self.rtf or duration <= 0:
+            return
+        with self._lock:
+            self.rtf[model_name] += RTF_ALPHA * (elapsed / duration - self.rtf[model_name])
+
+
+class ModelResidency:
+    """
+    LRU de modelos cargados con presupuesto de memoria. Al cargar uno que no
+    cabe se descargan los menos usados recientemente; un modelo expulsado que
+    sigue transcribiendo se libera cuando termina.
+    """
+
+    def __init__(self, backend_factory, compute_type: Optional[str] = None,
+                 memory_budget_mb: float = WHISPER_MEMORY_BUDGET_MB):
+        self.backend_factory = backend_factory
+        self.compute_type = compute_type
+        self.memory_budget_mb = memory_budget_mb
+        self._modelos: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"loads": 0, "hits": 0, "evictions": 0}
+
+    def resident_mb(self) -> float:
+        return sum(memoria_estimada(m, self.compute_type) for m in self._modelos)
+
+    def get(self, model_name: str):
+        # La carga ocurre bajo el lock: dos trabajos no cargan el mismo modelo a la vez
+        with self._lock:
+            backend = self._modelos.get(model_name)
+            if backend is not None:
+                self._modelos.move_to_end(model_name)
+                self.stats["hits"] += 1
+                return backend
+
+            necesaria = memoria_estimada(model_name, self.compute_type)
+            while self._modelos and self.resident_mb() + necesaria > self.memory_budget_mb:
+                expulsado, _ = self._modelos.popitem(last=False)
+                self.stats["evictions"] += 1
+                print(f"♻️ Unloading Whisper model {expulsado} (memory budget {self.memory_budget_mb:.0f} MB)")
+
+            print(f"📥 Loading Whisper model: {model_name}")
+            backend = self.backend_factory()
+            backend.load(model_name)
+            self._modelos[model_name] = backend
+            self.stats["loads"] += 1
+            return backend
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "resident": list(self._modelos),
+            "resident_mb": self.resident_mb(),
+            "memory_budget_mb": self.memory_budget_mb
+        }
@@ -1,9 +1,20 @@
 import whisper
 import os
+import subprocess
 import tempfile
-from typing import Optional, Dict
+import threading
+import time
+import numpy as np
+from typing import Callable, Optional, Dict, Union
 from pathlib import Path
 from app.core.config import get_settings
+from app.services.minio_service import minio_service
+from app.services.transcription_cache import transcription_cache
+from app.services.parallel_transcription import ParallelTranscriber
+from app.services.whisper_backends import get_backend, model_id
+from app.services.whisper_models import ModelResidency, ModelSelector, WHISPER_ADAPTIVE
+from app.services.diarization import DIARIZATION, diarize
+from app.services.audio_derivative import find_derivative
 import logging
 
 # Configurar logging
@@ -12,23 +23,53 @@ logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+# Whisper trabaja con audio mono a 16 kHz
+SAMPLE_RATE = 16000
+# Entrada de ffmpeg: "pipe" (stream de MinIO por stdin) o "url" (URL prefirmada,
+# ffmpeg hace range requests; necesario para MP4 con el índice 'moov' al final)
+WHISPER_AUDIO_INPUT = os.getenv("WHISPER_AUDIO_INPUT", "pipe")
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Transcripción segmentada por VAD en un pool de procesos (videos largos)
+WHISPER_PARALLEL = os.getenv("WHISPER_PARALLEL", "false").lower() == "true"
+WHISPER_PARALLEL_MIN_SECONDS = float(os.getenv("WHISPER_PARALLEL_MIN_SECONDS", "120"))
+
 
 class WhisperService:
     def __init__(self):
         self.model_name = settings.WHISPER_MODEL
+        self.backend_name = settings.WHISPER_BACKEND
+        self.compute_type = settings.WHISPER_COMPUTE_TYPE
+        # Modelo efectivo (motor + tipo de cómputo): clave de la caché de transcripciones
+        self.model_id = model_id(self.backend_name, self.model_name, self.compute_type)
+        # Modelos cargados (LRU con presupuesto de memoria)
+        self.residency = ModelResidency(
+            lambda: get_backend(self.backend_name, self.compute_type),
+            self.compute_type
+        )
+        # Modelo por trabajo según duración, cola y objetivo de latencia
+        self.selector = ModelSelector(compute_type=self.compute_type) if WHISPER_ADAPTIVE else None
+        self.backend = None
         self.model = None
         self._initialized = False
-        logger.info(f"🔧 WhisperService created with model: {self.model_name}")
+        # Transcripciones en curso en este proceso (profundidad de cola por defecto)
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self.parallel = (
+            ParallelTranscriber(self.model_name, self.backend_name, self.compute_type)
+            if WHISPER_PARALLEL else None
+        )
+        logger.info(f"🔧 WhisperService created with model: {self.model_name} (backend: {self.backend_name})")
     
     def initialize(self):
         """
         Initialize Whisper model
         """
         if not self._initialized:
-            logger.info(f"📥 Loading Whisper model: {self.model_name}")
-            print(f"📥 Loading Whisper model: {self.model_name}")
+            logger.info(f"📥 Loading Whisper model: {self.model_id}")
+            print(f"📥 Loading Whisper model: {self.model_id}")
             try:
-                self.model = whisper.load_model(self.model_name)
+                self.backend = self.residency.get(self.model_name)
+                self.model = self.backend.model
                 self._initialized = True
                 logger.info("✅ Whisper model loaded successfully")
                 print("✅ Whisper model loaded successfully")
@@ -37,57 +78,117 @@ class WhisperService:
                 print(f"❌ Error loading Whisper model: {str(e)}")
                 raise
     
-    def transcribe_audio(self, audio_path: str, language: str = "es") -> Dict[str, any]:
+    @staticmethod
+    def _duration(result: Dict, segments: list) -> float:
+        """Whisper no devuelve 'duration': se toma del final del último segmento"""
+        if result.get('duration'):
+            return float(result['duration'])
+        return float(segments[-1]['end']) if segments else 0.0
+    
+    def transcribe(
+        self,
+        audio: Union[str, np.ndarray],
+        language: str = "es",
+        word_timestamps: bool = False,
+        queue_depth: Optional[int] = None,
+        progress: Optional[Callable[[float, float], None]] = None
+    ) -> Dict[str, any]:
         """
-        Transcribe audio file to text
+        Single Whisper pass. The result (text, segments with timestamps,
+        duration) is reused for the transcript and for participation analysis.
         
         Args:
-            audio_path: Path to audio/video file
+            audio: Path to audio/video file, or 16 kHz mono float32 samples
+                (already decoded, e.g. by load_audio_from_minio)
             language: Language code (default: "es" for Spanish)
+            word_timestamps: Also compute per-word timestamps (slower; only
+                needed for speaker/participation analysis)
+            queue_depth: Jobs waiting behind this one, for adaptive model
+                selection (default: transcriptions in flight in this process)
+            progress: Called as progress(seconds done, seconds total) after
+                each segment (once at the end with openai-whisper in-process)
         
         Returns:
-            Dict with transcription and metadata
+            Dict with transcription and metadata (including the model used)
         """
-        logger.info(f"🎤 Starting audio transcription: {audio_path}")
-        print(f"🎤 Starting audio transcription: {audio_path}")
+        if self.parallel is not None:
+            if isinstance(audio, str) and os.path.exists(audio):
+                audio = whisper.load_audio(audio)
+            if isinstance(audio, np.ndarray) and len(audio) / SAMPLE_RATE >= WHISPER_PARALLEL_MIN_SECONDS:
+                # Los workers tienen su propio modelo; el del proceso principal no hace falta
+                return {**self.parallel.transcribe(audio, language, word_timestamps, progress), 'model': self.model_id}
         
-        if not self._initialized:
-            logger.info("Model not initialized, initializing now...")
-            print("Model not initialized, initializing now...")
-            self.initialize()
+        selection = None
+        if self.selector is not None:
+            # La duración decide el modelo: el audio se decodifica antes
+            if isinstance(audio, str) and os.path.exists(audio):
+                audio = whisper.load_audio(audio)
+            if queue_depth is None:
+                queue_depth = self._active
+            selection = self.selector.select(len(audio) / SAMPLE_RATE, queue_depth)
+            model_name = selection['model']
+            backend = self.residency.get(model_name)
+            print(f"🎚️ Whisper model selected: {model_name} "
+                  f"(~{selection['estimated_seconds']}s, queue depth {queue_depth})")
+        else:
+            if not self._initialized:
+                logger.info("Model not initialized, initializing now...")
+                print("Model not initialized, initializing now...")
+                self.initialize()
+            model_name = self.model_name
+            backend = self.backend
         
-        # Check if file exists
-        if not os.path.exists(audio_path):
-            error_msg = f"Audio file not found: {audio_path}"
-            logger.error(f"❌ {error_msg}")
-            print(f"❌ {error_msg}")
-            raise FileNotFoundError(error_msg)
-        
-        file_size = os.path.getsize(audio_path)
-        logger.info(f"📊 File size: {file_size / 1024 / 1024:.2f} MB")
-        print(f"📊 File size: {file_size / 1024 / 1024:.2f} MB")
+        if isinstance(audio, np.ndarray):
+            logger.info(f"🎤 Starting audio transcription: {len(audio) / SAMPLE_RATE:.1f}s of decoded audio")
+            print(f"🎤 Starting audio transcription: {len(audio) / SAMPLE_RATE:.1f}s of decoded audio")
+        else:
+            logger.info(f"🎤 Starting audio transcription: {audio}")
+            print(f"🎤 Starting audio transcription: {audio}")
+            
+            # Check if file exists
+            if not os.path.exists(audio):
+                error_msg = f"Audio file not found: {audio}"
+                logger.error(f"❌ {error_msg}")
+                print(f"❌ {error_msg}")
+                raise FileNotFoundError(error_msg)
+            
+            file_size = os.path.getsize(audio)
+            logger.info(f"📊 File size: {file_size / 1024 / 1024:.2f} MB")
+            print(f"📊 File size: {file_size / 1024 / 1024:.2f} MB")
         
         try:
             # Transcribe
-            logger.info(f"🔄 Transcribing with language: {language}")
-            print(f"🔄 Transcribing with language: {language}")
+            logger.info(f"🔄 Transcribing with language: {language} (word timestamps: {word_timestamps})")
+            print(f"🔄 Transcribing with language: {language} (word timestamps: {word_timestamps})")
             
-            result = self.model.transcribe(
-                audio_path,
-                language=language,
-                fp16=False,  # Use FP32 for better compatibility
-                verbose=False
-            )
+            with self._active_lock:
+                self._active += 1
+            inicio = time.perf_counter()
+            try:
+                result = backend.transcribe(
+                    audio, language=language, word_timestamps=word_timestamps, progress=progress
+                )
+            finally:
+                with self._active_lock:
+                    self._active -= 1
+            if isinstance(audio, np.ndarray):
+                result['duration'] = len(audio) / SAMPLE_RATE
+            segments = result['segments']
+            if self.selector is not None:
+                self.selector.observe(model_name, self._duration(result, segments), time.perf_counter() - inicio)
             
-            logger.info(f"✅ Transcription completed: {len(result['text'])} characters")
-            print(f"✅ Transcription completed: {len(result['text'])} characters")
+            logger.info(f"✅ Transcription completed: {len(result['text'])} characters, {len(segments)} segments")
+            print(f"✅ Transcription completed: {len(result['text'])} characters, {len(segments)} segments")
             print(f"📝 Preview: {result['text'][:200]}...")
             
             return {
                 'text': result['text'],
                 'language': result['language'],
-                'segments': result['segments'],
-                'duration': result.get('duration', 0)
+                'segments': segments,
+                'duration': self._duration(result, segments),
+                'word_timestamps': word_timestamps,
+                'model': model_id(self.backend_name, model_name, self.compute_type),
+                **({'model_selection': selection} if selection else {})
             }
             
         except Exception as e:
@@ -97,13 +198,20 @@ class WhisperService:
             traceback.print_exc()
             raise
     
-    def transcribe_video(self, video_path: str, language: str = "es") -> Dict[str, any]:
+    def transcribe_audio(self, audio_path: str, language: str = "es") -> Dict[str, any]:
         """
-        Transcribe video file (extracts audio and transcribes)
+        Transcribe audio file to text
+        """
+        return self.transcribe(audio_path, language)
+    
+    def transcribe_video(self, video_path: str, language: str = "es", word_timestamps: bool = False) -> Dict[str, any]:
+        """
+        Transcribe video file (Whisper extracts the audio itself)
         
         Args:
             video_path: Path to video file
             language: Language code
+            word_timestamps: Request word timestamps (for participation analysis)
         
         Returns:
             Dict with transcription and metadata
@@ -112,51 +220,150 @@ class WhisperService:
         print(f"🎥 Starting video transcription: {video_path}")
         
         # Whisper can handle video files directly
-        return self.transcribe_audio(video_path, language)
+        return self.transcribe(video_path, language, word_timestamps)
     
-    def transcribe_with_timestamps(self, audio_path: str, language: str = "es") -> Dict[str, any]:
+    def transcribe_minio_object(
+        self,
+        bucket: str,
+        object_name: str,
+        language: str = "es",
+        word_timestamps: bool = False,
+        queue_depth: Optional[int] = None,
+        progress: Optional[Callable[[float, float], None]] = None,
+        max_speakers: Optional[int] = None
+    ) -> Dict[str, any]:
         """
-        Transcribe with detailed timestamp information
+        Transcribe a video stored in MinIO, using the transcription cache
+        (ETag + model + language). A cache hit skips the download entirely.
+        With adaptive selection, a transcript from any candidate model is
+        reused (largest first).
+        
+        With word_timestamps (participation analysis) the decoded audio is
+        also diarized, with at most max_speakers speakers (the group size);
+        the result is cached together with the transcript.
         """
-        logger.info(f"⏱️ Starting transcription with timestamps: {audio_path}")
-        print(f"⏱️ Starting transcription with timestamps: {audio_path}")
+        etag = transcription_cache.etag(bucket, object_name)
+        for candidate in self._cache_models():
+            cached = transcription_cache.get(etag, candidate, language, word_timestamps)
+            if cached is not None:
+                print(f"⚡ Transcription cache hit: {bucket}/{object_name} "
+                      f"({len(cached['text'])} characters, {candidate})")
+                return {'model': candidate, **cached, 'cached': True}
         
-        if not self._initialized:
-            self.initialize()
+        # Derivado de audio de la subida (pocos MB) si existe; si no, el video.
+        # Nunca se guarda completo: ffmpeg lo decodifica una sola vez a PCM
+        source = find_derivative(bucket, object_name, etag) or object_name
+        if source != object_name:
+            print(f"🎧 Using audio derivative: {bucket}/{source}")
+        audio = self.load_audio_from_minio(bucket, source)
+        result = self.transcribe(audio, language, word_timestamps, queue_depth, progress)
+        if word_timestamps and DIARIZATION:
+            try:
+                result['diarization'] = diarize(audio, max_speakers, result['segments'])
+            except Exception as e:
+                # Sin diarización, analyze_participation usa las pausas
+                print(f"⚠️ Diarization failed: {e}")
+        del audio
         
-        try:
-            result = self.model.transcribe(
-                audio_path,
-                language=language,
-                fp16=False,
-                verbose=False,
-                word_timestamps=True
-            )
-            
-            # Format segments with timestamps
-            formatted_segments = []
-            for segment in result['segments']:
-                formatted_segments.append({
-                    'start': segment['start'],
-                    'end': segment['end'],
-                    'text': segment['text'],
-                    'words': segment.get('words', [])
-                })
-            
-            logger.info(f"✅ Transcription with timestamps completed: {len(formatted_segments)} segments")
-            print(f"✅ Transcription with timestamps completed: {len(formatted_segments)} segments")
-            
-            return {
-                'text': result['text'],
-                'language': result['language'],
-                'segments': formatted_segments,
-                'duration': result.get('duration', 0)
-            }
-            
-        except Exception as e:
-            logger.error(f"❌ Error in timestamp transcription: {str(e)}")
-            print(f"❌ Error in timestamp transcription: {str(e)}")
-            raise
+        transcription_cache.put(etag, result['model'], language, result)
+        return {**result, 'cached': False}
+    
+    def _cache_models(self) -> list:
+        """Modelos cuya transcripción sirve, del más grande al más pequeño"""
+        if self.selector is None:
+            return [self.model_id]
+        return [
+            model_id(self.backend_name, m, self.compute_type)
+            for m in reversed(self.selector.candidates)
+        ]
+    
+    def _ffmpeg_command(self, source: str) -> list:
+        # -nostdin solo cuando la entrada no es stdin
+        entrada = [] if source == "pipe:0" else ["-nostdin"]
+        return [
+            "ffmpeg", *entrada,
+            "-loglevel", "error",
+            "-i", source,
+            "-vn", "-f", "s16le", "-acodec", "pcm_s16le",
+            "-ac", "1", "-ar", str(SAMPLE_RATE),
+            "pipe:1"
+        ]
+    
+    def _decode_pcm(self, command: list, response=None) -> np.ndarray:
+        """
+        Run ffmpeg and collect its 16 kHz mono s16le output. With a MinIO
+        response, a writer thread streams it into stdin chunk by chunk.
+        """
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE if response is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        
+        def feed():
+            try:
+                for chunk in response.stream(STREAM_CHUNK_SIZE):
+                    process.stdin.write(chunk)
+            except (BrokenPipeError, ValueError):
+                # ffmpeg terminó antes (error de formato): se reporta abajo
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+        
+        stderr_chunks = []
+        stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+        stderr_reader.start()
+        writer = None
+        if response is not None:
+            writer = threading.Thread(target=feed, daemon=True)
+            writer.start()
+        
+        pcm = process.stdout.read()
+        process.wait()
+        if writer:
+            writer.join()
+        stderr_reader.join()
+        
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {b''.join(stderr_chunks).decode(errors='ignore').strip()[:500]}")
+        # Misma conversión que whisper.load_audio
+        return np.frombuffer(pcm, np.int16).flatten().astype(np.float32) / 32768.0
+    
+    def load_audio_from_minio(self, bucket: str, object_name: str) -> np.ndarray:
+        """
+        Decode a MinIO video straight to 16 kHz mono float32 PCM (the format
+        Whisper consumes) with a single ffmpeg pass, without holding the
+        video in memory or writing it to disk.
+        """
+        print(f"🎬 Decoding audio from MinIO: {bucket}/{object_name} (input: {WHISPER_AUDIO_INPUT})")
+        
+        if WHISPER_AUDIO_INPUT == "pipe":
+            response = minio_service.client.get_object(bucket, object_name)
+            try:
+                audio = self._decode_pcm(self._ffmpeg_command("pipe:0"), response)
+                print(f"✅ Audio decoded: {len(audio) / SAMPLE_RATE:.1f}s ({audio.nbytes / 1024 / 1024:.1f} MB PCM)")
+                return audio
+            except RuntimeError as e:
+                # Contenedores no streamables (MP4 con 'moov' al final) necesitan seek
+                print(f"⚠️ Streaming decode failed, retrying with seekable URL: {e}")
+            finally:
+                response.close()
+                response.release_conn()
+        
+        url = minio_service.get_file_url(object_name, bucket)
+        audio = self._decode_pcm(self._ffmpeg_command(url))
+        print(f"✅ Audio decoded: {len(audio) / SAMPLE_RATE:.1f}s ({audio.nbytes / 1024 / 1024:.1f} MB PCM)")
+        return audio
+    
+    def transcribe_with_timestamps(self, audio_path: str, language: str = "es") -> Dict[str, any]:
+        """
+        Transcribe with detailed timestamp information
+        """
+        return self.transcribe(audio_path, language, word_timestamps=True)
     
     def detect_speakers(self, segments: list) -> Dict[str, any]:
         """
@@ -237,51 +444,63 @@ class WhisperService:
             print(f"❌ {error_msg}")
             raise Exception(error_msg)
     
+    def analyze_participation(self, transcription_result: Dict[str, any]) -> Dict[str, any]:
+        """
+        Analyze student participation from an existing transcription result
+        (no extra Whisper pass)
+        """
+        logger.info("📊 Starting participation analysis")
+        print("📊 Starting participation analysis")
+        
+        diarization = transcription_result.get('diarization')
+        if diarization:
+            # Hablantes por voz (diarización sobre el audio)
+            speakers = [s['time'] for s in diarization['speakers']]
+            num_speakers = diarization['num_speakers']
+        else:
+            # Transcripción sin audio diarizado (p. ej. caché antigua): pausas
+            speaker_analysis = self.detect_speakers(transcription_result['segments'])
+            speakers = [s['total_time'] for s in speaker_analysis['speakers']]
+            num_speakers = speaker_analysis['num_speakers']
+        
+        # Calculate participation metrics
+        total_duration = transcription_result['duration']
+        participation_data = {
+            'total_duration': total_duration,
+            'transcription': transcription_result['text'],
+            'num_speakers_detected': num_speakers,
+            'method': 'diarization' if diarization else 'pauses',
+            'speaker_times': []
+        }
+        
+        for i, speaker_time in enumerate(speakers):
+            percentage = (speaker_time / total_duration * 100) if total_duration > 0 else 0
+            participation_data['speaker_times'].append({
+                'speaker_id': i + 1,
+                'time': round(speaker_time, 2),
+                'percentage': round(percentage, 2)
+            })
+            
+            logger.info(f"   Speaker {i+1}: {speaker_time:.2f}s ({percentage:.1f}%)")
+            print(f"   Speaker {i+1}: {speaker_time:.2f}s ({percentage:.1f}%)")
+        
+        logger.info(f"✅ Participation analysis completed")
+        print(f"✅ Participation analysis completed")
+        
+        return participation_data
+    
     def analyze_participation_from_video(self, video_path: str) -> Dict[str, any]:
         """
         Analyze student participation from video presentation
+        (transcribes once; prefer analyze_participation() if the video was
+        already transcribed)
         """
         logger.info(f"📊 Starting participation analysis: {video_path}")
         print(f"📊 Starting participation analysis: {video_path}")
         
         try:
-            # Transcribe video
-            logger.info("Step 1: Transcribing video with timestamps...")
-            print("Step 1: Transcribing video with timestamps...")
             transcription_result = self.transcribe_with_timestamps(video_path)
-            
-            # Detect potential speakers
-            logger.info("Step 2: Detecting speakers...")
-            print("Step 2: Detecting speakers...")
-            speaker_analysis = self.detect_speakers(transcription_result['segments'])
-            
-            # Calculate participation metrics
-            logger.info("Step 3: Calculating participation metrics...")
-            print("Step 3: Calculating participation metrics...")
-            total_duration = transcription_result['duration']
-            participation_data = {
-                'total_duration': total_duration,
-                'transcription': transcription_result['text'],
-                'num_speakers_detected': speaker_analysis['num_speakers'],
-                'speaker_times': []
-            }
-            
-            for i, speaker in enumerate(speaker_analysis['speakers']):
-                speaker_time = speaker['total_time']
-                percentage = (speaker_time / total_duration * 100) if total_duration > 0 else 0
-                participation_data['speaker_times'].append({
-                    'speaker_id': i + 1,
-                    'time': round(speaker_time, 2),
-                    'percentage': round(percentage, 2)
-                })
-                
-                logger.info(f"   Speaker {i+1}: {speaker_time:.2f}s ({percentage:.1f}%)")
-                print(f"   Speaker {i+1}: {speaker_time:.2f}s ({percentage:.1f}%)")
-            
-            logger.info(f"✅ Participation analysis completed")
-            print(f"✅ Participation analysis completed")
-            
-            return participation_data
+            return self.analyze_participation(transcription_result)
             
         except Exception as e:
             logger.error(f"❌ Error in participation analysis: {str(e)}")
@@ -0,0 +1,165 @@
+"""
+Benchmark de la diarización con audio sintético (sin datos de alumnos).
+Genera presentaciones de N hablantes: cada uno con su tono (f0) y su tracto
+vocal (formantes desplazados), turnos de duración aleatoria y pausas, más
+ruido de fondo. Reporta por caso los hablantes detectados frente a los
+reales, la pureza y cobertura de los turnos, el error de tiempo de habla y los
+segundos de CPU por minuto de audio frente al presupuesto.
+
+Uso (desde backend/):
+    python -m benchmarks.diarization_benchmark
+    python -m benchmarks.diarization_benchmark --speakers 2,3,4,5 --minutes 5 --seed 7
+    python -m benchmarks.diarization_benchmark --budget 0.25 --json diarization.json
+"""
+
+import argparse
+import json
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.services import diarization
+from app.services.parallel_transcription import SAMPLE_RATE
+
+# Formantes (F1, F2, F3) de las vocales del español
+VOCALES = np.array([
+    [800, 1200, 2500],   # a
+    [450, 1900, 2600],   # e
+    [300, 2300, 3000],   # i
+    [500, 900, 2400],    # o
+    [320, 800, 2300],    # u
+])
+SILABA_S = 0.2
+
+
+def voz(rng: np.random.Generator, segundos: float, f0: float, tracto: float) -> np.ndarray:
+    """Sílabas de una vocal al azar: tren de pulsos glotales filtrado por los formantes"""
+    n_sil = max(1, int(segundos / SILABA_S))
+    largo = int(SILABA_S * SAMPLE_RATE)
+    freqs = np.fft.rfftfreq(largo, 1 / SAMPLE_RATE)
+    partes = []
+    for _ in range(n_sil):
+        f = f0 * rng.uniform(0.9, 1.1)
+        t = np.arange(largo) / SAMPLE_RATE
+        pulsos = 2 * ((t * f) % 1.0) - 1  # diente de sierra (rico en armónicos)
+        formantes = VOCALES[rng.integers(len(VOCALES))] * tracto
+        envolvente = sum(np.exp(-0.5 * ((freqs - fm) / (60 + fm * 0.08)) ** 2) for fm in formantes)
+        silaba = np.fft.irfft(np.fft.rfft(pulsos) * envolvente, n=largo)
+        silaba *= np.hanning(largo) * rng.uniform(0.5, 1.0)
+        partes.append(silaba)
+    senal = np.concatenate(partes)
+    return (senal / (np.abs(senal).max() + 1e-9) * 0.3).astype(np.float32)
+
+
+def presentacion(
+    rng: np.random.Generator, hablantes: int, minutos: float
+) -> Tuple[np.ndarray, List[Tuple[float, float, int]]]:
+    """Audio y turnos reales [(inicio, fin, hablante)]"""
+    perfiles = [(rng.uniform(95, 240), rng.uniform(0.85, 1.2)) for _ in range(hablantes)]
+    # Participación desigual, como en un grupo real
+    pesos = rng.dirichlet(np.full(hablantes, 2.0))
+    total = int(minutos * 60 * SAMPLE_RATE)
+    audio = []
+    turnos = []
+    pos = 0
+    anterior = -1
+    while pos < total:
+        h = int(rng.choice(hablantes, p=pesos))
+        if h == anterior and hablantes > 1:
+            continue
+        anterior = h
+        dur = float(rng.uniform(3, 20))
+        segmento = voz(rng, dur, *perfiles[h])
+        pausa = np.zeros(int(rng.uniform(0.3, 1.5) * SAMPLE_RATE), dtype=np.float32)
+        turnos.append((pos / SAMPLE_RATE, (pos + len(segmento)) / SAMPLE_RATE, h))
+        audio += [segmento, pausa]
+        pos += len(segmento) + len(pausa)
+    audio = np.concatenate(audio)[:total]
+    audio += rng.normal(0, 0.003, len(audio)).astype(np.float32)
+    return audio, turnos
+
+
+def evaluar(
+    audio: np.ndarray, turnos: List[Tuple[float, float, int]], hablantes: int, holgura: int, budget: float
+) -> Dict:
+    segments = [{'start': a, 'end': b, 'text': ''} for a, b, _ in turnos]
+    result = diarization.diarize(
+        audio, max_speakers=hablantes + holgura, segments=segments, cpu_per_minute=budget
+    )
+
+    # Tiempo de habla por (hablante real, hablante detectado) según los turnos etiquetados
+    conteo = np.zeros((hablantes, result['num_speakers'] + 1))
+    for (a, b, h), s in zip(turnos, segments):
+        conteo[h, s.get('speaker', 0)] += b - a
+    tiempo_real = conteo.sum(axis=1)
+    # Pureza: cada hablante detectado es una sola persona (penaliza unir)
+    pureza = conteo.max(axis=0).sum() / conteo.sum()
+    # Cobertura: cada persona cae en un solo hablante detectado (penaliza partir)
+    cobertura = conteo.max(axis=1).sum() / conteo.sum()
+
+    # Error de tiempo de habla: repartos ordenados (real vs detectado)
+    real = np.sort(tiempo_real / tiempo_real.sum())[::-1]
+    detectado = np.array([s['time'] for s in result['speakers']])
+    detectado = np.sort(detectado / max(detectado.sum(), 1e-9))[::-1] if len(detectado) else np.zeros(0)
+    k = max(len(real), len(detectado))
+    error = np.abs(np.pad(real, (0, k - len(real))) - np.pad(detectado, (0, k - len(detectado)))).sum() / 2
+
+    minutos = len(audio) / SAMPLE_RATE / 60
+    return {
+        "speakers": hablantes,
+        "detected": result['num_speakers'],
+        "purity": float(pureza),
+        "coverage": float(cobertura),
+        "talk_time_error": float(error),
+        "windows": result['windows'],
+        "cpu_per_minute": result['cpu_seconds'] / minutos,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--speakers", default="2,3,4,5", help="Tamaños de grupo a probar")
+    parser.add_argument("--minutes", type=float, default=5.0, help="Duración de cada presentación")
+    parser.add_argument("--runs", type=int, default=3, help="Presentaciones por tamaño de grupo")
+    parser.add_argument("--budget", type=float, default=diarization.DIARIZATION_CPU_PER_MINUTE,
+                        help="Segundos de CPU por minuto de audio")
+    parser.add_argument("--slack", type=int, default=0,
+                        help="Tope de hablantes = tamaño del grupo + slack (miembros que no hablan)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("👥 BENCHMARK DE DIARIZACIÓN (audio sintético)")
+    print("=" * 60)
+    print(f"   {args.minutes:.1f} min por presentación, presupuesto {args.budget:.2f}s CPU/min")
+
+    rng = np.random.default_rng(args.seed)
+    resultados = []
+    for hablantes in [int(h) for h in args.speakers.split(",") if h.strip()]:
+        for _ in range(args.runs):
+            audio, turnos = presentacion(rng, hablantes, args.minutes)
+            resultados.append(evaluar(audio, turnos, hablantes, args.slack, args.budget))
+
+    print(f"\n{'reales':>7}{'detectados':>12}{'pureza':>9}{'cobertura':>11}{'err. tiempo':>13}"
+          f"{'ventanas':>10}{'CPU s/min':>11}")
+    for r in resultados:
+        print(f"{r['speakers']:>7}{r['detected']:>12}{r['purity']:>9.2f}{r['coverage']:>11.2f}"
+              f"{r['talk_time_error']:>13.2f}"
+              f"{r['windows']:>10}{r['cpu_per_minute']:>11.3f}")
+
+    exactos = sum(1 for r in resultados if r['detected'] == r['speakers'])
+    dentro = sum(1 for r in resultados if r['cpu_per_minute'] <= args.budget)
+    print(f"\n📊 Hablantes exactos: {exactos}/{len(resultados)}, "
+          f"pureza media {np.mean([r['purity'] for r in resultados]):.2f}, "
+          f"cobertura media {np.mean([r['coverage'] for r in resultados]):.2f}, "
+          f"dentro del presupuesto: {dentro}/{len(resultados)}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": resultados}, f, indent=2)
+        print(f"\n💾 Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
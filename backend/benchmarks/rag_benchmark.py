@@ -0,0 +1,249 @@
+"""
+Benchmark de recuperadores del RAG sobre dataset.jsonl.
+Separa un conjunto held-out del dataset: los índices se construyen solo con
+el resto y las entradas held-out se usan como consultas. Por recuperador
+reporta latencia (p50/p95/p99), memoria y calidad de los ejemplos recuperados.
+
+Calidad = acuerdo de puntajes: error absoluto medio entre el puntaje de la
+consulta y el promedio de los k ejemplos recuperados (menor es mejor), y
+porcentaje de consultas cuyo promedio queda a <= 2 puntos.
+
+Memoria = lo retenido por los índices según tracemalloc (pico entre
+paréntesis) y el crecimiento del RSS del proceso. Los embeddings
+memory-mapped y los pesos del modelo no cuentan en tracemalloc; sí en el RSS.
+
+Funciona offline: keyword/bm25 son puros en memoria; vector/hybrid necesitan
+el modelo de embeddings en la caché local; pgvector, una base local cargada
+con cargar_pgvector.py (las consultas held-out se excluyen del resultado).
+
+Uso (desde backend/):
+    python -m benchmarks.rag_benchmark --dataset /ruta/dataset.jsonl
+    python -m benchmarks.rag_benchmark --backends keyword,bm25,vector,hybrid --holdout 0.2
+    python -m benchmarks.rag_benchmark --backends pgvector --pg-url postgresql://localhost/codementor
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.services.rag_service import RAGService, DATASET_PATH
+
+BACKENDS_EN_MEMORIA = ("keyword", "bm25", "vector", "hybrid")
+
+SQL_PGVECTOR_HELDOUT = """
+SELECT puntaje_total
+FROM evaluaciones_historicas
+WHERE NOT (external_id = ANY($3::text[]))
+ORDER BY codigo_embedding <=> $1::vector
+LIMIT $2
+"""
+
+
+def percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def rss_mb() -> float:
+    """RSS actual del proceso (Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        return 0.0
+
+
+def cargar_dataset(ruta: str) -> List[Dict]:
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def dividir(dataset: List[Dict], holdout: float, seed: int, max_queries: int) -> Tuple[List[Dict], List[Dict]]:
+    """(indexados, consultas held-out)"""
+    indices = list(range(len(dataset)))
+    random.Random(seed).shuffle(indices)
+    n_test = max(1, int(len(dataset) * holdout))
+    test = set(indices[:n_test])
+    indexados = [d for i, d in enumerate(dataset) if i not in test]
+    consultas = [dataset[i] for i in sorted(test)]
+    if max_queries and max_queries < len(consultas):
+        consultas = consultas[:max_queries]
+    return indexados, consultas
+
+
+def evaluar(
+    nombre: str,
+    buscar: Callable[[Dict, int], List[float]],
+    consultas: List[Dict],
+    k: int,
+    memoria: Optional[Dict] = None
+) -> Dict:
+    """Ejecuta las consultas (buscar -> puntajes de los k recuperados) y calcula latencia y acuerdo"""
+    latencias = []
+    errores = []
+    vacias = 0
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        puntajes = buscar(consulta, k)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+        puntajes = [p for p in puntajes if isinstance(p, (int, float))]
+        if not puntajes or not isinstance(consulta.get('puntaje_total'), (int, float)):
+            vacias += 1
+            continue
+        errores.append(abs(consulta['puntaje_total'] - sum(puntajes) / len(puntajes)))
+
+    return {
+        "retriever": nombre,
+        "queries": len(consultas),
+        "empty": vacias,
+        "p50_ms": percentil(latencias, 0.50),
+        "p95_ms": percentil(latencias, 0.95),
+        "p99_ms": percentil(latencias, 0.99),
+        "mae": sum(errores) / len(errores) if errores else float('nan'),
+        "within_2": sum(1 for e in errores if e <= 2) / len(errores) * 100 if errores else 0.0,
+        **(memoria or {"heap_mb": 0.0, "heap_peak_mb": 0.0, "rss_mb": 0.0})
+    }
+
+
+def medir_memoria(preparar: Callable[[], None]) -> Dict:
+    """Memoria que retiene (y el pico que necesita) la construcción de un índice"""
+    rss_antes = rss_mb()
+    tracemalloc.start()
+    try:
+        preparar()
+        actual, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "heap_mb": actual / 1024 ** 2,
+        "heap_peak_mb": pico / 1024 ** 2,
+        "rss_mb": max(0.0, rss_mb() - rss_antes)
+    }
+
+
+def backend_en_memoria(nombre: str, indexados_path: str, indexados: List[Dict], consultas: List[Dict], k: int) -> Dict:
+    # Servicio nuevo por recuperador: la memoria medida es solo la suya
+    rag = RAGService(indexados_path, retriever=nombre)
+
+    def preparar():
+        rag._asegurar_cargado()
+        # La primera consulta construye lo perezoso (keyword, .npy, modelo)
+        rag.buscar_ids(consultas[0].get('codigo', ''), k, nombre, consultas[0].get('semana'))
+
+    memoria = medir_memoria(preparar)
+
+    def buscar(consulta, limit):
+        ids = rag.buscar_ids(consulta.get('codigo', ''), limit, nombre, consulta.get('semana'))
+        return [indexados[d].get('puntaje_total') for d in ids]
+
+    return evaluar(nombre, buscar, consultas, k, memoria)
+
+
+def backend_pgvector(pg_url: str, consultas: List[Dict], k: int) -> Optional[Dict]:
+    rag = RAGService(DATASET_PATH, retriever="pgvector")
+    if pg_url:
+        rag.pgvector_url = pg_url
+    excluidos = [str(c.get('id')) for c in consultas]
+    loop = asyncio.new_event_loop()
+
+    def preparar():
+        rag.embedder.encode(consultas[0].get('codigo', ''))
+        loop.run_until_complete(rag._get_pool())
+
+    try:
+        memoria = medir_memoria(preparar)
+    except Exception as e:
+        print(f"⚠️ pgvector no disponible, se omite: {e}")
+        loop.close()
+        return None
+
+    async def consultar(codigo, limit):
+        embedding, _ = rag.embedder.encode(codigo)
+        vector = "[" + ",".join(f"{v:.6f}" for v in embedding) + "]"
+        filas = await rag.db_pool.fetch(SQL_PGVECTOR_HELDOUT, vector, limit, excluidos)
+        return [f["puntaje_total"] for f in filas]
+
+    def buscar(consulta, limit):
+        return loop.run_until_complete(consultar(consulta.get('codigo', ''), limit))
+
+    try:
+        return evaluar("pgvector", buscar, consultas, k, memoria)
+    finally:
+        loop.run_until_complete(rag.close())
+        loop.close()
+
+
+def imprimir(resultados: List[Dict]):
+    print(f"\n{'retriever':<12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'MAE':>8}{'<=2 pts':>9}{'vacías':>8}"
+          f"{'heap MB':>16}{'RSS MB':>9}")
+    for r in resultados:
+        heap = f"{r['heap_mb']:.1f} ({r['heap_peak_mb']:.1f})"
+        print(f"{r['retriever']:<12}{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}{r['p99_ms']:>9.3f}"
+              f"{r['mae']:>8.2f}{r['within_2']:>8.1f}%{r['empty']:>8}{heap:>16}{r['rss_mb']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--backends", default="keyword,bm25",
+                        help="Lista separada por comas: keyword, bm25, vector, hybrid, pgvector")
+    parser.add_argument("--k", type=int, default=3, help="Ejemplos recuperados por consulta")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fracción del dataset usada como consultas")
+    parser.add_argument("--queries", type=int, default=0, help="Máximo de consultas (0 = todo el held-out)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pg-url", default="", help="Postgres con evaluaciones_historicas (por defecto RAG_PGVECTOR_URL)")
+    parser.add_argument("--json", help="Guardar resultados en este archivo (para comparar entre cambios)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🔎 BENCHMARK DE RECUPERADORES RAG")
+    print("=" * 60)
+
+    if not os.path.exists(args.dataset):
+        print(f"❌ No se encontró el dataset: {args.dataset}")
+        return
+    dataset = cargar_dataset(args.dataset)
+    indexados, consultas = dividir(dataset, args.holdout, args.seed, args.queries)
+    print(f"   {len(indexados)} evaluaciones indexadas, {len(consultas)} consultas held-out")
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Los índices en proceso solo ven la parte no held-out
+        indexados_path = os.path.join(tmp, "dataset.jsonl")
+        with open(indexados_path, 'w', encoding='utf-8') as f:
+            for ejemplo in indexados:
+                f.write(json.dumps(ejemplo, ensure_ascii=False) + "\n")
+
+        for nombre in backends:
+            print(f"\n▶ {nombre}")
+            if nombre in BACKENDS_EN_MEMORIA:
+                try:
+                    resultados.append(backend_en_memoria(nombre, indexados_path, indexados, consultas, args.k))
+                except Exception as e:
+                    print(f"⚠️ {nombre} no disponible, se omite: {e}")
+            elif nombre == "pgvector":
+                resultado = backend_pgvector(args.pg_url, consultas, args.k)
+                if resultado:
+                    resultados.append(resultado)
+            else:
+                print(f"⚠️ Recuperador desconocido: {nombre}")
+
+    imprimir(resultados)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": resultados}, f, indent=2)
+        print(f"\n💾 Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
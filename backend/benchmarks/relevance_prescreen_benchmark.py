@@ -0,0 +1,129 @@
+"""
+Benchmark del pre-filtro de relevancia por embeddings.
+Cuenta cuántas verificaciones de relevancia se resuelven sin llamar al LLM
+y, cuando existe una decisión previa del LLM, cuánto coinciden.
+
+Uso (desde backend/):
+    python -m benchmarks.relevance_prescreen_benchmark
+    python -m benchmarks.relevance_prescreen_benchmark --jsonl casos.jsonl
+    python -m benchmarks.relevance_prescreen_benchmark --high 0.6 --low 0.2
+
+Formato de --jsonl (una línea por caso):
+    {"transcript": "...", "requirements": "...", "is_relevant": true}
+"""
+
+import argparse
+import json
+import time
+from typing import Dict, List
+
+from app.services.relevance_screen import relevance_screen
+
+
+def cargar_casos_bd() -> List[Dict]:
+    """Submissions con transcripción guardada y sus requisitos"""
+    from app.db.session import SessionLocal
+    from app.models.models import Submission, Assignment
+
+    db = SessionLocal()
+    try:
+        filas = (
+            db.query(Submission, Assignment)
+            .join(Assignment, Submission.assignment_id == Assignment.assignment_id)
+            .filter(Submission.video_transcription.isnot(None))
+            .all()
+        )
+        casos = []
+        for submission, assignment in filas:
+            if len(submission.video_transcription or "") <= 50:
+                continue
+            referencia = None
+            if submission.video_relevance_check:
+                try:
+                    check = json.loads(submission.video_relevance_check)
+                    # Solo decisiones del LLM sirven como referencia
+                    if check.get("method") != "embedding" and isinstance(check.get("is_relevant"), bool):
+                        referencia = check["is_relevant"] and float(check.get("confidence", 0.5)) >= 0.6
+                except (ValueError, TypeError):
+                    pass
+            casos.append({
+                "id": submission.submission_id,
+                "assignment_id": assignment.assignment_id,
+                "transcript": submission.video_transcription,
+                "requirements": assignment.requirements or "",
+                "is_relevant": referencia
+            })
+        return casos
+    finally:
+        db.close()
+
+
+def cargar_casos_jsonl(ruta: str) -> List[Dict]:
+    casos = []
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for i, linea in enumerate(f):
+            if linea.strip():
+                caso = json.loads(linea)
+                caso.setdefault("id", i)
+                caso.setdefault("assignment_id", None)
+                casos.append(caso)
+    return casos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jsonl", help="Casos offline en JSONL (por defecto: base de datos)")
+    parser.add_argument("--high", type=float, default=relevance_screen.high)
+    parser.add_argument("--low", type=float, default=relevance_screen.low)
+    args = parser.parse_args()
+
+    relevance_screen.high = args.high
+    relevance_screen.low = args.low
+
+    print("=" * 60)
+    print("🧮 BENCHMARK PRE-FILTRO DE RELEVANCIA")
+    print("=" * 60)
+
+    casos = cargar_casos_jsonl(args.jsonl) if args.jsonl else cargar_casos_bd()
+    print(f"   {len(casos)} casos con transcripción")
+    if not casos:
+        return
+
+    relevance_screen.initialize()
+
+    decididos = 0
+    con_referencia = 0
+    coincidencias = 0
+    tiempos = []
+    similitudes = []
+
+    for caso in casos:
+        inicio = time.perf_counter()
+        sim = relevance_screen.max_similarity(caso["transcript"], caso["requirements"], caso["assignment_id"])
+        tiempos.append(time.perf_counter() - inicio)
+        similitudes.append(sim)
+
+        decision = relevance_screen.classify(sim)
+        if decision == "ambiguous":
+            continue
+        decididos += 1
+        if caso.get("is_relevant") is not None:
+            con_referencia += 1
+            if (decision == "relevant") == caso["is_relevant"]:
+                coincidencias += 1
+
+    total = len(casos)
+    tiempos.sort()
+    print(f"\n📊 Umbrales: high={args.high}, low={args.low}")
+    print(f"   Llamadas al LLM evitadas: {decididos}/{total} ({decididos / total * 100:.1f}%)")
+    print(f"   Llamadas al LLM restantes (ambiguos): {total - decididos}")
+    if con_referencia:
+        print(f"   Acuerdo con decisiones previas del LLM: {coincidencias}/{con_referencia} "
+              f"({coincidencias / con_referencia * 100:.1f}%)")
+    print(f"   Similitud: min {min(similitudes):.3f}, max {max(similitudes):.3f}")
+    print(f"   Latencia pre-filtro: p50 {tiempos[total // 2] * 1000:.1f}ms, "
+          f"p95 {tiempos[min(total - 1, int(total * 0.95))] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Benchmark de los motores de Whisper (openai-whisper vs faster-whisper int8).
+Transcribe un directorio local de audios y reporta, por motor, el WER contra
+la transcripción de referencia, el factor de tiempo real (RTF = segundos de
+cómputo / segundos de audio), el throughput y el tiempo de carga del modelo.
+
+Fixtures: cada audio (.wav, .mp3, .ogg, .m4a, .mp4...) con su referencia en
+un .txt del mismo nombre. Los audios sin .txt solo cuentan para RTF.
+
+    fixtures/
+        clase01.wav
+        clase01.txt
+
+Funciona offline si los modelos ya están en la caché local.
+
+Uso (desde backend/):
+    python -m benchmarks.whisper_benchmark --fixtures /ruta/fixtures
+    python -m benchmarks.whisper_benchmark --fixtures /ruta/fixtures --backends openai,faster-whisper --model small
+    python -m benchmarks.whisper_benchmark --fixtures /ruta/fixtures --compute-type int8_float32 --json whisper.json
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+import unicodedata
+import wave
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.whisper_backends import BACKENDS, get_backend, model_id
+
+SAMPLE_RATE = 16000
+EXTENSIONES_AUDIO = (".wav", ".mp3", ".ogg", ".opus", ".m4a", ".flac", ".mp4", ".webm")
+
+
+def normalizar(texto: str) -> List[str]:
+    """Minúsculas, sin tildes ni puntuación: el WER solo mide palabras"""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.findall(r"[a-z0-9ñ]+", texto)
+
+
+def distancia_palabras(referencia: List[str], hipotesis: List[str]) -> int:
+    """Distancia de edición (sustituciones + inserciones + borrados) entre listas de palabras"""
+    anterior = list(range(len(hipotesis) + 1))
+    for i, ref in enumerate(referencia, 1):
+        actual = [i] + [0] * len(hipotesis)
+        for j, hip in enumerate(hipotesis, 1):
+            actual[j] = min(
+                anterior[j] + 1,
+                actual[j - 1] + 1,
+                anterior[j - 1] + (ref != hip)
+            )
+        anterior = actual
+    return anterior[-1]
+
+
+def cargar_audio(ruta: str) -> np.ndarray:
+    """PCM float32 mono 16 kHz; los .wav compatibles se leen sin ffmpeg"""
+    if ruta.endswith(".wav"):
+        with wave.open(ruta, "rb") as f:
+            if f.getframerate() == SAMPLE_RATE and f.getnchannels() == 1 and f.getsampwidth() == 2:
+                pcm = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+                return pcm.astype(np.float32) / 32768.0
+    import whisper
+    return whisper.load_audio(ruta)
+
+
+def cargar_fixtures(directorio: str) -> List[Tuple[str, np.ndarray, Optional[str]]]:
+    fixtures = []
+    for nombre in sorted(os.listdir(directorio)):
+        base, ext = os.path.splitext(nombre)
+        if ext.lower() not in EXTENSIONES_AUDIO:
+            continue
+        ruta_txt = os.path.join(directorio, base + ".txt")
+        referencia = None
+        if os.path.exists(ruta_txt):
+            with open(ruta_txt, "r", encoding="utf-8") as f:
+                referencia = f.read()
+        fixtures.append((nombre, cargar_audio(os.path.join(directorio, nombre)), referencia))
+    return fixtures
+
+
+def medir_backend(
+    nombre: str,
+    model_name: str,
+    compute_type: str,
+    fixtures: List[Tuple[str, np.ndarray, Optional[str]]],
+    language: str,
+    threads: Optional[int]
+) -> Dict:
+    backend = get_backend(nombre, compute_type)
+    inicio = time.perf_counter()
+    backend.load(model_name, threads)
+    carga_s = time.perf_counter() - inicio
+
+    errores = 0
+    palabras_ref = 0
+    segundos_audio = 0.0
+    segundos_computo = 0.0
+    por_archivo = []
+    for archivo, audio, referencia in fixtures:
+        inicio = time.perf_counter()
+        result = backend.transcribe(audio, language=language)
+        computo = time.perf_counter() - inicio
+        duracion = len(audio) / SAMPLE_RATE
+        segundos_audio += duracion
+        segundos_computo += computo
+
+        wer = None
+        if referencia is not None:
+            ref = normalizar(referencia)
+            dist = distancia_palabras(ref, normalizar(result["text"]))
+            errores += dist
+            palabras_ref += len(ref)
+            wer = dist / max(1, len(ref))
+        por_archivo.append({"file": archivo, "seconds": round(duracion, 2),
+                            "rtf": computo / max(duracion, 1e-6), "wer": wer})
+        print(f"   {archivo}: {duracion:.1f}s audio, {computo:.1f}s cómputo"
+              + (f", WER {wer:.3f}" if wer is not None else ""))
+
+    return {
+        "backend": nombre,
+        "model": model_id(nombre, model_name, compute_type),
+        "load_s": carga_s,
+        "audio_s": segundos_audio,
+        "compute_s": segundos_computo,
+        "rtf": segundos_computo / max(segundos_audio, 1e-6),
+        "throughput": segundos_audio / max(segundos_computo, 1e-6),
+        # WER agregado (errores totales / palabras de referencia), no promedio por archivo
+        "wer": errores / palabras_ref if palabras_ref else float("nan"),
+        "files": por_archivo
+    }
+
+
+def imprimir(resultados: List[Dict]):
+    print(f"\n{'modelo':<28}{'carga s':>9}{'RTF':>8}{'x tiempo real':>15}{'WER':>8}")
+    for r in resultados:
+        print(f"{r['model']:<28}{r['load_s']:>9.1f}{r['rtf']:>8.3f}{r['throughput']:>15.1f}{r['wer']:>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", required=True, help="Directorio con audios y referencias .txt")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help=f"Lista separada por comas: {', '.join(BACKENDS)}")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--compute-type", default="int8", help="Tipo de cómputo de faster-whisper")
+    parser.add_argument("--language", default="es")
+    parser.add_argument("--threads", type=int, default=0, help="Hilos de CPU (0 = por defecto del motor)")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🎙️ BENCHMARK DE MOTORES WHISPER")
+    print("=" * 60)
+
+    if not os.path.isdir(args.fixtures):
+        print(f"❌ No se encontró el directorio de fixtures: {args.fixtures}")
+        return
+    fixtures = cargar_fixtures(args.fixtures)
+    con_referencia = sum(1 for _, _, r in fixtures if r is not None)
+    total_s = sum(len(a) for _, a, _ in fixtures) / SAMPLE_RATE
+    print(f"   {len(fixtures)} audios ({total_s:.1f}s), {con_referencia} con referencia")
+    if not fixtures:
+        return
+
+    resultados = []
+    for nombre in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        print(f"\n▶ {nombre}")
+        try:
+            resultados.append(medir_backend(
+                nombre, args.model, args.compute_type, fixtures, args.language, args.threads or None
+            ))
+        except Exception as e:
+            print(f"⚠️ {nombre} no disponible, se omite: {e}")
+
+    imprimir(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": resultados}, f, indent=2)
+        print(f"\n💾 Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ from app.db.session import engine, Base
 from app.models.models import (
     Student, Instructor, Section, Assignment,
     Submission, Grade, Feedback, PlagiarismDetection,
-    TeamParticipation, SimpleLog
+    TeamParticipation, SimpleLog, TranscriptionJob
 )
 
 def init_db():
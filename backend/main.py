@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import get_settings
@@ -32,6 +33,27 @@ app.include_router(plagiarism.router, prefix="/api/plagiarism", tags=["Plagiaris
 app.include_router(sections.router, prefix="/api/sections", tags=["Sections"])
 app.include_router(feedback.router, prefix="/api/feedback", tags=["Feedback"]) 
 
+@app.on_event("startup")
+async def startup():
+    # Ingesta incremental de evaluaciones revisadas al corpus RAG
+    from app.services.ollama_service import ollama_service
+    from app.services.rag_ingestion import RAG_INGEST, ingest_loop
+    if ollama_service.use_rag and RAG_INGEST:
+        app.state.rag_ingest_task = asyncio.create_task(ingest_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    from app.services.rag_service import rag_service
+    task = getattr(app.state, "rag_ingest_task", None)
+    if task:
+        task.cancel()
+    await rag_service.close()
+    from app.services.whisper_service import whisper_service
+    if whisper_service.parallel is not None:
+        whisper_service.parallel.shutdown()
+
+
 @app.get("/")
 def root():
     return {
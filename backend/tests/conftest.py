@@ -0,0 +1,68 @@
+"""
+Fixtures comunes: datasets JSONL temporales y un encoder determinista
+(sin descargar modelos).
+"""
+
+import hashlib
+import json
+
+import numpy as np
+import pytest
+
+from app.services.rag_index import CodeEmbedder, tokenizar_csharp
+
+DIMENSION = 32
+
+
+class BolsaDePalabras:
+    """Reemplaza a SentenceTransformer: bolsa de términos C# con hashing a DIMENSION"""
+
+    def __init__(self):
+        self.llamadas = 0
+
+    def encode(self, textos, **kwargs):
+        self.llamadas += 1
+        matriz = np.zeros((len(textos), DIMENSION), dtype=np.float32)
+        for fila, texto in enumerate(textos):
+            for token in tokenizar_csharp(texto):
+                matriz[fila, int(hashlib.md5(token.encode()).hexdigest(), 16) % DIMENSION] += 1.0
+        return matriz
+
+
+@pytest.fixture
+def embedder():
+    codigo = CodeEmbedder("bolsa-de-palabras", DIMENSION)
+    codigo.model = BolsaDePalabras()
+    return codigo
+
+
+def escribir_jsonl(path, ejemplos):
+    with open(path, 'w', encoding='utf-8') as f:
+        for ejemplo in ejemplos:
+            f.write(json.dumps(ejemplo, ensure_ascii=False) + "\n")
+    return str(path)
+
+
+CODIGOS = [
+    "public class Producto { string Nombre; decimal Precio; }",
+    "public class Inventario { List<Producto> productos; void AgregarProducto(Producto p) { productos.Add(p); } }",
+    "public class Venta { Cliente cliente; decimal CalcularTotal() { return 0; } }",
+    "public class Cliente { string Nombre; string Correo; }",
+    "private void btnAgregarProducto_Click(object sender, EventArgs e) { inventario.AgregarProducto(producto); }",
+]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    ejemplos = [
+        {
+            "id": i,
+            "semana": f"Semana {1 + i % 2}",
+            "codigo": codigo,
+            "puntaje_total": 10 + i,
+            "rubrica": {"comprension": 3, "diseno": 3, "implementacion": 3, "funcionalidad": 3},
+            "feedback": f"feedback {i}"
+        }
+        for i, codigo in enumerate(CODIGOS)
+    ]
+    return escribir_jsonl(tmp_path / "dataset.jsonl", ejemplos)
@@ -0,0 +1,101 @@
+import pytest
+
+from app.services.prompt_packer import (
+    MARCA_TRUNCADO, PromptPacker, comprimir, comprimir_csharp, quitar_comentarios, separar_archivos
+)
+
+
+class TokenizerPorPalabras:
+    """Un token por palabra: presupuestos fáciles de razonar"""
+
+    def encode(self, texto, add_special_tokens=False):
+        return texto.split()
+
+
+class TokenizerConSaltos:
+    """Una palabra o un salto de línea por token: los separadores también cuestan"""
+
+    def encode(self, texto, add_special_tokens=False):
+        return texto.split() + ["\n"] * texto.count("\n")
+
+
+@pytest.fixture
+def packer():
+    packer = PromptPacker()
+    packer._tokenizer = TokenizerPorPalabras()
+    packer._tokenizer_loaded = True
+    return packer
+
+
+def test_quitar_comentarios_respeta_cadenas():
+    codigo = 'var url = "http://sitio"; // comentario\nvar ruta = @"C:\\dir//x"; /* bloque */ int x = 1;'
+    assert quitar_comentarios(codigo) == 'var url = "http://sitio"; \nvar ruta = @"C:\\dir//x";  int x = 1;'
+
+
+def test_comprimir_csharp():
+    codigo = "using System;\n\n#region Campos\n    // nombre\n    string nombre;\n#endregion\n"
+    assert comprimir_csharp(codigo) == "string nombre;"
+
+
+def test_comprimir_solo_aplica_csharp_a_cs():
+    python = "def mitad(x):\n\n    return x // 2  # entero\n"
+    assert comprimir("calculo.py", python) == "def mitad(x):\n    return x // 2  # entero"
+    assert comprimir("Calculo.CS", "int x = 4; // mitad") == "int x = 4;"
+
+
+def test_separar_archivos():
+    codigo = "// File: A.cs\nclass A {}\n\n// File: B.cs\nclass B {}\n"
+    assert {k: v.strip() for k, v in separar_archivos(codigo).items()} == {"A.cs": "class A {}", "B.cs": "class B {}"}
+    assert separar_archivos("class A {}") == {"": "class A {}"}
+
+
+def test_truncar_una_sola_linea_respeta_el_presupuesto(packer):
+    transcripcion = " ".join(["palabra"] * 1000)
+    truncado = packer.pack_transcript(transcripcion)
+    assert 0 < packer.count_tokens(truncado) <= 400
+
+
+def test_truncar_por_lineas(packer):
+    texto = "\n".join(f"linea numero {i}" for i in range(10))
+    truncado = packer.truncar(texto, 7)
+    assert truncado == "linea numero 0\nlinea numero 1"
+
+
+def test_pack_sigue_con_archivos_mas_chicos(packer):
+    archivos = {
+        "Inventario.cs": "class Inventario {\n" + "int producto;\n" * 200 + "}",
+        "Producto.cs": "class Producto { string nombre; }",
+        "Otro.cs": "class Otro { }",
+    }
+    packed = packer.pack(archivos, "inventario producto", budget=120)
+
+    # El archivo más relevante no cabe entero, pero los chicos entran y el
+    # presupuesto restante se llena con el primero truncado
+    assert "// File: Producto.cs" in packed["code"]
+    assert "// File: Otro.cs" in packed["code"]
+    assert packed["code"].startswith("// File: Inventario.cs")
+    assert MARCA_TRUNCADO.strip() in packed["code"]
+    assert packed["stats"]["files_included"] == 3
+    assert packer.count_tokens(packed["code"]) <= 120
+
+
+def test_pack_descarta_generados(packer):
+    archivos = {"obj/Debug/App.g.cs": "class Generado {}", "Form1.Designer.cs": "class F {}", "Form1.cs": "class F {}"}
+    packed = packer.pack(archivos, "")
+    assert packed["stats"]["files_noise"] == 2
+    assert packed["code"] == "// File: Form1.cs\nclass F {}"
+
+
+@pytest.mark.parametrize("budget", [21, 25, 90, 120, 200])
+def test_pack_cuenta_los_separadores(packer, budget):
+    packer._tokenizer = TokenizerConSaltos()
+    archivos = {
+        "Inventario.cs": "class Inventario {\n" + "int producto;\n" * 200 + "}",
+        "A.cs": "class A {}",
+        "B.cs": "class B {}",
+        "C.cs": "class C {}",
+    }
+    packed = packer.pack(archivos, "inventario producto", budget=budget)
+
+    assert packer.count_tokens(packed["code"]) <= budget
+    assert packed["stats"]["tokens_used"] == packer.count_tokens(packed["code"])
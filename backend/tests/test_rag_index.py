@@ -0,0 +1,179 @@
+import json
+import math
+from collections import Counter
+
+import numpy as np
+
+from app.services.rag_index import BM25Index, KeywordIndex, VectorIndex, hash_archivo, tokenizar_csharp, top_k
+
+from tests.conftest import CODIGOS
+
+
+def test_keyword_index_ordena_por_coincidencias():
+    index = KeywordIndex.build([
+        "clase producto precio",
+        "inventario producto precio stock",
+        "cliente correo",
+    ])
+    assert index.search("inventario producto precio", 5) == [(1, 3), (0, 2)]
+
+
+def test_keyword_index_desempata_por_doc_id():
+    index = KeywordIndex.build(["alfa beta", "beta alfa", "alfa beta gama"])
+    assert [doc_id for doc_id, _ in index.search("alfa beta", 3)] == [0, 1, 2]
+    assert [doc_id for doc_id, _ in index.search("alfa beta", 2)] == [0, 1]
+
+
+def test_keyword_index_sin_coincidencias():
+    index = KeywordIndex.build(CODIGOS)
+    assert index.search("inexistente", 5) == []
+    # Stopwords de C# no puntúan
+    assert index.search("public class void", 5) == []
+
+
+def _bm25_referencia(textos, query, k1=1.2, b=0.75):
+    """BM25 calculado término a término, para comparar con las postings CSR"""
+    docs = [Counter(tokenizar_csharp(t)) for t in textos]
+    n = len(docs)
+    avgdl = max(1.0, sum(sum(d.values()) for d in docs) / n)
+    scores = []
+    for d in docs:
+        dl = sum(d.values())
+        score = 0.0
+        for termino in set(tokenizar_csharp(query)):
+            df = sum(1 for otro in docs if termino in otro)
+            if not df or termino not in d:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            tf = d[termino]
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        scores.append(score)
+    return np.asarray(scores)
+
+
+def test_bm25_coincide_con_la_formula():
+    index = BM25Index.build(CODIGOS)
+    for query in ("AgregarProducto inventario", "Cliente Nombre Correo", "CalcularTotal venta precio"):
+        np.testing.assert_allclose(index.score(query), _bm25_referencia(CODIGOS, query), rtol=1e-5)
+
+
+def test_bm25_ranking():
+    textos = [
+        "class Producto { decimal Precio; }",
+        "class Inventario { void AgregarProducto(Producto producto) { inventario.Add(producto); } }",
+        "class Cliente { string Correo; }",
+    ]
+    index = BM25Index.build(textos)
+    # Más términos de la consulta (y más repetidos) primero; sin términos en común no aparece
+    assert [doc_id for doc_id, _ in index.search("inventario producto", 5)] == [1, 0]
+
+
+def test_bm25_normaliza_por_longitud():
+    textos = ["producto cliente correo venta total factura", "producto"]
+    assert BM25Index.build(textos).search("producto", 2)[0][0] == 1
+
+
+def test_bm25_termino_raro_pesa_mas():
+    textos = ["producto producto", "producto correo", "producto", "producto"]
+    index = BM25Index.build(textos)
+    assert index.search("producto correo", 1)[0][0] == 1
+
+
+def test_bm25_separa_camel_case():
+    assert tokenizar_csharp("btnAgregarProducto_Click") == ["btn", "agregar", "producto", "click"]
+    index = BM25Index.build(CODIGOS)
+    assert index.search("btn click", 1)[0][0] == 4
+
+
+def test_bm25_segmento_con_referencia_equivale_al_indice_completo():
+    base, delta = CODIGOS[:3], CODIGOS[3:]
+    completo = BM25Index.build(CODIGOS)
+    segmento = BM25Index.build(delta, referencia=BM25Index.build(base))
+    for query in ("Cliente Nombre", "AgregarProducto inventario producto"):
+        np.testing.assert_allclose(segmento.score(query), completo.score(query)[len(base):], rtol=1e-5)
+
+
+def test_bm25_vacio_y_top_k():
+    assert BM25Index.build([]).search("producto", 5) == []
+    assert BM25Index.build(["class A {}"]).search("producto", 5) == []
+    assert top_k(np.asarray([0.0, 2.0, 1.0, 0.0], dtype=np.float32), 3) == [(1, 2.0), (2, 1.0)]
+
+
+def _codigos(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(linea)["codigo"] for linea in f if linea.strip()]
+
+
+def test_vector_index_crea_sidecar_memory_mapped(dataset, embedder):
+    index = VectorIndex.load_or_build(dataset, lambda: _codigos(dataset), embedder, "float16")
+    npy_path, meta_path = VectorIndex.paths(dataset)
+
+    assert isinstance(index.matrix, np.memmap)
+    assert index.matrix.dtype == np.float16
+    assert index.num_docs == len(CODIGOS)
+    np.testing.assert_allclose(np.linalg.norm(index.matrix.astype(np.float32), axis=1), 1.0, atol=1e-3)
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    assert meta["dataset_sha256"] == hash_archivo(dataset)
+    assert meta["model"] == embedder.model_name
+    assert meta["count"] == len(CODIGOS)
+
+
+def test_vector_index_reutiliza_o_reconstruye(dataset, embedder):
+    VectorIndex.load_or_build(dataset, lambda: _codigos(dataset), embedder, "float16")
+    llamadas = embedder.model.llamadas
+
+    # Mismo dataset, modelo y dtype: se abre el .npy sin volver a codificar
+    VectorIndex.load_or_build(dataset, lambda: _codigos(dataset), embedder, "float16")
+    assert embedder.model.llamadas == llamadas
+
+    # Otro dtype: se reconstruye
+    index = VectorIndex.load_or_build(dataset, lambda: _codigos(dataset), embedder, "float32")
+    assert embedder.model.llamadas > llamadas
+    assert index.matrix.dtype == np.float32
+
+    # Dataset modificado: se reconstruye con el nuevo contenido
+    llamadas = embedder.model.llamadas
+    with open(dataset, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({"codigo": "public class Factura { decimal Total; }"}) + "\n")
+    index = VectorIndex.load_or_build(dataset, lambda: _codigos(dataset), embedder, "float32")
+    assert embedder.model.llamadas > llamadas
+    assert index.num_docs == len(CODIGOS) + 1
+
+
+def test_vector_index_busqueda_y_candidatos(dataset, embedder):
+    index = VectorIndex.load_or_build(dataset, lambda: _codigos(dataset), embedder, "float16")
+    consulta, _ = embedder.encode(CODIGOS[2])
+    assert index.search(consulta, 1)[0][0] == 2
+
+    completos = index.score(consulta)
+    candidatos = np.asarray([4, 2, 0], dtype=np.int32)
+    np.testing.assert_allclose(index.score(consulta, candidatos), completos[candidatos], rtol=1e-3)
+
+
+def test_vector_index_float16_por_bloques(embedder, monkeypatch):
+    matriz = VectorIndex.embeddings_normalizados(CODIGOS, embedder).astype(np.float32)
+    consulta, _ = embedder.encode(CODIGOS[0])
+    esperado = VectorIndex(matriz).score(consulta)
+
+    monkeypatch.setattr(VectorIndex, "BLOCK_ROWS", 2)
+    np.testing.assert_allclose(VectorIndex(matriz.astype(np.float16)).score(consulta), esperado, atol=2e-3)
+
+
+def test_bm25_solo_puntua_candidatos():
+    index = BM25Index.build(CODIGOS)
+    query = "AgregarProducto inventario producto Cliente Nombre"
+    completos = index.score(query)
+    candidatos = np.asarray([4, 0, 3], dtype=np.int32)
+    np.testing.assert_allclose(index.score(query, candidatos), completos[candidatos], rtol=1e-6)
+
+    # Las postings de documentos fuera de los candidatos nunca se suman
+    fuera = ~np.isin(index.doc_ids, candidatos)
+    index.weights = np.where(fuera, np.nan, index.weights).astype(np.float32)
+    scores = index.score(query, candidatos)
+    assert scores.shape == (3,)
+    assert np.isfinite(scores).all()
+    np.testing.assert_allclose(scores, completos[candidatos], rtol=1e-6)
+
+    assert index.score(query, np.zeros(0, dtype=np.int32)).shape == (0,)
+    assert index.score("inexistente", candidatos).tolist() == [0.0, 0.0, 0.0]
@@ -0,0 +1,34 @@
+import pytest
+
+# Importa el pipeline de evaluación completo (psycopg2, torch, minio...)
+try:
+    from app.services import rag_ingestion
+except ImportError as e:
+    pytest.skip(f"rag_ingestion no importable: {e}", allow_module_level=True)
+
+
+@pytest.fixture(autouse=True)
+def sin_fallidos(monkeypatch):
+    monkeypatch.setattr(rag_ingestion, "_fallidos", {})
+
+
+def test_backoff_tras_un_fallo(monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(rag_ingestion.time, "monotonic", lambda: reloj[0])
+
+    assert rag_ingestion._debe_intentar(7)
+    rag_ingestion._registrar_fallo(7, "zip sin código")
+    assert not rag_ingestion._debe_intentar(7)
+
+    reloj[0] += rag_ingestion.RAG_INGEST_INTERVAL * 2
+    assert rag_ingestion._debe_intentar(7)
+
+
+def test_descarta_tras_max_reintentos(monkeypatch):
+    reloj = [0.0]
+    monkeypatch.setattr(rag_ingestion.time, "monotonic", lambda: reloj[0])
+    for _ in range(rag_ingestion.RAG_INGEST_MAX_RETRIES):
+        rag_ingestion._registrar_fallo(7, "zip sin código")
+    reloj[0] += 10 ** 9
+    assert not rag_ingestion._debe_intentar(7)
+    assert rag_ingestion._debe_intentar(8)
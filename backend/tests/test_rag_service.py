@@ -0,0 +1,142 @@
+import pytest
+
+from app.services.rag_service import RAGService
+
+from tests.conftest import CODIGOS
+
+
+CLASES = ["Factura", "Boleta", "Pedido", "Proveedor", "Almacen", "Empleado", "Reserva", "Matricula"]
+
+
+def _nuevos(desde, cantidad):
+    """Evaluaciones revisadas con grade_id desde..desde+cantidad-1 (una clase distinta cada una)"""
+    return [
+        {"grade_id": g, "codigo": f"public class {CLASES[g - 1]} {{ decimal Total; Cliente cliente; }}",
+         "puntaje_total": 15, "semana": "5"}
+        for g in range(desde, desde + cantidad)
+    ]
+
+
+@pytest.mark.parametrize("retriever", ["keyword", "bm25", "vector"])
+def test_primera_consulta_carga_el_indice(dataset, embedder, retriever):
+    rag = RAGService(dataset, retriever)
+    rag.embedder = embedder
+    assert not rag._loaded
+
+    buscar = {
+        "keyword": rag.buscar_similares_simple,
+        "bm25": rag.buscar_similares_bm25,
+        "vector": rag.buscar_similares_vector,
+    }[retriever]
+    # Consulta válida para todos: la búsqueda por keywords separa solo por espacios
+    consulta = "class Producto { string Nombre; }"
+    primera = buscar(consulta, 2)
+
+    assert rag._loaded
+    assert len(primera) == 2
+    assert primera == buscar(consulta, 2)
+
+
+def test_hibrido_primera_consulta(dataset, embedder):
+    rag = RAGService(dataset, "hybrid")
+    rag.embedder = embedder
+    assert len(rag.buscar_similares_hibrido("Cliente Nombre Correo", 2, semana="Semana 2")) == 2
+
+
+def test_ingesta_sin_indice_cargado_no_lo_carga(dataset):
+    rag = RAGService(dataset, "bm25")
+    rag.sincronizar()
+    assert rag.agregar_ejemplos(_nuevos(1, 2)) == 2
+    # Duplicados por grade_id: se leen del JSONL sin construir índices
+    assert rag.agregar_ejemplos(_nuevos(1, 2)) == 0
+    assert rag.ids_en_corpus() == {1, 2}
+    assert not rag._loaded
+
+    stats = rag.get_stats()
+    assert stats["total"] == len(CODIGOS) + 2
+    assert stats["ingested"] == 2
+
+
+def test_otro_proceso_ve_lo_ingestado(dataset):
+    escritor = RAGService(dataset, "bm25")
+    lector = RAGService(dataset, "bm25")
+    lector.get_stats()
+
+    escritor.agregar_ejemplos(_nuevos(1, 1))
+    lector.sincronizar()
+    assert lector.get_stats()["ingested"] == 1
+    assert lector.buscar_similares_bm25("Factura Total", 1)[0]["grade_id"] == 1
+
+
+def test_compactar_conserva_resultados(dataset):
+    rag = RAGService(dataset, "bm25")
+    rag.get_stats()
+    for desde in (1, 3, 5):
+        rag.agregar_ejemplos(_nuevos(desde, 2))
+    assert rag.get_stats()["segments"] == 4
+
+    def mejor(consulta):
+        return rag.buscar_similares_bm25(consulta, 1)[0]["grade_id"]
+
+    antes = [mejor(CLASES[g - 1]) for g in range(1, 7)]
+    assert rag.compactar(min_segmentos=2)
+
+    assert rag.get_stats()["segments"] == 2
+    assert rag.num_docs == len(CODIGOS) + 6
+    assert rag.ids_ingestados == set(range(1, 7))
+    assert [mejor(CLASES[g - 1]) for g in range(1, 7)] == antes == list(range(1, 7))
+    # Lo ingestado después de compactar sigue llegando como segmento nuevo
+    rag.agregar_ejemplos(_nuevos(7, 1))
+    assert rag.get_stats()["segments"] == 3
+
+
+def test_dataset_inexistente(tmp_path):
+    rag = RAGService(str(tmp_path / "no-existe.jsonl"), "bm25")
+    assert rag.buscar_similares_bm25("Producto", 3) == []
+    assert rag.get_stats() == {"total": 0, "loaded": False}
+
+
+@pytest.mark.parametrize("retriever", ["bm25", "keyword"])
+def test_buscar_similares_fuera_del_event_loop(dataset, retriever, monkeypatch):
+    import asyncio
+    import threading
+
+    rag = RAGService(dataset, retriever)
+    hilos = []
+    original = rag._buscar_en_memoria
+
+    def registrar(codigo, limit):
+        hilos.append(threading.current_thread())
+        return original(codigo, limit)
+
+    monkeypatch.setattr(rag, "_buscar_en_memoria", registrar)
+    resultados = asyncio.run(rag.buscar_similares("class Producto { string Nombre; }", 2))
+
+    assert len(resultados) == 2
+    assert hilos and hilos[0] is not threading.main_thread()
+
+
+def test_hibrido_reintenta_el_vector_tras_un_fallo(dataset, embedder, monkeypatch):
+    from app.services import rag_service
+
+    reloj = [1000.0]
+    monkeypatch.setattr(rag_service.time, "monotonic", lambda: reloj[0])
+    rag = RAGService(dataset, "hybrid")
+    rag.embedder = embedder
+    encode = embedder.encode
+    llamadas = []
+
+    def falla(codigo):
+        llamadas.append(codigo)
+        raise RuntimeError("modelo no disponible")
+
+    monkeypatch.setattr(embedder, "encode", falla)
+    assert len(rag.buscar_similares_hibrido("Cliente Nombre", 2)) == 2
+    # Dentro de la ventana de reintento solo BM25: el encoder no se vuelve a llamar
+    assert len(rag.buscar_similares_hibrido("Cliente Nombre", 2)) == 2
+    assert len(llamadas) == 1
+
+    monkeypatch.setattr(embedder, "encode", lambda codigo: (llamadas.append(codigo), encode(codigo))[1])
+    reloj[0] += rag_service.RAG_VECTOR_RETRY_SECONDS
+    assert len(rag.buscar_similares_hibrido("Cliente Nombre", 2)) == 2
+    assert len(llamadas) == 2
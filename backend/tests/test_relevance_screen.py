@@ -0,0 +1,57 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.services.relevance_screen import RelevanceScreenService
+
+
+class ModeloFijo:
+    """Todas las frases con el mismo embedding: similitud 1.0 (relevante)"""
+
+    def __init__(self):
+        self.falla = False
+
+    def encode(self, textos, **kwargs):
+        if self.falla:
+            raise RuntimeError("CUDA out of memory")
+        return np.ones((len(textos), 4), dtype=np.float32) / 2
+
+
+@pytest.fixture
+def screen():
+    servicio = RelevanceScreenService()
+    servicio.enabled = True
+    servicio.model = ModeloFijo()
+    servicio._initialized = True
+    return servicio
+
+
+def test_error_en_una_llamada_no_desactiva(screen):
+    screen.model.falla = True
+    assert screen.screen("explico la clase producto", "Crear la clase producto con precio") is None
+    assert screen.enabled
+
+    screen.model.falla = False
+    assert screen.screen("explico la clase producto", "Crear la clase producto con precio")["is_relevant"]
+
+
+def test_modelo_que_no_carga_desactiva(screen, monkeypatch):
+    def no_carga():
+        raise OSError("modelo no encontrado")
+
+    monkeypatch.setattr(screen, "initialize", no_carga)
+    assert screen.screen("explico la clase producto", "Crear la clase producto") is None
+    assert not screen.enabled
+
+
+def test_estadisticas_desde_varios_hilos(screen):
+    hilos = [
+        threading.Thread(target=lambda: [screen.screen("hola mundo", "Crear la clase producto") for _ in range(50)])
+        for _ in range(8)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert screen.stats["decided_relevant"] == 400
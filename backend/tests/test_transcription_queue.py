@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, literal
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import func
+
+from app.models.models import TranscriptionJob
+from app.services import transcription_queue
+
+
+class _Ahora(datetime):
+    """now() - intervalo calculado en Python: SQLite no resta intervalos a CURRENT_TIMESTAMP"""
+
+    def __sub__(self, intervalo):
+        return literal(datetime.utcnow() - intervalo)
+
+
+class _FuncSQLite:
+    def __getattr__(self, nombre):
+        return getattr(func, nombre)
+
+    def now(self):
+        return _Ahora.utcnow()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(transcription_queue, "func", _FuncSQLite())
+    engine = create_engine("sqlite://")
+    TranscriptionJob.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _job(db, **campos):
+    job = TranscriptionJob(submission_id=1, video_url="videos/a.mp4", language="es", **campos)
+    db.add(job)
+    db.commit()
+    return job
+
+
+def test_claim_toma_el_pendiente_mas_antiguo(db):
+    primero = _job(db, status="pending")
+    _job(db, status="pending")
+
+    job = transcription_queue.claim(db, "worker-1")
+    assert job.job_id == primero.job_id
+    assert job.status == "running"
+    assert job.worker_id == "worker-1"
+    assert job.attempts == 1
+
+
+def test_claim_reclama_abandonados_con_intentos_disponibles(db):
+    viejo = datetime.utcnow() - timedelta(seconds=transcription_queue.TRANSCRIPTION_STALE_SECONDS + 60)
+    abandonado = _job(db, status="running", attempts=1, heartbeat_at=viejo)
+    _job(db, status="running", attempts=1, heartbeat_at=datetime.utcnow())
+
+    job = transcription_queue.claim(db, "worker-2")
+    assert job.job_id == abandonado.job_id
+    assert job.attempts == 2
+    assert transcription_queue.claim(db, "worker-3") is None
+
+
+def test_claim_marca_fallidos_los_abandonados_sin_intentos(db):
+    viejo = datetime.utcnow() - timedelta(seconds=transcription_queue.TRANSCRIPTION_STALE_SECONDS + 60)
+    agotado = _job(db, status="running", attempts=transcription_queue.TRANSCRIPTION_MAX_ATTEMPTS, heartbeat_at=viejo)
+
+    assert transcription_queue.claim(db, "worker-1") is None
+    db.refresh(agotado)
+    assert agotado.status == "failed"
+    assert agotado.error
+
+
+def test_fail_reintenta_hasta_el_maximo(db):
+    _job(db, status="pending")
+    for intento in range(1, transcription_queue.TRANSCRIPTION_MAX_ATTEMPTS + 1):
+        job = transcription_queue.claim(db, "worker-1")
+        assert job.attempts == intento
+        transcription_queue.fail(db, job, "boom")
+    assert job.status == "failed"
+    assert transcription_queue.claim(db, "worker-1") is None
+
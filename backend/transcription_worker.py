@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Worker de transcripción: consume transcription_jobs, transcribe con Whisper
+y escribe el resultado en Submission.video_transcription. Whisper vive solo
+aquí; la API encola y espera. Se escala con más réplicas:
+
+    docker compose up -d --scale transcription-worker=3
+
+Uso (desde backend/):
+    python transcription_worker.py
+"""
+
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+
+from app.db.session import SessionLocal, engine
+from app.models.models import TranscriptionJob
+from app.services import transcription_queue
+from app.services.whisper_models import WHISPER_ADAPTIVE
+from app.services.whisper_service import whisper_service
+
+HEARTBEAT_SECONDS = 30
+
+detener = threading.Event()
+
+
+def _heartbeat(job_id: int, terminado: threading.Event):
+    """openai-whisper no informa avance: el heartbeat mantiene el trabajo como vivo"""
+    while not terminado.wait(HEARTBEAT_SECONDS):
+        db = SessionLocal()
+        try:
+            transcription_queue.heartbeat(db, job_id)
+        except Exception as e:
+            print(f"⚠️ Heartbeat failed for job {job_id}: {e}")
+        finally:
+            db.close()
+
+
+def procesar(db, job: TranscriptionJob):
+    print(f"🎬 Job {job.job_id}: submission {job.submission_id}, {job.video_url} "
+          f"(attempt {job.attempts}, word timestamps: {job.word_timestamps})")
+    bucket, object_name = job.video_url.split('/', 1)
+    segmentos = 0
+
+    def progress(hecho: float, total: float):
+        nonlocal segmentos
+        segmentos += 1
+        transcription_queue.report_progress(db, job.job_id, segmentos, hecho, total)
+
+    terminado = threading.Event()
+    latido = threading.Thread(target=_heartbeat, args=(job.job_id, terminado), daemon=True)
+    latido.start()
+    inicio = time.perf_counter()
+    try:
+        result = whisper_service.transcribe_minio_object(
+            bucket,
+            object_name,
+            language=job.language or "es",
+            word_timestamps=bool(job.word_timestamps),
+            queue_depth=transcription_queue.queue_depth(db),
+            progress=progress,
+            max_speakers=(
+                transcription_queue.expected_speakers(db, job.submission) if job.word_timestamps else None
+            )
+        )
+    finally:
+        terminado.set()
+
+    transcription_queue.complete(db, job, result)
+    print(f"✅ Job {job.job_id} completed in {time.perf_counter() - inicio:.1f}s "
+          f"({result.get('model')}, cached: {result.get('cached', False)})")
+
+
+def main():
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    print("=" * 60)
+    print(f"🎙️ TRANSCRIPTION WORKER {worker_id}")
+    print("=" * 60)
+
+    TranscriptionJob.__table__.create(bind=engine, checkfirst=True)
+    if not WHISPER_ADAPTIVE:
+        whisper_service.initialize()
+
+    signal.signal(signal.SIGTERM, lambda *_: detener.set())
+    signal.signal(signal.SIGINT, lambda *_: detener.set())
+
+    while not detener.is_set():
+        db = SessionLocal()
+        try:
+            job = transcription_queue.claim(db, worker_id)
+            if job is None:
+                detener.wait(transcription_queue.TRANSCRIPTION_POLL_SECONDS)
+                continue
+            try:
+                procesar(db, job)
+            except Exception as e:
+                db.rollback()
+                print(f"❌ Job {job.job_id} failed: {e}")
+                traceback.print_exc()
+                transcription_queue.fail(db, job, str(e))
+        except Exception as e:
+            print(f"❌ Worker error: {e}")
+            detener.wait(transcription_queue.TRANSCRIPTION_POLL_SECONDS)
+        finally:
+            db.close()
+
+    if whisper_service.parallel is not None:
+        whisper_service.parallel.shutdown()
+    print("👋 Transcription worker stopped")
+
+
+if __name__ == "__main__":
+    main()